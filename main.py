@@ -13,32 +13,372 @@ It contains *no logic*, only orchestration.
 
 """
 main.py - Entry point with CLI
+
+Commands (each imports only the modules its stage needs):
+    python main.py <pdf_url>                         full pipeline (same as `run`)
+    python main.py run --resume <job_id> [--from-stage STAGE] [--deadline SECONDS] [--profile]
+    python main.py extract <pdf_path_or_url> [--task links|text] [--text-out FILE] [--links-out FILE] [--pages-out FILE]
+    python main.py select --links links.json --paper-text paper.txt [--pages pages.json] [--out FILE]
+    python main.py clone <repo_url> [--base-folder DIR]
+    python main.py scan <repo_path> [--out scan_report.json]
+    python main.py generate <repo_path> --scan scan_report.json [--out demo_generated.py] [--stream]
+    python main.py evaluate <repo_path> [--demo FILE] [--scan scan_report.json] [--out evaluation.json] [--in-place]
+    python main.py worker [--queue URL] [--worker-id NAME] [--max-jobs N] [--exit-when-empty]
+    python main.py submit <urls.txt> [--queue URL] [--wait] [--out results.json]
+    python main.py serve [--bind HOST:PORT] [--workers N] [--threads N] [--max-requests N]
+
+Add --timings to print import/startup and run time to stderr.
 """
 
-from pipeline import run_pipeline
+import time
+
+_START = time.perf_counter()
+
+import argparse
+import json
+import os
 import sys
 
+# Only stdlib-light modules at the top; stage modules are imported by their command
+from src.jobs.checkpoints import STAGES
 
-def main():
-    """Main entry point"""
-    
-    if len(sys.argv) < 2:
+COMMANDS = ("run", "extract", "select", "clone", "scan", "generate", "evaluate", "worker", "submit", "workspaces",
+            "serve")
+
+
+# ------------------------------------------------------------
+# Helpers
+# ------------------------------------------------------------
+def _write_json(path: str, data) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, default=lambda o: o.to_checkpoint() if hasattr(o, "to_checkpoint") else str(o))
+    print(f"[CLI] Wrote {path}")
+
+
+def _read_json(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _read_links(path: str):
+    # Accept a JSON list or one URL per line
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    if content.startswith("["):
+        return json.loads(content)
+    return [line.strip() for line in content.splitlines() if line.strip()]
+
+
+# ------------------------------------------------------------
+# Commands
+# ------------------------------------------------------------
+def cmd_run(args) -> int:
+    from pipeline import run_pipeline, resume
+
+    if not args.pdf_url and not args.resume:
         print("Usage: python main.py <pdf_url>")
         print("\nExample:")
         print("  python main.py https://arxiv.org/pdf/2203.14090")
-        sys.exit(1)
-    
-    pdf_url = sys.argv[1]
-    
-    print(f"\nStarting AutoAgent Pipeline")
-    print(f"Paper: {pdf_url}\n")
-    
-    # Run pipeline
-    results = run_pipeline(pdf_url)
-    
+        print("  python main.py --resume <job_id> --from-stage evaluate")
+        return 1
+
+    if args.resume:
+        print(f"\nResuming AutoAgent job {args.resume}\n")
+        results = resume(args.resume, from_stage=args.from_stage, deadline=args.deadline, profile=args.profile)
+    else:
+        print(f"\nStarting AutoAgent Pipeline")
+        print(f"Paper: {args.pdf_url}\n")
+
+        # Run pipeline
+        results = run_pipeline(args.pdf_url, from_stage=args.from_stage, deadline=args.deadline,
+                               profile=args.profile)
+
+    print(f"[PIPELINE] Job id: {results['job_id']}")
+
     # Exit with appropriate code
-    sys.exit(0 if results['status'] == 'success' else 1)
+    return 0 if results['status'] == 'success' else 1
+
+
+def cmd_extract(args) -> int:
+    from src.pdf.pdf_extractor import download_pdf, extract_github_links, extract_text_with_pages, temp_file_scope
+
+    extracted = None if args.pdf_only else _extract_source(args.source)
+    if extracted is None:
+        with temp_file_scope():
+            pdf_path = args.source if os.path.exists(args.source) else download_pdf(args.source)
+            extracted = extract_text_with_pages(pdf_path, task=args.task)
+    text = extracted["text"]
+
+    links = extracted.get("github_links") or extract_github_links(text)
+    if args.text_out:
+        with open(args.text_out, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[CLI] Wrote {args.text_out}")
+    if args.links_out:
+        _write_json(args.links_out, links)
+    if args.pages_out:
+        _write_json(args.pages_out, extracted["page_starts"])
+    print(json.dumps(links, indent=2))
+    return 0 if links else 1
+
+
+def _extract_source(source: str):
+    """LaTeX source of a local e-print archive / .tex file or an arXiv URL; None means use the PDF."""
+    from src.pdf.arxiv_source import SourceUnavailable, arxiv_id_from_url, fetch_arxiv_source, read_local_source
+
+    try:
+        if os.path.exists(source):
+            if source.lower().endswith(".pdf"):
+                return None
+            extracted = read_local_source(source)
+        elif arxiv_id_from_url(source):
+            extracted = fetch_arxiv_source(arxiv_id_from_url(source))
+        else:
+            return None
+    except SourceUnavailable as e:
+        print(f"[CLI] LaTeX source not usable ({e}); reading the PDF.")
+        return None
+    return {**extracted, "page_starts": [0]}
+
+
+def cmd_select(args) -> int:
+    from src.github.github_finder import select_best_repository
+
+    with open(args.paper_text, "r", encoding="utf-8") as f:
+        paper_text = f.read()
+    page_starts = _read_json(args.pages) if args.pages else None
+    best = select_best_repository(_read_links(args.links), paper_text, page_starts)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(best + "\n")
+    print(best)
+    return 0
+
+
+def cmd_clone(args) -> int:
+    from src.github.github_clone import clone_repository
+
+    print(clone_repository(args.repo_url, base_folder=args.base_folder))
+    return 0
+
+
+def cmd_scan(args) -> int:
+    from src.analysis.code_scanner import scan_repository
+
+    report = scan_repository(args.repo_path)
+    out = args.out or os.path.join(args.repo_path, "scan_report.json")
+    _write_json(out, report)
+    return 0
+
+
+def cmd_generate(args) -> int:
+    from src.demo.demo_generator import generate_demo
+
+    on_token = (lambda text: print(text, end="", flush=True)) if args.stream else None
+    demo_code = generate_demo(_read_json(args.scan), args.repo_path, on_token=on_token)
+    if args.stream:
+        print()
+    out = args.out or os.path.join(args.repo_path, "demo_generated.py")
+    with open(out, "w", encoding="utf-8") as f:
+        f.write(demo_code)
+    print(f"[CLI] Wrote {out}")
+    return 0
+
+
+def cmd_evaluate(args) -> int:
+    from src.evaluation.evaluator import run_evaluation_pipeline
+    from src.analysis.scan_report import ScanReport
+
+    demo_path = args.demo or os.path.join(args.repo_path, "demo_generated.py")
+    with open(demo_path, "r", encoding="utf-8") as f:
+        demo_code = f.read()
+    scan_path = args.scan or os.path.join(args.repo_path, "scan_report.json")
+    project_summary = ScanReport.from_dict(_read_json(scan_path)) if os.path.exists(scan_path) else {}
+
+    if args.in_place:
+        evaluation = run_evaluation_pipeline(demo_code, demo_path, args.repo_path, project_summary)
+    else:
+        from src.jobs.snapshots import get_snapshot_pool
+
+        # Run in a throwaway view of the repo, so the demo's outputs don't end up in it
+        snapshots = get_snapshot_pool()
+        with snapshots.checkout(args.repo_path) as snapshot:
+            snapshot_demo = os.path.join(snapshot.path, os.path.basename(demo_path))
+            with open(snapshot_demo, "w", encoding="utf-8") as f:
+                f.write(demo_code)
+            evaluation = run_evaluation_pipeline(demo_code, snapshot_demo, snapshot.path, project_summary)
+        snapshots.discard_all()
+    if args.out:
+        _write_json(args.out, evaluation)
+    return 0
+
+
+def cmd_worker(args) -> int:
+    from src.jobs.worker import run_worker
+
+    run_worker(args.queue, worker_id=args.worker_id, max_jobs=args.max_jobs,
+               exit_when_empty=args.exit_when_empty)
+    return 0
+
+
+def cmd_serve(args) -> int:
+    from src.jobs.serving import serve
+
+    serve(bind=args.bind, workers=args.workers, threads=args.threads, max_requests=args.max_requests)
+    return 0
+
+
+def cmd_submit(args) -> int:
+    from src.jobs.coordinator import Coordinator, JobFailed
+    from src.jobs.job_queue import open_queue
+
+    coordinator = Coordinator(open_queue(args.queue))
+    job_ids = coordinator.submit_many(_read_links(args.urls))
+    if not args.wait:
+        print(json.dumps(job_ids, indent=2))
+        return 0
+
+    results, failed = {}, 0
+    for job_id in job_ids:
+        try:
+            results[job_id] = coordinator.wait(job_id)
+        except JobFailed as e:
+            results[job_id] = {"status": "failed", "errors": [str(e)]}
+        if results[job_id].get("status") != "success":
+            failed += 1
+    if args.out:
+        _write_json(args.out, results)
+    print(f"[CLI] {len(job_ids) - failed}/{len(job_ids)} jobs succeeded.")
+    return 0 if failed == 0 else 1
+
+
+def cmd_workspaces(args) -> int:
+    from src.jobs.workspace import get_workspace_manager
+
+    workspaces = get_workspace_manager()
+    if args.evict:
+        workspaces.enforce_budget()
+    print(json.dumps(workspaces.stats(), indent=2))
+    return 0
+
+
+# ------------------------------------------------------------
+# Argument parsing
+# ------------------------------------------------------------
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="AutoAgent pipeline",
+        epilog="Example:\n  python main.py https://arxiv.org/pdf/2203.14090\n"
+               "  python main.py scan ImportedProjects/optuna --out scan.json",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--timings", action="store_true", help="print startup and run time to stderr")
+    sub = parser.add_subparsers(dest="command")
+
+    p = sub.add_parser("run", help="run (or resume) the full pipeline")
+    p.add_argument("pdf_url", nargs="?", help="URL of the paper PDF")
+    p.add_argument("--resume", metavar="JOB_ID", help="resume a previous job from its checkpoints")
+    p.add_argument("--from-stage", choices=STAGES, help="recompute this stage and everything downstream")
+    p.add_argument("--deadline", type=float, help="time budget for the whole job in seconds (0 = none)")
+    p.add_argument("--profile", action="store_true",
+                   help="profile each stage (CPU, allocations, stacks) into Jobs/<job_id>/profile/")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("extract", help="PDF or arXiv LaTeX source → text → GitHub links")
+    p.add_argument("source", help="local PDF, e-print archive (.tar.gz / .tex) or URL")
+    p.add_argument("--pdf-only", action="store_true", help="don't try the arXiv LaTeX source first")
+    p.add_argument("--task", choices=["links", "text"], default="links", help="engine selection (default: links)")
+    p.add_argument("--text-out", help="write the extracted text here")
+    p.add_argument("--links-out", help="write the links (JSON) here")
+    p.add_argument("--pages-out", help="write the page start offsets (JSON) here, for `select --pages`")
+    p.set_defaults(func=cmd_extract)
+
+    p = sub.add_parser("select", help="pick the paper's main repository")
+    p.add_argument("--links", required=True, help="JSON list or one URL per line")
+    p.add_argument("--paper-text", required=True, help="text file with the paper content")
+    p.add_argument("--pages", help="page start offsets from `extract --pages-out` (optional)")
+    p.add_argument("--out", help="write the selected URL here")
+    p.set_defaults(func=cmd_select)
+
+    p = sub.add_parser("clone", help="clone a repository")
+    p.add_argument("repo_url")
+    p.add_argument("--base-folder", default="ImportedProjects")
+    p.set_defaults(func=cmd_clone)
+
+    p = sub.add_parser("scan", help="scan a local repository")
+    p.add_argument("repo_path")
+    p.add_argument("--out", help="default: <repo_path>/scan_report.json")
+    p.set_defaults(func=cmd_scan)
+
+    p = sub.add_parser("generate", help="generate demo_generated.py for a scanned repository")
+    p.add_argument("repo_path")
+    p.add_argument("--scan", required=True, help="scan report JSON from `scan`")
+    p.add_argument("--out", help="default: <repo_path>/demo_generated.py")
+    p.add_argument("--stream", action="store_true", help="print the demo to stdout while it is generated")
+    p.set_defaults(func=cmd_generate)
+
+    p = sub.add_parser("evaluate", help="execute and score an existing demo")
+    p.add_argument("repo_path")
+    p.add_argument("--demo", help="demo file inside repo_path (default: <repo_path>/demo_generated.py)")
+    p.add_argument("--scan", help="default: <repo_path>/scan_report.json if present")
+    p.add_argument("--out", help="write the evaluation (JSON) here")
+    p.add_argument("--in-place", action="store_true", help="run in repo_path itself instead of a snapshot of it")
+    p.set_defaults(func=cmd_evaluate)
+
+    p = sub.add_parser("worker", help="pull jobs from the shared queue and run them")
+    p.add_argument("--queue", help="queue URL (default: $AUTOAGENT_QUEUE or sqlite:Jobs/queue.sqlite3)")
+    p.add_argument("--worker-id", help="default: <hostname>:<pid>")
+    p.add_argument("--max-jobs", type=int, help="exit after this many jobs")
+    p.add_argument("--exit-when-empty", action="store_true", help="exit once the queue is drained")
+    p.set_defaults(func=cmd_worker)
+
+    p = sub.add_parser("submit", help="batch mode: queue many papers for the workers")
+    p.add_argument("urls", help="JSON list or one paper URL per line")
+    p.add_argument("--queue", help="queue URL (default: $AUTOAGENT_QUEUE or sqlite:Jobs/queue.sqlite3)")
+    p.add_argument("--wait", action="store_true", help="wait for every job and collect the results")
+    p.add_argument("--out", help="with --wait: write {job_id: results} (JSON) here")
+    p.set_defaults(func=cmd_submit)
+
+    p = sub.add_parser("workspaces", help="disk usage of cloned repositories")
+    p.add_argument("--evict", action="store_true", help="evict least-recently-used clones down to the budget")
+    p.set_defaults(func=cmd_workspaces)
+
+    from src.jobs.serving import MAX_REQUESTS, SERVER_BIND, SERVER_THREADS, SERVER_WORKERS
+    p = sub.add_parser("serve", help="production web server: preloaded master, pre-forked workers (gunicorn)")
+    p.add_argument("--bind", default=SERVER_BIND, help="default: $AUTOAGENT_SERVER_BIND or 0.0.0.0:5000")
+    p.add_argument("--workers", type=int, default=SERVER_WORKERS, help="default: CPU count")
+    p.add_argument("--threads", type=int, default=SERVER_THREADS, help="concurrent requests per worker")
+    p.add_argument("--max-requests", type=int, default=MAX_REQUESTS,
+                   help="replace a worker after this many requests, not counting probes and downloads (0 = never)")
+    p.set_defaults(func=cmd_serve)
+
+    return parser
+
+
+def main():
+    """Main entry point"""
+
+    argv = sys.argv[1:]
+    # Backwards compatible: `python main.py <pdf_url>` and `python main.py --resume ...`
+    first = next((a for a in argv if a != "--timings"), None)
+    if first is not None and first not in COMMANDS and first not in ("-h", "--help"):
+        position = argv.index(first)
+        argv = argv[:position] + ["run"] + argv[position:]
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.print_help()
+        sys.exit(1)
+
+    started = time.perf_counter()
+    code = args.func(args)
+
+    if args.timings:
+        print(f"[CLI] startup {started - _START:.3f}s, {args.command} {time.perf_counter() - started:.3f}s",
+              file=sys.stderr)
+    sys.exit(code)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
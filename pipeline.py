@@ -3,7 +3,7 @@
 Central coordinator of the entire processing pipeline.
 
 Pipeline steps:
-1. Download PDF and extract text.
+1. Download PDF and extract text (arXiv papers: stream the LaTeX source instead).
 2. Detect GitHub links inside the text.
 3. Select the most relevant / highest-quality GitHub repo.
 4. Clone the repo locally.
@@ -12,94 +12,410 @@ Pipeline steps:
 7. Execute and evaluate the generated demo (NEW STEP).
 8. Return all results as a structured object.
 
+Each step is checkpointed under Jobs/<job_id>/ so a failed job can be
+resumed with resume(job_id) instead of starting over.
+
+The core is run_pipeline_async(): downloads and LLM calls are async HTTP,
+git / pip / the demo are asyncio subprocesses, and CPU-bound work (PDF
+parsing, scanning, indexing) runs on a thread pool, so one process can
+drive many jobs at once. run_pipeline() is the synchronous wrapper.
+
 This is the core "brain" that links all modules together.
 """
 # Import all the necessary modules
 
+import asyncio
+import json
+import math
 import os
 import sys
-from src.pdf.pdf_extractor import download_pdf, extract_text_local, get_github_links_from_pdf
-from src.github.github_finder import select_best_repository
-from src.github.github_clone import clone_repository
-from src.analysis.code_scanner import scan_repository
-from src.demo.demo_generator import generate_demo
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional, Union
+from src.pdf.pdf_extractor import (
+    extract_github_links, extract_text_with_pages, fetch_pdf_async, temp_file_scope,
+)
+from src.pdf.paper_index import PaperIndex
+from src.pdf.arxiv_source import SourceUnavailable, arxiv_id_from_url, fetch_arxiv_source
+from src.pdf.extraction_engines import TASK_LINKS
+from src.github.github_finder import select_best_repository_async
+from src.github.github_clone import clone_repository_async, extract_repo_name, remote_repo_size
+from src.analysis.code_scanner import scan_repository_async
+from src.analysis.scan_report import ScanReport
+from src.demo.demo_generator import generate_demo_async
 # --- FIX: CORRECTED IMPORT PATH ---
-from src.evaluation.evaluator import run_evaluation_pipeline
+from src.evaluation.evaluator import run_evaluation_pipeline_async
+from src.jobs.async_runtime import close_http_session, run_blocking
+from src.jobs.checkpoints import STAGES, CheckpointStore, new_job_id, stage_index
+from src.jobs.deadline import Deadline, DeadlineExceeded, deadline_scope, job_deadline, set_stage
+from src.llm.health import degradation_scope
+from src.jobs.workspace import get_workspace_manager
+from src.jobs.snapshots import get_snapshot_pool
+from src.jobs.profiling import StageProfiler
+from src.jobs.artifacts import write_artifacts
+
+# Demo text written while it is generated; removed once demo_generated.py is saved
+PARTIAL_DEMO = "demo_generated.partial.py"
 
 class PipelineError(Exception):
     """Custom exception for pipeline errors."""
     pass
 
-def run_pipeline(pdf_url: str) -> dict:
+# =========================================================================
+# Stages
+# -------------------------------------------------------------------------
+# Each stage reads what it needs from `results` / the checkpoint store and
+# returns ONLY the new result entries. The returned dict is the stage's
+# checkpoint, so a resumed job can skip the stage entirely.
+#
+# Stages are coroutines: they await network and subprocess I/O and hand
+# CPU-bound work to run_blocking(), so they never hold the event loop.
+# =========================================================================
+
+def _read_paper(pdf_path: str) -> Dict:
+    # Links and the selection prompt only need rough text, so use the fast engine
+    extracted = extract_text_with_pages(pdf_path, task=TASK_LINKS)
+    extracted["github_links"] = extract_github_links(extracted["text"])
+    return _with_link_locations(extracted)
+
+
+def _with_link_locations(extracted: Dict) -> Dict:
+    # Where each link appears (character offsets + pages) for the selection prompt and the UI
+    extracted["link_locations"] = PaperIndex(extracted["text"], extracted["page_starts"]).link_locations()
+    return extracted
+
+
+def _read_arxiv_source(url: str) -> Optional[Dict]:
+    """Text and links from the paper's LaTeX source, or None to read the PDF instead."""
+    arxiv_id = arxiv_id_from_url(url)
+    if not arxiv_id:
+        return None
+    try:
+        extracted = fetch_arxiv_source(arxiv_id)
+    except SourceUnavailable as e:
+        print(f"[PIPELINE] LaTeX source not usable ({e}); reading the PDF.")
+        return None
+    if not extracted["github_links"]:
+        # Links can hide where the regex can't see them (figures, macros with arguments)
+        print("[PIPELINE] No GitHub links in the LaTeX source; reading the PDF.")
+        return None
+    extracted["page_starts"] = [0]   # the source has no pages
+    return _with_link_locations(extracted)
+
+
+async def _stage_links(results: Dict, store: CheckpointStore) -> Dict:
+    # Step 1: Find GitHub links: arXiv LaTeX source first, else download and parse the PDF
+    print("[PIPELINE] Starting GitHub link extraction...")
+    extracted = await run_blocking(_read_arxiv_source, results["input_url"])
+    if extracted is not None:
+        digest = {"source_sha256": extracted["sha256"]}
+    else:
+        pdf = await fetch_pdf_async(results["input_url"])
+        extracted = await run_blocking(_read_paper, pdf["path"])
+        digest = {"pdf_sha256": pdf["sha256"]}
+    store.save_text("paper_text.txt", extracted["text"])
+    store.save_text("paper_pages.json", json.dumps(extracted["page_starts"]))
+
+    github_links = extracted["github_links"]
+    if not github_links:
+        raise PipelineError("No GitHub links found in the PDF.")
+    print(f"[PIPELINE] Extraction complete. Repositories found:\n    - " + "\n    - ".join(github_links))
+    return {"github_links": github_links, "link_locations": extracted["link_locations"], **digest}
+
+
+async def _stage_select(results: Dict, store: CheckpointStore) -> Dict:
+    # Step 2: Select best repository
+    paper_text = store.load_text("paper_text.txt")
+    pages = store.load_text("paper_pages.json")
+    if paper_text is None:
+        pdf = await fetch_pdf_async(results["input_url"])
+        extracted = await run_blocking(extract_text_with_pages, pdf["path"], TASK_LINKS)
+        paper_text, page_starts = extracted["text"], extracted["page_starts"]
+    else:
+        page_starts = json.loads(pages) if pages else None
+    best_repo_url = await select_best_repository_async(results["github_links"], paper_text, page_starts)
+    print(f"Only one repo: {best_repo_url}")
+    return {"best_repo_url": best_repo_url}
+
+
+async def _stage_clone(results: Dict, store: CheckpointStore) -> Dict:
+    # Step 3: Clone the repository into a budgeted per-job workspace
+    workspaces = get_workspace_manager()
+    repo_url = results["best_repo_url"]
+    # The size is only needed to decide whether the repo fits on tmpfs
+    expected_bytes = await run_blocking(remote_repo_size, repo_url) if workspaces.tmpfs_root else None
+    # Allocation may evict old clones (rmtree), refresh walks the new one: both off the loop
+    target_folder = await run_blocking(workspaces.allocate, results["job_id"], extract_repo_name(repo_url),
+                                       expected_bytes)
+
+    local_repo_path = await clone_repository_async(repo_url, target_folder=target_folder)
+    if not local_repo_path:
+        raise PipelineError("Failed to clone the selected repository.")
+    await run_blocking(workspaces.refresh, local_repo_path)
+    print(f"Successfully cloned to {os.path.basename(local_repo_path)}")
+    return {"local_repo_path": local_repo_path}
+
+
+async def _stage_scan(results: Dict, store: CheckpointStore) -> Dict:
+    # Step 4: Scan the repository: the file walk and heuristics run on the CPU pool,
+    # the detectors' LLM refinements are awaited here, so they never hold a pool thread
+    print("[PIPELINE] Starting repository scanning...")
+    scan_report = await scan_repository_async(results["local_repo_path"])
+    print("Scanning complete.")
+    return {"scan_report": scan_report}
+
+
+async def _stage_generate(results: Dict, store: CheckpointStore) -> Dict:
+    # Step 5: Generate demo script, streamed into the job folder so it can be followed with tail -f
+    partial_path = store.save_text(PARTIAL_DEMO, "")
+    with open(partial_path, "a", encoding="utf-8") as partial:
+        def on_token(text: str) -> None:
+            partial.write(text)
+            partial.flush()
+
+        demo_code = await generate_demo_async(results["scan_report"], results["local_repo_path"], on_token=on_token)
+    os.remove(partial_path)
+
+    # Step 6: Save the demo in the job folder; the clone stays untouched until evaluation copies it
+    demo_file_path = store.save_text("demo_generated.py", demo_code)
+    print(f"[PIPELINE] Demo script saved to {os.path.basename(demo_file_path)}")
+    return {"demo_code": demo_code, "demo_file_path": demo_file_path}
+
+
+async def _stage_evaluate(results: Dict, store: CheckpointStore) -> Dict:
+    # --- Step 7: EXECUTE AND EVALUATE (10 Points) ---
+    print("\n[PIPELINE] Starting demo execution and evaluation (Total 10 Points)...")
+    # The demo runs in a disposable snapshot of the clone: its outputs, caches and downloads
+    # never reach the clone, so reruns and other candidates start from a pristine checkout
+    snapshots = get_snapshot_pool()
+    snapshot = await run_blocking(snapshots.acquire, results["local_repo_path"])
+    try:
+        demo_file_path = _write_demo_file(snapshot.path, results["demo_code"])
+        # NOTE: scan_report (project_summary) is now passed to the evaluation pipeline
+        evaluation_data = await run_evaluation_pipeline_async(
+            results["demo_code"], demo_file_path, snapshot.path, results["scan_report"]
+        )
+    finally:
+        reset = await run_blocking(snapshots.release, snapshot)
+        if reset.get("mutated_shared"):
+            # The demo rewrote hard-linked files of the clone: a resumed or re-scored job must clone again
+            store.invalidate_from("clone")
+    evaluation_data["workspace_snapshot"] = {**snapshot.report(), **reset}
+    fixed_code = (evaluation_data["execution_results"].get("fixups") or {}).get("demo_code")
+    if fixed_code is not None:
+        store.save_text("demo_fixed.py", fixed_code)
+    print(f"[PIPELINE] Dependency install: {evaluation_data['dependency_install']['install_time']}s "
+          f"({evaluation_data['dependency_install']['status']}), demo run: {evaluation_data['execution_results']['run_time']}s")
+    print(f"[PIPELINE] Automated Score: {evaluation_data['evaluation_results']['total_automated_score']} / 5")
+    print(f"[PIPELINE] TOTAL SCORE: {evaluation_data['evaluation_results']['total_score']} / 10")
+    return {"evaluation": evaluation_data}
+
+
+STAGE_FUNCTIONS = {
+    "links": _stage_links,
+    "select": _stage_select,
+    "clone": _stage_clone,
+    "scan": _stage_scan,
+    "generate": _stage_generate,
+    "evaluate": _stage_evaluate,
+}
+
+
+def _write_demo_file(local_repo_path: str, demo_code: str) -> str:
+    demo_file_path = os.path.join(local_repo_path, "demo_generated.py")
+    with open(demo_file_path, "w", encoding="utf-8") as f:
+        f.write(demo_code)
+    return demo_file_path
+
+
+def _checkpoint_usable(stage: str, checkpoint: Optional[Dict]) -> bool:
+    """
+    A checkpoint is only reused if the files it points to still exist.
+    Typed results are rebuilt from their JSON form here.
+    """
+    if checkpoint is None:
+        return False
+    if stage == "clone":
+        return os.path.isdir(checkpoint.get("local_repo_path") or "")
+    if stage == "scan":
+        checkpoint["scan_report"] = ScanReport.from_dict(checkpoint["scan_report"])
+        return True
+    if stage == "generate":
+        demo_file_path = checkpoint.get("demo_file_path") or ""
+        if os.path.isdir(os.path.dirname(demo_file_path)) and not os.path.exists(demo_file_path):
+            _write_demo_file(os.path.dirname(demo_file_path), checkpoint["demo_code"])
+        return os.path.exists(demo_file_path)
+    return True
+
+@contextmanager
+def _interrupt_on_deadline(deadline: Deadline):
+    """
+    Cancel the job's task the moment its deadline passes (or cancel() is
+    called), so a pending await doesn't sit out its own timeout first.
+    The cancellation surfaces as DeadlineExceeded.
+    """
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    hook = deadline.add_cancel_hook(lambda: loop.call_soon_threadsafe(task.cancel))
+    remaining = deadline.remaining()
+    timer = loop.call_later(remaining, task.cancel) if remaining != math.inf else None
+    try:
+        yield
+    except asyncio.CancelledError:
+        if not deadline.expired():
+            raise   # cancelled by whoever awaits the job
+        if hasattr(task, "uncancel"):   # Python 3.11+: let the job's cleanup await normally
+            task.uncancel()
+        raise DeadlineExceeded(deadline.stage, deadline.cancelled) from None
+    finally:
+        deadline.remove_cancel_hook(hook)
+        if timer is not None:
+            timer.cancel()
+
+# =========================================================================
+# Entry points
+# =========================================================================
+
+def run_pipeline(pdf_url: str, job_id: Optional[str] = None, from_stage: Optional[str] = None,
+                 deadline: Union[float, Deadline, None] = None, profile: bool = False) -> dict:
+    """
+    Synchronous wrapper around run_pipeline_async() (CLI, Flask, workers).
+
+    Runs the job on its own event loop, so it must not be called from a
+    coroutine; await run_pipeline_async() there instead.
+    """
+    return asyncio.run(_run_standalone(pdf_url, job_id=job_id, from_stage=from_stage,
+                                       deadline=deadline, profile=profile))
+
+
+async def _run_standalone(pdf_url: str, **kwargs) -> dict:
+    try:
+        return await run_pipeline_async(pdf_url, **kwargs)
+    finally:
+        await close_http_session()
+
+
+async def run_pipeline_async(pdf_url: str, job_id: Optional[str] = None, from_stage: Optional[str] = None,
+                             deadline: Union[float, Deadline, None] = None, profile: bool = False) -> dict:
     """
     Runs the full processing pipeline on the given PDF URL.
 
+    Every stage is checkpointed under Jobs/<job_id>/. Stages that already
+    have a usable checkpoint are loaded instead of recomputed, unless they
+    are at or after `from_stage`.
+
+    `deadline` is the job's time budget in seconds (default:
+    $AUTOAGENT_JOB_DEADLINE or 30 minutes) or a Deadline the caller can
+    cancel(). Every LLM call, download, git and demo subprocess gets only
+    the time that is left.
+
+    With `profile`, every recomputed stage is profiled (cProfile,
+    tracemalloc, stack samples) into Jobs/<job_id>/profile/.
+
+    Many jobs can run concurrently on one event loop:
+        results = await asyncio.gather(*(run_pipeline_async(url) for url in urls))
+
     Returns:
         A dictionary with all results from each step.
     """
 
-    results = {"input_url": pdf_url, "status": "In Progress", "errors": [], "evaluation": {}}
+    job_id = job_id or new_job_id()
+    store = CheckpointStore(job_id)
+    store.save_meta({"job_id": job_id, "input_url": pdf_url})
+
+    results = {"job_id": job_id, "input_url": pdf_url, "status": "In Progress", "errors": [], "evaluation": {}}
+
+    if from_stage:
+        store.invalidate_from(from_stage)
+
+    if not isinstance(deadline, Deadline):
+        deadline = job_deadline(deadline)
 
+    profiler = StageProfiler(store.path) if profile else None
+
+    current_stage = None
+    skipped_llm_calls = []
     try:
-        # Step 1: Download PDF, extract text, and find GitHub links
-        print("[PIPELINE] Starting GitHub link extraction from PDF...")
-        github_links = get_github_links_from_pdf(pdf_url)
-        results['github_links'] = github_links
-
-        if not github_links:
-            raise PipelineError("No GitHub links found in the PDF.")
-        print(f"[PIPELINE] Extraction complete. Repositories found:\n    - " + "\n    - ".join(github_links))
-
-        # Step 2: Select best repository
-        paper_text = extract_text_local(download_pdf(pdf_url))
-        best_repo_url = select_best_repository(github_links, paper_text)
-        results['best_repo_url'] = best_repo_url
-        print(f"Only one repo: {best_repo_url}")
-
-        # Step 3: Clone the repository
-        local_repo_path = clone_repository(best_repo_url)
-        results['local_repo_path'] = local_repo_path
-        if not local_repo_path:
-            raise PipelineError("Failed to clone the selected repository.")
-        print(f"Successfully cloned to {os.path.basename(local_repo_path)}")
-        
-        # Step 4: Scan the repository
-        print("[PIPELINE] Starting repository scanning...")
-        scan_report = scan_repository(local_repo_path)
-        results['scan_report'] = scan_report
-        print("Scanning complete.")
-
-        # Step 5: Generate demo script
-        demo_code = generate_demo(scan_report, local_repo_path)
-        results['demo_code'] = demo_code
-
-        # Step 6: Create a python script file with the demo code on the local repo path
-        demo_file_path = os.path.join(local_repo_path, "demo_generated.py")
-        with open(demo_file_path, "w", encoding="utf-8") as f:
-            f.write(demo_code)
-        results['demo_file_path'] = demo_file_path
-        print(f"[PIPELINE] Demo script saved to {os.path.basename(demo_file_path)}")
-        
-        # --- Step 7: EXECUTE AND EVALUATE (10 Points) ---
-        print("\n[PIPELINE] Starting demo execution and evaluation (Total 10 Points)...")
-        # NOTE: scan_report (project_summary) is now passed to the evaluation pipeline
-        evaluation_data = run_evaluation_pipeline(demo_code, demo_file_path, local_repo_path, scan_report)
-        results["evaluation"] = evaluation_data
-        print(f"[PIPELINE] Automated Score: {evaluation_data['evaluation_results']['total_automated_score']} / 5 (Binary Points)")
-        print(f"[PIPELINE] TOTAL SCORE: {evaluation_data['evaluation_results']['total_score']} / 10")
-        
+        # Downloaded PDFs only live as long as the job, in its scratch folder;
+        # the job's workspaces can't be evicted while it runs
+        workspaces = get_workspace_manager()
+        with workspaces.pinned(job_id), workspaces.scratch(job_id) as scratch, \
+                temp_file_scope(scratch), deadline_scope(deadline), _interrupt_on_deadline(deadline):
+            # Once one stage is recomputed, everything downstream is recomputed too
+            recompute = False
+            for current_stage in STAGES:
+                set_stage(current_stage)
+                deadline.check()
+                checkpoint = None if recompute else store.load(current_stage)
+                if _checkpoint_usable(current_stage, checkpoint):
+                    print(f"[PIPELINE] Stage '{current_stage}' loaded from checkpoint.")
+                else:
+                    recompute = True
+                    # Optional LLM calls skipped while the provider is degraded
+                    with degradation_scope() as skipped, \
+                            (profiler.stage(current_stage) if profiler else nullcontext()):
+                        checkpoint = await STAGE_FUNCTIONS[current_stage](results, store)
+                    if skipped:
+                        checkpoint["skipped_llm_calls"] = skipped
+                    store.save(current_stage, checkpoint)
+                skipped_llm_calls.extend(checkpoint.pop("skipped_llm_calls", []))
+                results.update(checkpoint)
+
         results['status'] = 'success'
 
+    except DeadlineExceeded as e:
+        # Checkpoints of the finished stages are kept, so the job can be resumed with more time
+        results['status'] = 'failed'
+        results['failed_stage'] = current_stage
+        results['deadline_exceeded'] = True
+        results['errors'].append(str(e))
+        print(f"\nPipeline Error: {e}")
+
     except PipelineError as e:
         results['status'] = 'failed'
+        results['failed_stage'] = current_stage
         results['errors'].append(str(e))
         print(f"\nPipeline Error: {e}")
         
     except Exception as e:
         results['status'] = 'failed'
+        results['failed_stage'] = current_stage
         results['errors'].append(f"Unexpected error: {str(e)}")
         print(f"\nUnexpected Error: {e}")
         import traceback
         traceback.print_exc()
 
-    return results
\ No newline at end of file
+    # Heuristic-only results: re-enrich later with resume(job_id, from_stage="scan")
+    results['degraded'] = bool(skipped_llm_calls)
+    results['skipped_llm_calls'] = skipped_llm_calls
+    if skipped_llm_calls:
+        print(f"[PIPELINE] Degraded result; skipped LLM calls: {', '.join(skipped_llm_calls)}")
+
+    if results['status'] == 'failed':
+        print(f"[PIPELINE] Job {job_id} can be resumed from stage '{current_stage}'.")
+    store.save_results(results)
+    # Bulky outputs as separate files, so the API can answer with a summary + URLs
+    try:
+        await run_blocking(write_artifacts, results, store)
+    except OSError as e:
+        print(f"[PIPELINE] Could not write artifacts for job {job_id}: {e}")
+
+    return results
+
+
+def resume(job_id: str, from_stage: Optional[str] = None, deadline: Optional[float] = None,
+           profile: bool = False) -> dict:
+    """
+    Resume a previous job from its first incomplete stage.
+
+    If `from_stage` is given, that stage and everything downstream are
+    recomputed even if checkpoints exist (e.g. re-scoring after the
+    judge prompt changed).
+    """
+    store = CheckpointStore(job_id)
+    meta = store.load_meta()
+    if from_stage:
+        stage_index(from_stage)
+    else:
+        print(f"[PIPELINE] Resuming job {job_id} from stage '{store.first_incomplete() or 'done'}'.")
+    return run_pipeline(meta["input_url"], job_id=job_id, from_stage=from_stage, deadline=deadline,
+                        profile=profile)
@@ -1,4 +1,6 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, send_file
+from flask.json.provider import DefaultJSONProvider
+import math
 import os
 import sys
 
@@ -6,8 +8,57 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from pipeline import run_pipeline
+from src.jobs.single_flight import SingleFlight, url_key
+from src.jobs.coordinator import Coordinator
+from src.llm.health import llm_health
+from src.jobs.workspace import get_workspace_manager
+from src.jobs.artifacts import artifact_path, content_type, ensure_artifacts, summarize
+from src.jobs.serving import server_state
+from src.jobs.snapshots import get_snapshot_pool
+
+class PipelineJSONProvider(DefaultJSONProvider):
+    """Serializes typed pipeline results (e.g. ScanReport) only when responding."""
+
+    @staticmethod
+    def default(o):
+        if hasattr(o, "to_dict"):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
 
 app = Flask(__name__)
+app.json = PipelineJSONProvider(app)
+
+# Identical submissions that arrive while a run is in flight share its result
+inflight_runs = SingleFlight()
+
+# Distributed mode: with AUTOAGENT_QUEUE set, runs go to `python main.py worker` nodes
+coordinator = Coordinator() if os.getenv("AUTOAGENT_QUEUE") else None
+
+def execute_run(pdf_url, deadline=None, profile=False):
+    if coordinator is not None:
+        return coordinator.run(pdf_url, deadline=deadline, profile=profile)
+    return run_pipeline(pdf_url, deadline=deadline, profile=profile)
+
+def lean(results):
+    # Compact body + artifact URLs; queued jobs ran elsewhere, so their artifacts are
+    # stored here the first time the finished job is seen, then only looked up
+    sizes = ensure_artifacts(results) if coordinator is not None else None
+    return summarize(results, sizes)
+
+def parse_deadline(data):
+    # Optional per-request time budget in seconds: a positive number, else ValueError
+    value = data.get('deadline')
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError("deadline must be a positive number of seconds")
+    try:
+        deadline = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("deadline must be a positive number of seconds")
+    if not math.isfinite(deadline) or deadline <= 0:
+        raise ValueError("deadline must be a positive number of seconds")
+    return deadline
 
 @app.route('/')
 def index():
@@ -20,13 +71,98 @@ def run_analysis():
     
     if not pdf_url:
         return jsonify({"status": "error", "message": "No URL provided"}), 400
+    try:
+        deadline = parse_deadline(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     
     try:
-        # Run the pipeline
-        results = run_pipeline(pdf_url)
-        return jsonify(results)
+        # Run the pipeline (or attach to an identical in-flight run)
+        # Optional per-request time budget in seconds ("deadline": 600)
+        # and stage profiling ("profile": true) into Jobs/<job_id>/profile/
+        profile = bool(data.get('profile'))
+        # A profiled request must run itself rather than attach to an unprofiled run, and
+        # one with its own deadline only shares runs started with the same deadline
+        key = url_key(pdf_url, deadline) + ("#profile" if profile else "")
+        with server_state.job():
+            results = inflight_runs.do(key, execute_run, pdf_url, deadline, profile)
+        # "full": true returns the complete results dict (demo code, logs, scan report inline)
+        return jsonify(results if data.get('full') else lean(results))
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    # Queue-only submission: returns at once, poll /api/jobs/<job_id> for the outcome
+    if coordinator is None:
+        return jsonify({"status": "error", "message": "Job queue not configured (set AUTOAGENT_QUEUE)"}), 400
+    data = request.get_json() or {}
+    pdf_url = data.get('url')
+    if not pdf_url:
+        return jsonify({"status": "error", "message": "No URL provided"}), 400
+    try:
+        deadline = parse_deadline(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    job_id = coordinator.submit(pdf_url, deadline=deadline, profile=bool(data.get('profile')))
+    return jsonify({"job_id": job_id}), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    if coordinator is None:
+        return jsonify({"status": "error", "message": "Job queue not configured (set AUTOAGENT_QUEUE)"}), 400
+    status = coordinator.status(job_id)
+    if status is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    if status["status"] == "done":
+        results = coordinator.queue.get(job_id)["result"]
+        status["results"] = results if request.args.get('full') else lean(results)
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>/artifacts/<name>', methods=['GET'])
+def job_artifact(job_id, name):
+    # Large outputs (demo code, logs, scan report) are fetched on demand
+    path = artifact_path(job_id, name)
+    if path is None and coordinator is not None:
+        job = coordinator.queue.get(job_id)
+        if job is not None and job.get("result"):
+            ensure_artifacts(job["result"])
+            path = artifact_path(job_id, name)
+    if path is None:
+        return jsonify({"status": "error", "message": "Unknown artifact"}), 404
+
+    # Stored gzip copy when the client takes it; Range requests get the identity bytes
+    accepts_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    if accepts_gzip and "Range" not in request.headers and os.path.exists(path + ".gz"):
+        response = send_file(path + ".gz", mimetype=content_type(name), conditional=True)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = send_file(path, mimetype=content_type(name), conditional=True)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"   # rewritten when a job is resumed; revalidate via ETag
+    return response
+
+@app.route('/healthz', methods=['GET'])
+def liveness():
+    # The process is up and answering; says nothing about dependencies
+    return jsonify(server_state.liveness())
+
+@app.route('/readyz', methods=['GET'])
+def readiness():
+    # 503 while this worker drains (shutdown, max-requests recycling)
+    ready, body = server_state.readiness()
+    return jsonify(body), 200 if ready else 503
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    # Counters are per worker process under `python main.py serve`
+    data = {"single_flight": inflight_runs.stats(), "llm_health": llm_health.stats(),
+            "workspaces": get_workspace_manager().stats(), "snapshots": get_snapshot_pool().stats(),
+            "server": server_state.liveness()}
+    if coordinator is not None:
+        data["queue"] = coordinator.stats()
+    return jsonify(data)
+
 if __name__ == '__main__':
+    # Development server; production: python main.py serve
     app.run(host='0.0.0.0', debug=True, port=5000)
@@ -1,35 +1,38 @@
-import requests
+import asyncio
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 import json
 
-def _call_openai(prompt: str) -> str:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise Exception("OPENAI_API_KEY is not set in the environment variables.")
+from src.llm.client import call_llm, call_llm_async
+from src.analysis.scan_report import PathTrie, ScanReport
+from src.jobs.async_runtime import run_blocking
 
-    url = "https://api.openai.com/v1/chat/completions"
+def _call_openai(prompt: str, call_site: str = "scanner") -> str:
+    return call_llm(prompt, call_site=call_site)
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
 
-    payload = {
-        "model": "gpt-4o-mini",   # or any: gpt-4o, gpt-4.1, o1-mini, etc.
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0,
-        "max_tokens": 512
-    }
+def _json_list(resp: str) -> Optional[list]:
+    arr = json.loads(resp)
+    return arr if isinstance(arr, list) else None
+
+
+def _ask(prompt: str, call_site: str) -> Optional[list]:
+    """LLM refinement as a JSON list, or None if the call or the parsing failed."""
+    try:
+        return _json_list(_call_openai(prompt, call_site=call_site))
+    except Exception:
+        return None
 
-    response = requests.post(url, headers=headers, json=payload)
 
-    if response.status_code != 200:
-        raise Exception(f"OpenAI API error {response.status_code}: {response.text}")
+async def _no_answer() -> Optional[list]:
+    return None   # the heuristics were enough; nothing to ask
 
-    return response.json()["choices"][0]["message"]["content"]
+
+async def _ask_async(prompt: str, call_site: str) -> Optional[list]:
+    try:
+        return _json_list(await call_llm_async(prompt, call_site=call_site))
+    except Exception:
+        return None
 
 # ------------------------------------------------------------
 # 1. Detect languages
@@ -60,31 +63,33 @@ def detect_languages(files: List[str]) -> List[str]:
 # ------------------------------------------------------------
 # 2. Detect model files
 # ------------------------------------------------------------
+def _model_candidates(files: List[str]) -> List[str]:
+    model_keywords = ["model", "weights", "checkpoint", "ckpt", "pkl", "onnx", "h5"]
+    return [f for f in files if any(k in f.lower() for k in model_keywords)]
+
+
+def _models_prompt(files: List[str]) -> str:
+    return (
+        "Given this list of files, which ones look like AI/ML model files?\n\n"
+        + "\n".join(files)
+        + "\n\nReturn ONLY a JSON array of filenames."
+    )
+
+
+def _merge_models(detected: List[str], ai_list: Optional[list]) -> List[str]:
+    # The LLM guess only replaces an empty heuristic result
+    return ai_list if not detected and ai_list is not None else detected
+
+
 def detect_models(files: List[str]) -> List[str]:
     """
     Detect model-related files using simple keyword heuristics + optional LLM refinement.
     """
-    model_keywords = ["model", "weights", "checkpoint", "ckpt", "pkl", "onnx", "h5"]
-
-    detected = [f for f in files if any(k in f.lower() for k in model_keywords)]
+    detected = _model_candidates(files)
 
     # If nothing found, use LLM guessing
     if not detected:
-        try:
-            prompt = (
-                "Given this list of files, which ones look like AI/ML model files?\n\n"
-                + "\n".join(files)
-                + "\n\nReturn ONLY a JSON array of filenames."
-            )
-            ai_resp = _call_openai(prompt)
-            # Attempt to parse JSON
-            
-            arr = json.loads(ai_resp)
-            if isinstance(arr, list):
-                detected = arr
-        except:
-            pass
-
+        return _merge_models(detected, _ask(_models_prompt(files), "scanner.models"))
     return detected
 
 
@@ -92,6 +97,25 @@ def detect_models(files: List[str]) -> List[str]:
 # ------------------------------------------------------------
 # 3. Detect config files
 # ------------------------------------------------------------
+def _config_candidates(files: List[str]) -> List[str]:
+    config_ext = (".yml", ".yaml", ".json", ".cfg", ".ini")
+    return [f for f in files if f.endswith(config_ext)]
+
+
+def _configs_prompt(files: List[str]) -> str:
+    return (
+        "Given this list of files, which ones are configuration files?\n\n"
+        + "\n".join(files)
+        + "\n\nReturn JSON array only."
+    )
+
+
+def _merge_configs(heuristics_found: List[str], ai_list: Optional[list]) -> List[str]:
+    if heuristics_found:
+        return heuristics_found
+    return ai_list if ai_list is not None else []
+
+
 def detect_configs(files: List[str]) -> List[str]:
     """
     Detect configuration files:
@@ -100,43 +124,20 @@ def detect_configs(files: List[str]) -> List[str]:
     - .cfg
     - .ini
     """
-
-    config_ext = (".yml", ".yaml", ".json", ".cfg", ".ini")
-
-    heuristics_found = [f for f in files if f.endswith(config_ext)]
+    heuristics_found = _config_candidates(files)
 
     if heuristics_found:
         return heuristics_found
 
     # LLM fallback
-    try:
-        prompt = (
-            "Given this list of files, which ones are configuration files?\n\n"
-            + "\n".join(files)
-            + "\n\nReturn JSON array only."
-        )
-        resp = _call_openai(prompt)
-        
-        arr = json.loads(resp)
-        if isinstance(arr, list):
-            return arr
-    except:
-        pass
-
-    return []
+    return _merge_configs(heuristics_found, _ask(_configs_prompt(files), "scanner.configs"))
 
 
 
 # ------------------------------------------------------------
 # 4. Detect entrypoints
 # ------------------------------------------------------------
-def detect_entrypoints(repo_path: str, files: List[str]) -> List[str]:
-    """
-    Detect executable entrypoints:
-    - main.py
-    - run.py
-    - "__main__" inside Python files
-    """
+def _entrypoint_candidates(repo_path: str, files: List[str]) -> List[str]:
     entrypoints = []
 
     # Heuristic 1: filename pattern
@@ -153,109 +154,160 @@ def detect_entrypoints(repo_path: str, files: List[str]) -> List[str]:
                 with open(abs_path, "r", encoding="utf-8", errors="ignore") as file:
                     if "__main__" in file.read():
                         entrypoints.append(f)
-            except:
+            except Exception:
                 pass
 
     # Remove duplicates
-    entrypoints = sorted(list(set(entrypoints)))
+    return sorted(list(set(entrypoints)))
 
-    # AI refinement
+
+def _entrypoints_prompt(files: List[str]) -> str:
+    return (
+        "Given this project file list, which files are executable entrypoints?\n\n"
+        + "\n".join(files)
+        + "\n\nReturn JSON array only."
+    )
+
+
+def _merge_list(found: List[str], ai_list: Optional[list]) -> List[str]:
+    # AI refinement adds to the heuristics; duplicates removed
     try:
-        prompt = (
-            "Given this project file list, which files are executable entrypoints?\n\n"
-            + "\n".join(files)
-            + "\n\nReturn JSON array only."
-        )
-        ai_resp = _call_openai(prompt)
-        
-        arr = json.loads(ai_resp)
-        if isinstance(arr, list):
-            # merge results
-            for f in arr:
-                entrypoints.append(f)
-        entrypoints = sorted(list(set(entrypoints)))
-    except:
-        pass
-
-    return entrypoints
+        return sorted(list(set(found) | set(ai_list or [])))
+    except TypeError:   # unhashable or unorderable items in the LLM answer
+        return sorted(list(set(found)))
+
+
+def detect_entrypoints(repo_path: str, files: List[str]) -> List[str]:
+    """
+    Detect executable entrypoints:
+    - main.py
+    - run.py
+    - "__main__" inside Python files
+    """
+    entrypoints = _entrypoint_candidates(repo_path, files)
+
+    # AI refinement
+    return _merge_list(entrypoints, _ask(_entrypoints_prompt(files), "scanner.entrypoints"))
 
 
 
 # ------------------------------------------------------------
 # 5. Detect demo/tutorial/example files
 # ------------------------------------------------------------
+def _demo_candidates(files: List[str]) -> List[str]:
+    demo_keywords = ["demo", "example", "examples", "tutorial", "usage"]
+    return [f for f in files if any(k in f.lower() for k in demo_keywords)]
+
+
+def _demos_prompt(files: List[str]) -> str:
+    return (
+        "Which files appear to be demo/example/tutorial files?\n\nFiles:\n"
+        + "\n".join(files)
+        + "\n\nReturn JSON array only."
+    )
+
+
 def detect_demo_files(files: List[str]) -> List[str]:
     """
     Detect demo/example/tutorial files:
     Heuristics + optional AI refinement.
     """
-    demo_keywords = ["demo", "example", "examples", "tutorial", "usage"]
-
-    detected = [f for f in files if any(k in f.lower() for k in demo_keywords)]
+    detected = _demo_candidates(files)
 
     # AI refinement
-    try:
-        prompt = (
-            "Which files appear to be demo/example/tutorial files?\n\nFiles:\n"
-            + "\n".join(files)
-            + "\n\nReturn JSON array only."
-        )
-        ai_resp = _call_openai(prompt)
-        
-        arr = json.loads(ai_resp)
-        if isinstance(arr, list):
-            detected.extend(arr)
-    except:
-        pass
-
-    # Remove duplicates
-    return sorted(list(set(detected)))
+    return _merge_list(detected, _ask(_demos_prompt(files), "scanner.demos"))
 
 
 
 # ------------------------------------------------------------
 # 6. Summarize for LLM
 # ------------------------------------------------------------
-def summarize_for_llm(repo_path: str, files: List[str]) -> str:
+def build_scan_report(repo_path: str, files: List[str]) -> ScanReport:
     """
-    Build a structured summary of the repo for the LLM.
+    Run every detector and keep the results in a compact ScanReport.
     """
     languages = detect_languages(files)
     configs = detect_configs(files)
     demos = detect_demo_files(files)
     models = detect_models(files)
     entrypoints = detect_entrypoints(repo_path, files)
+    return _assemble_report(files, languages, configs, models, demos, entrypoints)
 
-    folders = sorted({os.path.dirname(f) for f in files})
 
-    summary = {
-        "num_files": len(files),
-        "languages": languages,
-        "folders": folders,
-        "configs": configs,
-        "models": models,
-        "demos": demos,
-        "entrypoints": entrypoints,
-    }
+def _assemble_report(files: List[str], languages: List[str], configs: List[str], models: List[str],
+                     demos: List[str], entrypoints: List[str]) -> ScanReport:
+    tree = PathTrie()
+    for f in files:
+        tree.insert(f)
 
-    return json.dumps(summary, indent=4)
+    return ScanReport(
+        tree,
+        languages=languages,
+        configs=configs,
+        models=models,
+        demos=demos,
+        entrypoints=entrypoints,
+    )
+
+
+def summarize_for_llm(repo_path: str, files: List[str]) -> str:
+    """
+    Build a structured summary of the repo for the LLM.
+    """
+    return build_scan_report(repo_path, files).to_json(indent=4)
 
 
 
 # ------------------------------------------------------------
 # 7. Scan repository (main function)
 # ------------------------------------------------------------
-def scan_repository(repo_path: str) -> Dict:
-    """
-    Walk through repo and return a dictionary of detected components.
-    """
+def _list_files(repo_path: str) -> List[str]:
     all_files = []
     for root, dirs, files in os.walk(repo_path):
         for f in files:
             rel = os.path.relpath(os.path.join(root, f), repo_path)
             all_files.append(rel.replace("\\", "/"))
+    return all_files
+
+
+def scan_repository(repo_path: str) -> ScanReport:
+    """
+    Walk through repo and return a ScanReport of detected components.
+    (report.to_dict() gives the plain dictionary form.)
+    """
+    return build_scan_report(repo_path, _list_files(repo_path))
+
+
+def _heuristics(repo_path: str) -> Dict[str, List[str]]:
+    files = _list_files(repo_path)
+    return {
+        "files": files,
+        "languages": detect_languages(files),
+        "configs": _config_candidates(files),
+        "models": _model_candidates(files),
+        "demos": _demo_candidates(files),
+        "entrypoints": _entrypoint_candidates(repo_path, files),
+    }
 
-    summary_text = summarize_for_llm(repo_path, all_files)
 
-    # return parsed dict
-    return json.loads(summary_text)
+async def scan_repository_async(repo_path: str) -> ScanReport:
+    """
+    scan_repository() for run_pipeline_async(): the file walk and the
+    heuristics run on the CPU pool, the LLM refinements are awaited
+    concurrently on the event loop, so no pool thread waits on the network.
+    """
+    found = await run_blocking(_heuristics, repo_path)
+    files = found["files"]
+    configs, models, demos, entrypoints = await asyncio.gather(
+        _ask_async(_configs_prompt(files), "scanner.configs") if not found["configs"] else _no_answer(),
+        _ask_async(_models_prompt(files), "scanner.models") if not found["models"] else _no_answer(),
+        _ask_async(_demos_prompt(files), "scanner.demos"),
+        _ask_async(_entrypoints_prompt(files), "scanner.entrypoints"),
+    )
+    return await run_blocking(
+        _assemble_report, files, found["languages"],
+        _merge_configs(found["configs"], configs),
+        _merge_models(found["models"], models),
+        _merge_list(found["demos"], demos),
+        _merge_list(found["entrypoints"], entrypoints),
+    )
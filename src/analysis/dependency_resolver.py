@@ -0,0 +1,459 @@
+"""
+dependency_resolver.py
+-----------------------
+Works out what a cloned repo + generated demo need, and installs it all
+in ONE pip call before the demo is executed.
+
+Responsibilities:
+- Collect third-party imports of the demo via AST, following the demo's
+  imports into the repo's own modules (stdlib, repo-local modules and
+  try/except-ImportError imports are skipped)
+- Read declared dependencies from requirements*.txt, setup.py,
+  pyproject.toml and environment.yml
+- Map import names to distribution names (cv2 → opencv-python, ...)
+- Drop anything already importable, then run a single `pip install`
+  into the job's own target folder (DEPS_DIRNAME in the evaluated copy),
+  which deps_env() puts on the demo's PYTHONPATH. The server's own
+  interpreter is never installed into.
+- Report the install time separately from the demo's run time
+
+This file never executes repo code; setup.py is parsed, not run.
+"""
+
+import ast
+import importlib.metadata
+import importlib.util
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from src.jobs.async_runtime import run_blocking
+from src.jobs.deadline import run_subprocess, run_subprocess_async
+
+INSTALL_TIMEOUT = 600      # seconds for the single bulk pip call
+MAX_FILES_TO_PARSE = 2000  # cap on repo .py files parsed for imports
+MAX_FILE_BYTES = 512 * 1024
+DEPS_DIRNAME = ".autoagent_deps"   # pip --target folder, inside the copy the demo runs in
+
+# Folders whose imports are not needed to run the project
+SKIP_DIRS = {".git", "tests", "test", "docs", "doc", "benchmarks", "build", "dist",
+             "__pycache__", ".github", "venv", ".venv", "node_modules", DEPS_DIRNAME}
+
+# Import name → PyPI distribution, where they differ
+IMPORT_TO_DIST: Dict[str, str] = {
+    "cv2": "opencv-python",
+    "PIL": "Pillow",
+    "sklearn": "scikit-learn",
+    "skimage": "scikit-image",
+    "yaml": "PyYAML",
+    "bs4": "beautifulsoup4",
+    "dotenv": "python-dotenv",
+    "git": "GitPython",
+    "Crypto": "pycryptodome",
+    "attr": "attrs",
+    "dateutil": "python-dateutil",
+    "jwt": "PyJWT",
+    "fitz": "PyMuPDF",
+    "docx": "python-docx",
+    "pptx": "python-pptx",
+    "serial": "pyserial",
+    "magic": "python-magic",
+    "OpenSSL": "pyOpenSSL",
+    "Levenshtein": "python-Levenshtein",
+    "mpl_toolkits": "matplotlib",
+    "pkg_resources": "setuptools",
+    "hydra": "hydra-core",
+    "google": "protobuf",
+    "tensorboardX": "tensorboardX",
+    "faiss": "faiss-cpu",
+    "sentencepiece": "sentencepiece",
+    "Bio": "biopython",
+    "pdfminer": "pdfminer.six",
+    "lightning": "lightning",
+    "pytorch_lightning": "pytorch-lightning",
+    "igraph": "python-igraph",
+    "zmq": "pyzmq",
+    "websocket": "websocket-client",
+    "sentence_transformers": "sentence-transformers",
+}
+
+_REQ_NAME = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+
+# ------------------------------------------------------------
+# 1. Imports via AST
+# ------------------------------------------------------------
+def _is_import_error_guard(handler: ast.ExceptHandler) -> bool:
+    names = []
+    if isinstance(handler.type, ast.Name):
+        names = [handler.type.id]
+    elif isinstance(handler.type, ast.Tuple):
+        names = [e.id for e in handler.type.elts if isinstance(e, ast.Name)]
+    return any(n in ("ImportError", "ModuleNotFoundError") for n in names)
+
+
+def collect_imports(source: str) -> Set[str]:
+    """
+    Top-level module names imported by `source`.
+    Imports inside `try: ... except ImportError:` are optional and skipped.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return set()
+
+    optional: Set[int] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Try) and any(_is_import_error_guard(h) for h in node.handlers):
+            for child in node.body:
+                for sub in ast.walk(child):
+                    optional.add(id(sub))
+
+    found: Set[str] = set()
+    for node in ast.walk(tree):
+        if id(node) in optional:
+            continue
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                found.add(alias.name.split(".")[0])
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            found.add(node.module.split(".")[0])
+    return found
+
+
+def _iter_python_files(repo_path: str) -> Iterable[str]:
+    count = 0
+    for root, dirs, files in os.walk(repo_path):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")]
+        for f in files:
+            if f.endswith(".py") and f != "setup.py":
+                yield os.path.join(root, f)
+                count += 1
+                if count >= MAX_FILES_TO_PARSE:
+                    return
+
+
+def _local_index(repo_path: str) -> Dict[str, List[str]]:
+    """
+    Top-level name → the repo's .py files behind it, for every module and
+    package anywhere in the repo. Any folder may end up on sys.path (the
+    demo's folder, a PYTHONPATH fix-up), so a/b/c.py makes "a", "b" and
+    "c" all local.
+    """
+    index: Dict[str, List[str]] = {}
+    for path in _iter_python_files(repo_path):
+        parts = os.path.relpath(path, repo_path).split(os.sep)
+        for name in parts[:-1] + [parts[-1][:-3]]:
+            if name != "__init__":
+                index.setdefault(name, []).append(path)
+    return index
+
+
+def local_modules(repo_path: str) -> Set[str]:
+    """Top-level names importable from the repo itself, at any depth."""
+    return set(_local_index(repo_path))
+
+
+def _stdlib_modules() -> Set[str]:
+    names = set(getattr(sys, "stdlib_module_names", ()))
+    names.update(sys.builtin_module_names)
+    names.add("__future__")
+    return names
+
+
+def third_party_imports(repo_path: str, demo_code: str = "") -> Set[str]:
+    """
+    Third-party top-level imports the demo needs: its own, plus those of
+    every repo-local module it imports, transitively. Repo code the demo
+    never reaches (training scripts, examples, ...) is not followed.
+    """
+    index = _local_index(repo_path)
+    stdlib = _stdlib_modules()
+    found: Set[str] = set()
+    seen: Set[str] = set()
+    parsed: Set[str] = set()
+    pending = list(collect_imports(demo_code))
+    while pending:
+        name = pending.pop()
+        if not name or name in seen or name in stdlib:
+            continue
+        seen.add(name)
+        if name not in index:
+            found.add(name)
+            continue
+        for path in index[name]:
+            if path in parsed:
+                continue
+            parsed.add(path)
+            try:
+                if os.path.getsize(path) > MAX_FILE_BYTES:
+                    continue
+                with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                    pending.extend(collect_imports(f.read()))
+            except OSError:
+                continue
+    return found
+
+
+# ------------------------------------------------------------
+# 2. Declared requirements
+# ------------------------------------------------------------
+def _from_requirements_txt(path: str) -> List[str]:
+    reqs = []
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            # Skip pip options, includes and editable/local installs
+            if not line or line.startswith(("-", ".", "/")) or "://" in line:
+                continue
+            reqs.append(line)
+    return reqs
+
+
+def _from_setup_py(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        try:
+            tree = ast.parse(f.read())
+        except SyntaxError:
+            return []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.keyword) and node.arg == "install_requires":
+            try:
+                value = ast.literal_eval(node.value)
+            except ValueError:
+                return []   # computed at runtime, can't know statically
+            return [str(v) for v in value] if isinstance(value, (list, tuple)) else []
+    return []
+
+
+def _from_pyproject(path: str) -> List[str]:
+    try:
+        import tomllib
+    except ImportError:   # Python < 3.11
+        return []
+    with open(path, "rb") as f:
+        try:
+            data = tomllib.load(f)
+        except tomllib.TOMLDecodeError:
+            return []
+
+    reqs = list(data.get("project", {}).get("dependencies", []))
+    poetry = data.get("tool", {}).get("poetry", {}).get("dependencies", {})
+    reqs.extend(name for name in poetry if name.lower() != "python")
+    return reqs
+
+
+def _from_environment_yml(path: str) -> List[str]:
+    """
+    Minimal environment.yml reader (no PyYAML needed).
+    Only the `- pip:` sub-list is used: conda package names often don't
+    exist on PyPI and one bad name would fail the whole bulk install.
+    """
+    reqs = []
+    pip_indent = None
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for raw in f:
+            line = raw.split("#", 1)[0].rstrip()
+            if not line.strip():
+                continue
+            indent = len(line) - len(line.lstrip())
+            item = line.strip()
+            if item in ("- pip:", "-pip:"):
+                pip_indent = indent
+                continue
+            if pip_indent is not None:
+                if indent > pip_indent and item.startswith("- "):
+                    reqs.append(item[2:].strip())
+                else:
+                    pip_indent = None
+    return reqs
+
+
+def declared_requirements(repo_path: str) -> List[str]:
+    reqs: List[str] = []
+    for name in sorted(os.listdir(repo_path)) if os.path.isdir(repo_path) else []:
+        path = os.path.join(repo_path, name)
+        lower = name.lower()
+        try:
+            if lower.startswith("requirements") and lower.endswith(".txt") and "dev" not in lower and "test" not in lower:
+                reqs.extend(_from_requirements_txt(path))
+            elif lower == "setup.py":
+                reqs.extend(_from_setup_py(path))
+            elif lower == "pyproject.toml":
+                reqs.extend(_from_pyproject(path))
+            elif lower in ("environment.yml", "environment.yaml"):
+                reqs.extend(_from_environment_yml(path))
+        except OSError:
+            continue
+    return reqs
+
+
+# ------------------------------------------------------------
+# 3. Resolve + install
+# ------------------------------------------------------------
+def _normalize(name: str) -> str:
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _requirement_name(requirement: str) -> str:
+    match = _REQ_NAME.match(requirement)
+    return _normalize(match.group(1)) if match else ""
+
+
+def deps_target(repo_path: str) -> str:
+    """The job's pip --target folder."""
+    return os.path.join(repo_path, DEPS_DIRNAME)
+
+
+def deps_env(repo_path: str) -> Optional[Dict[str, str]]:
+    """Environment that makes the job's installed packages importable for the demo (None if none)."""
+    target = deps_target(repo_path)
+    return {"PYTHONPATH": target} if os.path.isdir(target) else None
+
+
+def pip_install_command(requirements: List[str], target: str) -> List[str]:
+    # --upgrade lets a later install (fix-ups) replace what an earlier one put in the same target
+    return [sys.executable, "-m", "pip", "install", "--disable-pip-version-check", "-q",
+            "--target", target, "--upgrade"] + list(requirements)
+
+
+def declared_distributions(repo_path: str) -> Set[str]:
+    """Normalized distribution names the repo declares (requirements, setup.py, ...)."""
+    return {name for name in map(_requirement_name, declared_requirements(repo_path)) if name}
+
+
+def _is_installed(distribution: str) -> bool:
+    try:
+        importlib.metadata.version(distribution)
+        return True
+    except importlib.metadata.PackageNotFoundError:
+        return False
+
+
+def import_to_distribution(import_name: str) -> str:
+    return IMPORT_TO_DIST.get(import_name, import_name)
+
+
+def is_known_distribution(import_name: str, declared: Set[str]) -> bool:
+    """True if `import_name` is in IMPORT_TO_DIST or its distribution is among `declared` (normalized)."""
+    return import_name in IMPORT_TO_DIST or _normalize(import_to_distribution(import_name)) in declared
+
+
+def resolve_dependencies(repo_path: str, demo_code: str = "") -> Dict[str, List[str]]:
+    """
+    Returns:
+        {"declared": [...], "inferred": [...], "unrecognized": [...], "to_install": [...]}
+    where to_install merges declared and inferred and drops anything
+    already importable. Imports that are neither declared nor in
+    IMPORT_TO_DIST (typos, hallucinated or local-only names) are only
+    reported as unrecognized: one bad name would fail the single pip call,
+    and it would fetch an arbitrary PyPI package.
+    """
+    declared = declared_requirements(repo_path)
+    declared_names = {_requirement_name(r) for r in declared}
+
+    inferred, unrecognized = [], []
+    for module in sorted(third_party_imports(repo_path, demo_code)):
+        if importlib.util.find_spec(module) is not None:
+            continue   # already available in this interpreter
+        dist = import_to_distribution(module)
+        if _normalize(dist) in declared_names:
+            continue
+        if is_known_distribution(module, declared_names):
+            inferred.append(dist)
+        else:
+            unrecognized.append(module)
+
+    to_install = []
+    seen: Set[str] = set()
+    for requirement in declared + inferred:
+        name = _requirement_name(requirement)
+        if not name or name in seen:
+            continue
+        seen.add(name)
+        # Unpinned and already installed: nothing for pip to do
+        if _requirement_name(requirement) == _normalize(requirement.strip()) and _is_installed(name):
+            continue
+        to_install.append(requirement)
+
+    if unrecognized:
+        print(f"[DEPS] Not installing unrecognized imports: {', '.join(unrecognized)}")
+    return {"declared": declared, "inferred": inferred, "unrecognized": unrecognized, "to_install": to_install}
+
+
+def install_dependencies(repo_path: str, demo_code: str = "",
+                         timeout: int = INSTALL_TIMEOUT) -> Dict:
+    """
+    Resolve and install everything in one pip call, into deps_target(repo_path).
+
+    Returns a report with the package list, pip's exit code and the
+    install time (kept apart from the demo's run time).
+    """
+    report, command = _install_plan(resolve_dependencies(repo_path, demo_code), deps_target(repo_path))
+    if command is None:
+        return report
+
+    start_time = time.time()
+    try:
+        result = run_subprocess(command, timeout=timeout)
+        _record_pip_result(report, result)
+    except subprocess.TimeoutExpired:
+        _record_pip_timeout(report, timeout)
+    return _finish_report(report, start_time)
+
+
+async def install_dependencies_async(repo_path: str, demo_code: str = "",
+                                     timeout: int = INSTALL_TIMEOUT) -> Dict:
+    """install_dependencies() for run_pipeline_async(): resolution on the pool, pip as an asyncio subprocess."""
+    resolved = await run_blocking(resolve_dependencies, repo_path, demo_code)
+    report, command = _install_plan(resolved, deps_target(repo_path))
+    if command is None:
+        return report
+
+    start_time = time.time()
+    try:
+        result = await run_subprocess_async(command, timeout=timeout)
+        _record_pip_result(report, result)
+    except subprocess.TimeoutExpired:
+        _record_pip_timeout(report, timeout)
+    return _finish_report(report, start_time)
+
+
+def _install_plan(resolved: Dict[str, List[str]], target: str) -> Tuple[Dict, Optional[List[str]]]:
+    """The initial report, and the pip command (None if there is nothing to install)."""
+    report = {
+        "packages": resolved["to_install"],
+        "declared": resolved["declared"],
+        "inferred": resolved["inferred"],
+        "unrecognized": resolved["unrecognized"],
+        "target": target,
+        "status": "skipped",
+        "install_time": 0.0,
+        "stderr": "",
+    }
+    if not resolved["to_install"]:
+        print("[DEPS] Nothing to install.")
+        return report, None
+
+    print(f"[DEPS] Installing {len(resolved['to_install'])} packages in one pip call...")
+    return report, pip_install_command(resolved["to_install"], target)
+
+
+def _record_pip_result(report: Dict, result) -> None:
+    report["status"] = "installed" if result.returncode == 0 else "failed"
+    report["stderr"] = result.stderr[-4000:]
+
+
+def _record_pip_timeout(report: Dict, timeout: int) -> None:
+    report["status"] = "timeout"
+    report["stderr"] = f"pip install timed out after {timeout} seconds."
+
+
+def _finish_report(report: Dict, start_time: float) -> Dict:
+    report["install_time"] = round(time.time() - start_time, 2)
+
+    print(f"[DEPS] pip {report['status']} in {report['install_time']}s.")
+    return report
@@ -0,0 +1,359 @@
+"""
+doc_index.py
+-------------
+Small local retrieval index over a repository's documentation.
+
+Responsibilities:
+- Collect README variants, docs/, example scripts and notebook code cells
+- Split them into heading-aware chunks of a few hundred tokens
+- Score chunks with BM25 against a usage/quickstart query
+- Cache the chunks once per commit and set of extra files under
+  DocIndex/<commit>[-<extra files digest>].json
+- build_context() returns the best chunks that fit a token budget,
+  ready to paste into the demo-generation prompt
+
+Pure Python, no external search dependency.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.llm.tokens import estimate_tokens, truncate_to_tokens
+
+DOC_INDEX_FOLDER = "DocIndex"
+INDEX_VERSION = 1
+
+CHUNK_TOKENS = 300             # target chunk size
+DEFAULT_CONTEXT_TOKENS = 750   # what README[:2000] + example[:1000] used to cost
+MAX_DOC_FILES = 300
+MAX_DOC_BYTES = 256 * 1024
+MAX_CHUNKS_PER_SOURCE = 3
+
+DOC_DIRS = {"docs", "doc", "documentation"}
+EXAMPLE_DIRS = {"examples", "example", "demo", "demos", "tutorials", "tutorial", "notebooks", "scripts"}
+DOC_EXTENSIONS = {".md", ".rst", ".txt"}
+SKIP_DIRS = {".git", "__pycache__", "node_modules", ".venv", "venv", "build", "dist", "_build", "_static"}
+
+# What a demo writer is looking for
+USAGE_QUERY = ("usage quickstart quick start getting started example examples tutorial "
+               "install import run demo predict inference load model train")
+USAGE_HEADING = re.compile(r"usage|quick\s*start|getting started|example|tutorial|how to|demo|install", re.I)
+HEADING_BOOST = 1.5
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9]+")
+_MD_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+(.*)$")
+_RST_UNDERLINE = re.compile(r"^([=\-~^\"'`#*+])\1{2,}\s*$")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words; snake_case and CamelCase identifiers also yield their parts."""
+    words = []
+    for word in _WORD.findall(text):
+        lower = word.lower()
+        words.append(lower)
+        parts = re.findall(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])", word.replace("_", " "))
+        if len(parts) > 1:
+            words.extend(p.lower() for p in parts if len(p) > 1)
+    return words
+
+
+# ------------------------------------------------------------
+# 1. Collect documents
+# ------------------------------------------------------------
+def _is_readme(name: str) -> bool:
+    root, ext = os.path.splitext(name.lower())
+    return root == "readme" and ext in DOC_EXTENSIONS | {""}
+
+
+def iter_doc_files(repo_path: str, extra: Iterable[str] = ()) -> List[str]:
+    """Relative paths of documentation-like files, READMEs first."""
+    found: List[str] = []
+    seen = set()
+
+    def add(rel: str):
+        rel = rel.replace(os.sep, "/")
+        if rel not in seen and len(found) < MAX_DOC_FILES:
+            seen.add(rel)
+            found.append(rel)
+
+    for name in sorted(os.listdir(repo_path)):
+        if _is_readme(name) and os.path.isfile(os.path.join(repo_path, name)):
+            add(name)
+
+    for rel in extra:
+        if os.path.isfile(os.path.join(repo_path, rel)):
+            add(rel)
+
+    for root, dirs, files in os.walk(repo_path):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith("."))
+        rel_root = os.path.relpath(root, repo_path)
+        parts = set(rel_root.lower().split(os.sep)) if rel_root != "." else set()
+        in_docs, in_examples = bool(parts & DOC_DIRS), bool(parts & EXAMPLE_DIRS)
+        for name in sorted(files):
+            ext = os.path.splitext(name)[1].lower()
+            if ext == ".ipynb" and (in_docs or in_examples):
+                add(os.path.join(rel_root, name))
+            elif ext in DOC_EXTENSIONS and (in_docs or in_examples):
+                add(os.path.join(rel_root, name))
+            elif ext == ".py" and in_examples:
+                add(os.path.join(rel_root, name))
+    return found
+
+
+def _notebook_cells(raw: str) -> List[Tuple[str, str]]:
+    """(heading, code) for every code cell; the heading is the last markdown title seen."""
+    try:
+        notebook = json.loads(raw)
+    except ValueError:
+        return []
+    heading, cells = "", []
+    for cell in notebook.get("cells", []):
+        source = cell.get("source", "")
+        source = "".join(source) if isinstance(source, list) else str(source)
+        if cell.get("cell_type") == "markdown":
+            for line in source.splitlines():
+                match = _MD_HEADING.match(line)
+                if match:
+                    heading = match.group(1).strip()
+        elif cell.get("cell_type") == "code" and source.strip():
+            # Shell magics don't help a plain-Python demo
+            code = "\n".join(l for l in source.splitlines() if not l.lstrip().startswith(("!", "%")))
+            if code.strip():
+                cells.append((heading, code))
+    return cells
+
+
+# ------------------------------------------------------------
+# 2. Chunking
+# ------------------------------------------------------------
+def _sections_markdown(text: str) -> List[Tuple[str, str]]:
+    """Split Markdown/RST into (heading, body) sections."""
+    sections, heading, body = [], "", []
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        match = _MD_HEADING.match(line)
+        is_rst_title = (i + 1 < len(lines) and line.strip() and _RST_UNDERLINE.match(lines[i + 1])
+                        and len(lines[i + 1].strip()) >= len(line.strip()))
+        if match or is_rst_title:
+            if any(l.strip() for l in body):
+                sections.append((heading, "\n".join(body)))
+            heading, body = (match.group(1) if match else line).strip(), []
+        elif _RST_UNDERLINE.match(line) and i > 0 and not body:
+            continue   # the underline of the title just handled
+        else:
+            body.append(line)
+    if any(l.strip() for l in body):
+        sections.append((heading, "\n".join(body)))
+    return sections
+
+
+def _pack(blocks: Iterable[str], max_tokens: int) -> List[str]:
+    """Greedily join blocks into pieces of at most ~max_tokens."""
+    pieces, current = [], ""
+    for block in blocks:
+        block = block.strip("\n")
+        if not block.strip():
+            continue
+        candidate = f"{current}\n\n{block}" if current else block
+        if current and estimate_tokens(candidate) > max_tokens:
+            pieces.append(current)
+            current = block
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return [truncate_to_tokens(p, max_tokens * 2) for p in pieces]
+
+
+def chunk_file(rel_path: str, raw: str, max_tokens: int = CHUNK_TOKENS) -> List[Dict]:
+    ext = os.path.splitext(rel_path)[1].lower()
+    chunks = []
+
+    if ext == ".ipynb":
+        grouped: Dict[str, List[str]] = {}
+        for heading, code in _notebook_cells(raw):
+            grouped.setdefault(heading, []).append(code)
+        sections = [(heading, "\n\n".join(codes)) for heading, codes in grouped.items()]
+        splitter = lambda body: body.split("\n\n")
+    elif ext == ".py":
+        sections = [("", raw)]
+        splitter = lambda body: re.split(r"\n\s*\n(?=\S)", body)   # top-level blocks
+    else:
+        sections = _sections_markdown(raw)
+        splitter = lambda body: re.split(r"\n\s*\n", body)          # paragraphs
+
+    for heading, body in sections:
+        for piece in _pack(splitter(body), max_tokens):
+            chunks.append({
+                "source": rel_path,
+                "heading": heading,
+                "text": piece,
+                "tokens": estimate_tokens(piece),
+            })
+    return chunks
+
+
+# ------------------------------------------------------------
+# 3. BM25 index
+# ------------------------------------------------------------
+class DocIndex:
+    """BM25 over chunk text (+ heading and file name)."""
+
+    def __init__(self, chunks: List[Dict]):
+        self.chunks = chunks
+        self._term_freqs: List[Counter] = []
+        self._doc_freq: Counter = Counter()
+        for chunk in chunks:
+            terms = Counter(tokenize(f"{chunk['source']} {chunk['heading']} {chunk['text']}"))
+            self._term_freqs.append(terms)
+            self._doc_freq.update(terms.keys())
+        lengths = [sum(tf.values()) for tf in self._term_freqs]
+        self._lengths = lengths
+        self._avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def _idf(self, term: str) -> float:
+        n = len(self.chunks)
+        df = self._doc_freq.get(term, 0)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def score(self, query: str) -> List[float]:
+        terms = set(tokenize(query))
+        scores = []
+        for tf, length, chunk in zip(self._term_freqs, self._lengths, self.chunks):
+            score = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self._avg_length or 1))
+            for term in terms:
+                f = tf.get(term)
+                if f:
+                    score += self._idf(term) * f * (BM25_K1 + 1) / (f + norm)
+            if USAGE_HEADING.search(chunk["heading"]) or _is_readme(os.path.basename(chunk["source"])):
+                score *= HEADING_BOOST
+            scores.append(score)
+        return scores
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[float, Dict]]:
+        ranked = sorted(zip(self.score(query), self.chunks), key=lambda pair: -pair[0])
+        ranked = [(score, chunk) for score, chunk in ranked if score > 0]
+        return ranked[:limit] if limit else ranked
+
+    # ------------------------------------------------------------
+    # Build / cache
+    # ------------------------------------------------------------
+    @classmethod
+    def build(cls, repo_path: str, extra_files: Iterable[str] = ()) -> "DocIndex":
+        chunks = []
+        for rel in iter_doc_files(repo_path, extra_files):
+            path = os.path.join(repo_path, rel)
+            try:
+                if os.path.getsize(path) > MAX_DOC_BYTES:
+                    continue
+                with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                    chunks.extend(chunk_file(rel, f.read()))
+            except OSError:
+                continue
+        return cls(chunks)
+
+    @classmethod
+    def for_repo(cls, repo_path: str, extra_files: Iterable[str] = (),
+                 cache_folder: str = DOC_INDEX_FOLDER) -> "DocIndex":
+        """Build the index, or load it if this commit was already indexed."""
+        extra_files = list(extra_files)
+        commit = _head_commit(repo_path)
+        cache_path = os.path.join(cache_folder, _cache_name(commit, extra_files)) if commit else None
+
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == INDEX_VERSION:
+                    print(f"[DOCS] Loaded doc index for commit {commit[:10]}.")
+                    return cls(data["chunks"])
+            except (OSError, ValueError):
+                pass
+
+        index = cls.build(repo_path, extra_files)
+        print(f"[DOCS] Indexed {len(index)} chunks.")
+        if cache_path:
+            os.makedirs(cache_folder, exist_ok=True)
+            tmp = f"{cache_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "commit": commit, "chunks": index.chunks}, f)
+            os.replace(tmp, cache_path)
+        return index
+
+
+def _cache_name(commit: str, extra_files: List[str]) -> str:
+    # Same commit, different extra files (detected demos) → a different index
+    if not extra_files:
+        return f"{commit}.json"
+    digest = hashlib.sha1("\n".join(sorted(set(extra_files))).encode("utf-8")).hexdigest()[:12]
+    return f"{commit}-{digest}.json"
+
+
+def _head_commit(repo_path: str) -> Optional[str]:
+    """HEAD commit of a clone (None for non-git folders or dirty trees)."""
+    try:
+        from git import Repo, InvalidGitRepositoryError, NoSuchPathError
+        repo = Repo(repo_path)
+        # The demo is written into the clone, so ignore untracked files here
+        if repo.is_dirty(untracked_files=False):
+            return None
+        return repo.head.commit.hexsha
+    except (ImportError, InvalidGitRepositoryError, NoSuchPathError, ValueError):
+        return None
+
+
+# ------------------------------------------------------------
+# 4. Prompt context
+# ------------------------------------------------------------
+def select_chunks(index: DocIndex, query: str, token_budget: int) -> List[Dict]:
+    """Highest-scoring chunks that fit the budget, back in reading order."""
+    scores = index.score(query)
+    ranked = sorted((i for i, score in enumerate(scores) if score > 0), key=lambda i: -scores[i])
+
+    picked, used, per_source = [], 0, Counter()
+    for position in ranked:
+        chunk = index.chunks[position]
+        if per_source[chunk["source"]] >= MAX_CHUNKS_PER_SOURCE:
+            continue
+        remaining = token_budget - used
+        if chunk["tokens"] > remaining:
+            if remaining < 100:
+                break
+            text = truncate_to_tokens(chunk["text"], remaining)
+            chunk = dict(chunk, text=text, tokens=estimate_tokens(text))
+        picked.append((position, chunk))
+        used += chunk["tokens"]
+        per_source[chunk["source"]] += 1
+
+    # Chunks are stored in reading order (READMEs first), so sorting by position restores it
+    return [chunk for _, chunk in sorted(picked, key=lambda pair: pair[0])]
+
+
+def build_context(repo_path: str, extra_files: Iterable[str] = (), query_terms: Iterable[str] = (),
+                  token_budget: int = DEFAULT_CONTEXT_TOKENS) -> str:
+    """
+    Documentation context for the demo prompt.
+
+    `extra_files` are indexed even outside docs/examples (e.g. detected
+    demo scripts); `query_terms` add repo-specific words (project name,
+    entrypoints) to the usage query.
+    """
+    index = DocIndex.for_repo(repo_path, extra_files)
+    query = " ".join([USAGE_QUERY, *query_terms])
+    parts = []
+    for chunk in select_chunks(index, query, token_budget):
+        title = f"{chunk['source']} — {chunk['heading']}" if chunk["heading"] else chunk["source"]
+        parts.append(f"### {title}\n{chunk['text']}")
+    return "\n\n".join(parts)
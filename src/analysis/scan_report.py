@@ -0,0 +1,255 @@
+"""
+scan_report.py
+---------------
+Compact in-memory model of a repository scan.
+
+Responsibilities:
+- Store every scanned path ONCE in a path trie (shared prefixes such as
+  "src/models/" are stored a single time, not per file)
+- Answer "is this a file / folder of the repo?" in O(depth)
+- Keep the detector results (languages, configs, models, demos, entrypoints)
+- Serialize lazily: the JSON/dict form is only built at the API boundary
+
+to_dict() returns exactly the shape scan_repository() used to return, so
+existing consumers (prompts, the web UI) see no difference.
+"""
+
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+REPORT_FIELDS = ("num_files", "languages", "folders", "configs", "models", "demos", "entrypoints")
+
+
+class _TrieNode:
+    __slots__ = ("children", "is_file")
+
+    def __init__(self):
+        self.children: Optional[Dict[str, "_TrieNode"]] = None  # created on first child
+        self.is_file = False
+
+
+class PathTrie:
+    """Set of "/"-separated relative paths stored as a trie of path segments."""
+
+    __slots__ = ("_root", "_num_files")
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self._num_files = 0
+
+    def __len__(self) -> int:
+        return self._num_files
+
+    def __contains__(self, path: str) -> bool:
+        node = self._find(path)
+        return node is not None and node.is_file
+
+    def insert(self, path: str, is_file: bool = True) -> None:
+        node = self._root
+        for part in _split(path):
+            if node.children is None:
+                node.children = {}
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = _TrieNode()
+            node = child
+        if is_file and not node.is_file:
+            node.is_file = True
+            self._num_files += 1
+
+    def has_file(self, path: str) -> bool:
+        return path in self
+
+    def has_dir(self, path: str) -> bool:
+        node = self._find(path)
+        return node is not None and (node.children is not None or not node.is_file)
+
+    def list_dir(self, path: str = "") -> List[str]:
+        """Names (not full paths) of the entries directly under `path`."""
+        node = self._find(path)
+        if node is None or node.children is None:
+            return []
+        return sorted(node.children)
+
+    def iter_files(self) -> Iterator[str]:
+        """Yield every file path, depth-first in sorted order."""
+        stack = [("", self._root)]
+        while stack:
+            prefix, node = stack.pop()
+            if node.is_file:
+                yield prefix
+            if node.children:
+                for name in sorted(node.children, reverse=True):
+                    stack.append((f"{prefix}/{name}" if prefix else name, node.children[name]))
+
+    def folders(self) -> List[str]:
+        """Sorted folders that directly contain at least one file ("" is the repo root)."""
+        found = []
+        stack = [("", self._root)]
+        while stack:
+            prefix, node = stack.pop()
+            if not node.children:
+                continue
+            if any(child.is_file for child in node.children.values()):
+                found.append(prefix)
+            for name, child in node.children.items():
+                stack.append((f"{prefix}/{name}" if prefix else name, child))
+        return sorted(found)
+
+    def to_nested(self) -> Dict[str, Any]:
+        """Nested-dict form for checkpoints: folders map to dicts, files to 1."""
+        def walk(node: _TrieNode) -> Dict[str, Any]:
+            out = {}
+            for name, child in (node.children or {}).items():
+                if child.children:
+                    sub = walk(child)
+                    if child.is_file:
+                        sub[""] = 1   # a path that is both a file and a prefix
+                    out[name] = sub
+                else:
+                    out[name] = 1 if child.is_file else {}
+            return out
+        return walk(self._root)
+
+    @classmethod
+    def from_nested(cls, nested: Dict[str, Any]) -> "PathTrie":
+        trie = cls()
+        stack = [("", nested)]
+        while stack:
+            prefix, tree = stack.pop()
+            for name, value in tree.items():
+                if name == "":
+                    trie.insert(prefix)
+                    continue
+                path = f"{prefix}/{name}" if prefix else name
+                if isinstance(value, dict):
+                    trie.insert(path, is_file=False)
+                    stack.append((path, value))
+                else:
+                    trie.insert(path)
+        return trie
+
+    def _find(self, path: str) -> Optional[_TrieNode]:
+        node = self._root
+        for part in _split(path):
+            if node.children is None:
+                return None
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+
+def _split(path: str) -> List[str]:
+    return [part for part in path.replace("\\", "/").split("/") if part and part != "."]
+
+
+class ScanReport:
+    """Typed result of scan_repository(); behaves like the old dict for .get()/[]."""
+
+    __slots__ = ("tree", "num_files", "languages", "configs", "models", "demos", "entrypoints", "_folders")
+
+    def __init__(self, tree: PathTrie, languages: List[str], configs: List[str], models: List[str],
+                 demos: List[str], entrypoints: List[str], num_files: Optional[int] = None,
+                 folders: Optional[List[str]] = None):
+        self.tree = tree
+        # Only set for reports rebuilt from old dicts, where the tree is partial
+        self._folders = folders
+        self.num_files = len(tree) if num_files is None else num_files
+        self.languages = languages
+        self.configs = configs
+        self.models = models
+        self.demos = demos
+        self.entrypoints = entrypoints
+
+    # ------------------------------------------------------------
+    # Lookups (O(depth))
+    # ------------------------------------------------------------
+    def has_file(self, path: str) -> bool:
+        return self.tree.has_file(path)
+
+    def has_dir(self, path: str) -> bool:
+        return self.tree.has_dir(path)
+
+    def find_root_file(self, *candidates: str) -> Optional[str]:
+        """First root-level file whose name matches a candidate (case-insensitive)."""
+        names = {name.lower(): name for name in self.tree.list_dir("") if self.tree.has_file(name)}
+        for candidate in candidates:
+            if candidate.lower() in names:
+                return names[candidate.lower()]
+        return None
+
+    # ------------------------------------------------------------
+    # Dict compatibility
+    # ------------------------------------------------------------
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "folders":
+            return list(self._folders) if self._folders is not None else self.tree.folders()
+        if key in REPORT_FIELDS:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in REPORT_FIELDS:
+            raise KeyError(key)
+        return self.get(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in REPORT_FIELDS
+
+    def keys(self):
+        return iter(REPORT_FIELDS)
+
+    # ------------------------------------------------------------
+    # Serialization (only at the boundary)
+    # ------------------------------------------------------------
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self.get(key) for key in REPORT_FIELDS}
+
+    def to_json(self, indent: Optional[int] = None) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_checkpoint(self) -> Dict[str, Any]:
+        """to_dict() plus the full path tree, so lookups survive a resume."""
+        data = self.to_dict()
+        data["tree"] = self.tree.to_nested()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ScanReport":
+        """
+        Rebuild a report from to_dict()/to_checkpoint() output.
+
+        Without a "tree" (old-style dicts) only the listed paths are known.
+        """
+        if isinstance(data, ScanReport):
+            return data
+
+        folders = None
+        if "tree" in data:
+            tree = PathTrie.from_nested(data["tree"])
+        else:
+            folders = list(data.get("folders", []))
+            tree = PathTrie()
+            for folder in data.get("folders", []):
+                tree.insert(folder, is_file=False)
+            for key in ("configs", "models", "demos", "entrypoints"):
+                for path in data.get(key, []):
+                    tree.insert(path)
+
+        return cls(
+            tree,
+            languages=list(data.get("languages", [])),
+            configs=list(data.get("configs", [])),
+            models=list(data.get("models", [])),
+            demos=list(data.get("demos", [])),
+            entrypoints=list(data.get("entrypoints", [])),
+            num_files=data.get("num_files", len(tree)),
+            folders=folders,
+        )
+
+    def __str__(self) -> str:
+        return self.to_json()
+
+    def __repr__(self) -> str:
+        return f"ScanReport(num_files={self.num_files}, languages={self.languages})"
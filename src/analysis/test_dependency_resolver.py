@@ -0,0 +1,66 @@
+"""
+Tests for dependency_resolver.py: merging declared and inferred requirements.
+
+Run with: python -m pytest src/analysis/test_dependency_resolver.py
+"""
+
+import importlib.util
+
+import pytest
+
+from src.analysis import dependency_resolver
+from src.analysis.dependency_resolver import resolve_dependencies
+
+DEMO = """
+import pytest
+import Bio
+import igraph
+import foo_bar_pkg
+import totally_made_up_pkg
+from mypkg import model
+"""
+
+
+@pytest.fixture
+def repo(tmp_path):
+    (tmp_path / "requirements.txt").write_text("foo-bar-pkg==1.2\nsome_declared_lib>=2\n")
+    (tmp_path / "mypkg").mkdir()
+    (tmp_path / "mypkg" / "__init__.py").write_text("")
+    # Reached through the demo's local import, so its imports count too
+    (tmp_path / "mypkg" / "model.py").write_text("import zmq\nimport pytest\n")
+    return str(tmp_path)
+
+
+@pytest.fixture(autouse=True)
+def nothing_installed(monkeypatch):
+    # Resolution must not depend on what this interpreter happens to have
+    real_find_spec = importlib.util.find_spec
+    monkeypatch.setattr(dependency_resolver.importlib.util, "find_spec",
+                        lambda name, *a: real_find_spec(name, *a) if name == "pytest" else None)
+    monkeypatch.setattr(dependency_resolver, "_is_installed", lambda name: False)
+
+
+def test_declared_and_known_inferred_are_merged(repo):
+    resolved = resolve_dependencies(repo, DEMO)
+    assert resolved["declared"] == ["foo-bar-pkg==1.2", "some_declared_lib>=2"]
+    # Import names known to IMPORT_TO_DIST map to their distributions, including transitive ones
+    assert sorted(resolved["inferred"]) == ["biopython", "python-igraph", "pyzmq"]
+    assert resolved["to_install"] == ["foo-bar-pkg==1.2", "some_declared_lib>=2", *resolved["inferred"]]
+
+
+def test_declared_import_is_not_inferred_again(repo):
+    resolved = resolve_dependencies(repo, "import foo_bar_pkg\n")
+    assert resolved["inferred"] == []
+    assert resolved["to_install"] == ["foo-bar-pkg==1.2", "some_declared_lib>=2"]
+
+
+def test_unrecognized_imports_are_not_installed(repo):
+    resolved = resolve_dependencies(repo, DEMO)
+    assert resolved["unrecognized"] == ["totally_made_up_pkg"]
+    assert "totally_made_up_pkg" not in resolved["to_install"]
+    assert "mypkg" not in resolved["unrecognized"]   # repo-local
+
+
+def test_available_imports_are_skipped(repo):
+    resolved = resolve_dependencies(repo, "import pytest\n")
+    assert "pytest" not in resolved["inferred"] + resolved["unrecognized"]
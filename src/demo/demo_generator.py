@@ -10,46 +10,36 @@ Responsibilities:
       - a minimal runnable demo.py
       - OR instructions for running the project
 - Save the demo file into the repo folder
+- Stream the generated demo to a progress consumer token by token; an
+  answer that starts as prose or a markdown fence is dropped and asked
+  for again, one cut off at max_tokens is continued
+- repair_demo(): rewrite a demo that failed in a way no local fix-up rule
+  covers (see evaluation/fixups.py), given its error output
 
 This file contains ALL LLM interactions.
 The rest of the repo never talks to the model.
 """
 
+import ast
 import os
-from typing import Dict, List
-import requests
+import re
+from typing import Callable, Dict, List, Optional
 from dotenv import load_dotenv
 import json
 
-load_dotenv()
-
-def _call_openai(prompt: str) -> str:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise Exception("OPENAI_API_KEY is not set in the environment variables.")
-
-    url = "https://api.openai.com/v1/chat/completions"
-
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+from src.jobs.async_runtime import run_blocking
+from src.llm.client import call_llm, call_llm_async, call_llm_stream, call_llm_stream_async
+from src.analysis.scan_report import ScanReport
+from src.analysis.doc_index import build_context
 
-    payload = {
-        "model": "gpt-4o-mini",   # or any: gpt-4o, gpt-4.1, o1-mini, etc.
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0,
-        "max_tokens": 512
-    }
-
-    response = requests.post(url, headers=headers, json=payload)
+load_dotenv()
 
-    if response.status_code != 200:
-        raise Exception(f"OpenAI API error {response.status_code}: {response.text}")
+DEMO_MAX_TOKENS = 1536          # per request; a cut-off demo is continued (STREAM_CONTINUATIONS)
+PREFIX_DECISION_CHARS = 2000    # after this much unparseable-but-unfinished code, stop checking
+_INCOMPLETE = ("was never closed", "unexpected EOF", "expected an indented block", "unterminated")
 
-    return response.json()["choices"][0]["message"]["content"]
+def _call_openai(prompt: str, call_site: str = "demo") -> str:
+    return call_llm(prompt, call_site=call_site)
 
 def _read_file(path: str) -> str:
     """Read a file safely."""
@@ -65,8 +55,12 @@ def _llm_validate_demo(scan_summary: str, demo_code: str) -> bool:
     Ask LLM whether an existing demo file is valid.
     Returns True/False.
     """
+    answer = _call_openai(_validate_prompt(scan_summary, demo_code), call_site="demo.validate").upper()
+    return "YES" in answer
 
-    prompt = f"""
+
+def _validate_prompt(scan_summary: str, demo_code: str) -> str:
+    return f"""
     You are validating a demo code file for a project.
 
     Project summary:
@@ -92,55 +86,79 @@ def _llm_validate_demo(scan_summary: str, demo_code: str) -> bool:
     DO NOT include any punctuation, explanation, or code block markers.
     """
 
-    answer = _call_openai(prompt).upper()
-    return "YES" in answer
 
+def _doc_context(scan_summary: ScanReport, repo_path: str) -> str:
+    # Best usage/quickstart chunks from README variants, docs/, examples and notebooks
+    # Clones of the same repo get a "_<n>" suffix; only that is dropped ("my_repo_2" → "my_repo")
+    project_name = re.sub(r"_\d+$", "", os.path.basename(os.path.normpath(repo_path)))
+    entrypoints = [os.path.splitext(os.path.basename(e))[0] for e in scan_summary.get("entrypoints", [])]
+    return build_context(
+        repo_path,
+        extra_files=scan_summary.get("demos", []),
+        query_terms=[project_name, *entrypoints],
+    ) or "(no documentation found)"
 
-def _llm_generate_demo(scan_summary: str, repo_path: str) -> str:
+
+def _llm_generate_demo(scan_summary: ScanReport, repo_path: str,
+                       on_token: Optional[Callable[[str], None]] = None) -> str:
     """
-    Ask AI to generate a runnable demo code file.
+    Ask AI to generate a runnable demo code file (streamed to `on_token`).
     """
+    prompt = _generate_prompt(scan_summary, _doc_context(scan_summary, repo_path))
+    code = call_llm_stream(prompt, call_site="demo.generate", max_tokens=DEMO_MAX_TOKENS,
+                           on_token=on_token, check_prefix=_code_prefix_verdict)
+    return _strip_fences(code)
 
-    readme = _read_file(os.path.join(repo_path, "README.md"))[:2000]
 
-    # Find actual example
-    example_files = scan_summary.get("demos", [])
-    example_content = ""
-    if example_files:
-        example_content = _read_file(
-            os.path.join(repo_path, example_files[0])
-        )[:1000]
+def _code_prefix_verdict(text: str) -> Optional[bool]:
+    """
+    Does the start of a streamed answer look like Python?
 
-    prompt = f"""
+    True: keep streaming; False: prose or a markdown fence, regenerate;
+    None: not enough complete lines to tell yet.
+    """
+    stripped = text.lstrip()
+    if stripped.startswith("```"):
+        return False
+    if "\n" not in stripped:
+        return None
+    if stripped.startswith(("#", '"""', "'''", "@")):
+        return True
+    complete = stripped[:stripped.rfind("\n") + 1]
+    try:
+        ast.parse(complete)
+        return True
+    except SyntaxError as e:
+        if any(marker in str(e.msg) for marker in _INCOMPLETE):
+            # An open bracket or block at the end of the prefix; more text will tell
+            return True if len(complete) >= PREFIX_DECISION_CHARS else None
+        # "Here is the demo:" fails on line 1; a real error further down is the evaluator's business
+        return False if (e.lineno or 1) <= 1 else True
+
+
+def _strip_fences(code: str) -> str:
+    # The last attempt is never checked and may still come wrapped in a code block
+    lines = code.strip().split("\n")
+    if lines and lines[0].startswith("```"):
+        lines = lines[1:]
+        if lines and lines[-1].strip() == "```":
+            lines = lines[:-1]
+        return "\n".join(lines) + "\n"
+    return code
+
+
+def _generate_prompt(scan_summary: ScanReport, doc_context: str) -> str:
+    return f"""
     You are a code generation expert. Your primary goal is to generate a script that runs successfully.
 
     Given this project structure summary:
     {scan_summary}
 
-    README excerpt:
-    {readme}
-
-    Example file excerpt (if any):
-    {example_content}
+    Documentation and example excerpts (usage-related sections only):
+    {doc_context}
 
     Generate a SINGLE runnable demo script that:
-    1. **Dependency Check (CRITICAL):** Includes necessary standard Python imports (os, sys, subprocess) at the top. For any external library required (e.g., 'fire', 'torch', 'scipy'), you MUST write a self-installing try/except block.
-
-    Example of required self-installing block:
-    import os
-    import sys
-    import subprocess
-    
-    def install_missing_dependency(package_name):
-        print(f"Installing missing dependency: {{package_name}}...")
-        # Use subprocess to ensure it runs correctly inside the container
-        subprocess.check_call([sys.executable, "-m", "pip", "install", package_name])
-
-    try:
-        import <external_library>
-    except ImportError:
-        install_missing_dependency("<external_library>")
-        import <external_library>
+    1. **Imports (CRITICAL):** Put all imports at the top of the script as plain import statements. Do NOT install packages or call pip: every third-party import in the script is detected and installed before it runs.
     
     2. Imports required project modules from the cloned repository.
     3. Has no TODOs or placeholders.
@@ -151,22 +169,28 @@ def _llm_generate_demo(scan_summary: str, repo_path: str) -> str:
     REPEAT: ONLY THE CODE, NO EXTRA TEXT, NO CODE BLOCK MARKERS (e.g., ```python).
 
     """
-    
-    return _call_openai(prompt)
 
-def generate_demo(scan_output: Dict, repo_path: str) -> str:
+def generate_demo(scan_output: ScanReport, repo_path: str,
+                  on_token: Optional[Callable[[str], None]] = None) -> str:
     """
     Main function:
     - If demo file exists → validate via LLM
     - If valid → return its CONTENT
     - Else → generate new demo via LLM and return CONTENT
+      (streamed to `on_token` as it is written)
     """
     print("DEMO GENERATOR START")
-    scan_summary = scan_output
-    demo_files = scan_output.get("demos", [])
+    # Plain dicts (old callers, checkpoints) are accepted too
+    scan_summary = ScanReport.from_dict(scan_output)
+    demo_files = scan_summary.demos
 
     # 1. If existing demos are found -> validate
     for demo in demo_files:
+        # LLM refinements can name files that don't exist; skip them without a call
+        if not scan_summary.has_file(demo):
+            print(f"Skipping demo not present in the repo: {demo}")
+            continue
+
         abs_path = os.path.join(repo_path, demo)
         source = _read_file(abs_path)
 
@@ -182,13 +206,81 @@ def generate_demo(scan_output: Dict, repo_path: str) -> str:
 
     # 2. Otherwise: generate new demo
     print("No valid demo found — generating a new one with LLM…")
-    generated_code = _llm_generate_demo(scan_summary, repo_path)
+    generated_code = _llm_generate_demo(scan_summary, repo_path, on_token=on_token)
+    _report_syntax(generated_code)
+    return generated_code
+
+
+async def generate_demo_async(scan_output: ScanReport, repo_path: str,
+                              on_token: Optional[Callable[[str], None]] = None) -> str:
+    """generate_demo() for run_pipeline_async(): file reads and BM25 on the pool, LLM calls on the loop."""
+    print("DEMO GENERATOR START")
+    scan_summary = ScanReport.from_dict(scan_output)
+
+    for demo in scan_summary.demos:
+        if not scan_summary.has_file(demo):
+            print(f"Skipping demo not present in the repo: {demo}")
+            continue
+
+        source = await run_blocking(_read_file, os.path.join(repo_path, demo))
+        print(f"Checking existing demo: {demo}")
+        answer = await call_llm_async(_validate_prompt(scan_summary, source), call_site="demo.validate")
+        if "YES" in answer.upper():
+            print("LLM approved existing demo.")
+            return source
+
+        print("LLM rejected this demo. Trying next…")
+
+    print("No valid demo found — generating a new one with LLM…")
+    doc_context = await run_blocking(_doc_context, scan_summary, repo_path)
+    generated_code = _strip_fences(await call_llm_stream_async(
+        _generate_prompt(scan_summary, doc_context), call_site="demo.generate", max_tokens=DEMO_MAX_TOKENS,
+        on_token=on_token, check_prefix=_code_prefix_verdict))
+    _report_syntax(generated_code)
+    return generated_code
 
+
+def _repair_prompt(demo_code: str, error: str) -> str:
+    return f"""
+    This demo script for a cloned Python project failed.
+
+    Demo script:
+    --------------------
+    {demo_code}
+    --------------------
+
+    Error output (condensed):
+    --------------------
+    {error}
+    --------------------
+
+    Fix the script so it runs successfully on a CPU-only machine, from the repository root.
+    Keep what it demonstrates; change only what is needed to fix the error.
+    Do NOT install packages or call pip.
+
+    Return only the complete fixed python code.
+    REPEAT: ONLY THE CODE, NO EXTRA TEXT, NO CODE BLOCK MARKERS (e.g., ```python).
+    """
+
+
+def repair_demo(demo_code: str, error: str) -> str:
+    """Fixed demo code from the LLM (raises LLMSkipped while the provider is degraded)."""
+    print("[DEMO] Asking the LLM to repair the demo...")
+    return _strip_fences(call_llm_stream(_repair_prompt(demo_code, error), call_site="demo.repair",
+                                         max_tokens=DEMO_MAX_TOKENS, check_prefix=_code_prefix_verdict))
+
+
+async def repair_demo_async(demo_code: str, error: str) -> str:
+    """repair_demo() for run_pipeline_async()."""
+    print("[DEMO] Asking the LLM to repair the demo...")
+    return _strip_fences(await call_llm_stream_async(_repair_prompt(demo_code, error), call_site="demo.repair",
+                                                     max_tokens=DEMO_MAX_TOKENS, check_prefix=_code_prefix_verdict))
+
+
+def _report_syntax(generated_code: str) -> None:
     try:
         compile(generated_code, "<string>", "exec")
         print("Generated demo code is syntactically valid.")
     
     except SyntaxError as e:
         print(f"Generated demo code has syntax errors: {e}")
-    
-    return generated_code
@@ -1,12 +1,17 @@
 import subprocess
 import os
 import time
-from typing import Dict, Any
-import requests
-import json
+from typing import Dict, Any, Optional
 from dotenv import load_dotenv
 import sys
 
+from src.llm.client import call_llm, call_llm_async
+from src.llm.health import LLMSkipped
+from src.analysis.dependency_resolver import deps_env, install_dependencies, install_dependencies_async
+from src.evaluation.fixups import FIXUPS_ENABLED, run_fixups, run_fixups_async
+from src.evaluation.log_condenser import condense_judge_input
+from src.evaluation.resource_monitor import run_measured, run_measured_async, summarize_runs
+
 # Load environment variables (needed for LLM API Key)
 load_dotenv()
 
@@ -18,8 +23,22 @@ SCORE_STDOUT = 1
 SCORE_STDERR = 1
 MAX_LLM_QUALITATIVE_SCORE = 5
 MAX_EXECUTION_TIME = 30 # seconds
+# Graded performance point: (wall time below, in seconds) -> fraction of SCORE_RUN_TIME
+PERFORMANCE_TIERS = [(5, 1.0), (15, 0.75), (MAX_EXECUTION_TIME, 0.5)]
+MAX_PEAK_RSS_MB = 4096          # a demo above this loses PEAK_RSS_PENALTY
+PEAK_RSS_PENALTY = 0.25
+DEMO_REPEATS = int(os.getenv("AUTOAGENT_DEMO_REPEATS", "1"))   # >1: rerun a working demo to measure variance
 MAX_TOTAL_SCORE = SCORE_SYNTAX + SCORE_EXIT_CODE + SCORE_RUN_TIME + SCORE_STDOUT + SCORE_STDERR + MAX_LLM_QUALITATIVE_SCORE
 
+JUDGE_SYSTEM_PROMPT = (
+    "You are an code reviewer tasked with evaluating generated demo scripts for software projects. "
+    "Your goal is to assess the quality, but also the intent and potential of the generated code. "
+    "However, award generous partial credit if the code's structure and logic were sound, even if execution failed due to environment-specific errors (like missing imports or file paths). "
+    "You are evaluating on the content and quality of the code itself according to the paper's project summary provided. "
+    "Score the demo on a scale of 0 to 5 (integer only) based on the criteria provided. "
+    "Output ONLY a single integer score from 0 to 5. DO NOT include any extra text or explanation."
+)
+
 # =========================================================================
 # LLM Interaction Helper (OpenAI Implementation)
 # =========================================================================
@@ -32,88 +51,112 @@ def _call_openai(prompt: str) -> int:
         print("ERROR: OPENAI_API_KEY not set in environment. Qualitative score defaulted to 0.")
         return 0
 
-    url = "https://api.openai.com/v1/chat/completions"
+    try:
+        content = call_llm(prompt, call_site="evaluator.judge", system_prompt=JUDGE_SYSTEM_PROMPT,
+                           temperature=0.1, max_tokens=10, timeout=20)
+        return _parse_score(content)
+            
+    except LLMSkipped:
+        return _judge_skipped()
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    except Exception as e:
+        print(f"X Error calling OpenAI API: {e}. Defaulting qualitative score to 0.")
+        return 0
 
-    system_prompt = (
-        "You are an code reviewer tasked with evaluating generated demo scripts for software projects. "
-        "Your goal is to assess the quality, but also the intent and potential of the generated code. "
-        "However, award generous partial credit if the code's structure and logic were sound, even if execution failed due to environment-specific errors (like missing imports or file paths). "
-        "You are evaluating on the content and quality of the code itself according to the paper's project summary provided. "
-        "Score the demo on a scale of 0 to 5 (integer only) based on the criteria provided. "
-        "Output ONLY a single integer score from 0 to 5. DO NOT include any extra text or explanation."
-    )
-
-    payload = {
-        "model": "gpt-4o-mini",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.1,
-        "max_tokens": 10
-    }
+
+async def _call_openai_async(prompt: str) -> int:
+    """_call_openai() for run_pipeline_async()."""
+    if not os.getenv("OPENAI_API_KEY"):
+        print("ERROR: OPENAI_API_KEY not set in environment. Qualitative score defaulted to 0.")
+        return 0
 
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=20)
-        response.raise_for_status()
-        
-        # Extract and sanitize the LLM response to get a score between 0 and 5
-        content = response.json()["choices"][0]["message"]["content"].strip()
-        
-        # Robustly parse the integer score
-        try:
-            score_str = ''.join(filter(str.isdigit, content))
-            score = int(score_str) if score_str else 0
-            return max(0, min(MAX_LLM_QUALITATIVE_SCORE, score))
-        except ValueError:
-            print(f"Warning: LLM returned non-integer score: '{content}'. Defaulting to 0.")
-            return 0
-            
-    except requests.exceptions.RequestException as e:
+        content = await call_llm_async(prompt, call_site="evaluator.judge", system_prompt=JUDGE_SYSTEM_PROMPT,
+                                       temperature=0.1, max_tokens=10, timeout=20)
+        return _parse_score(content)
+
+    except LLMSkipped:
+        return _judge_skipped()
+
+    except Exception as e:
         print(f"X Error calling OpenAI API: {e}. Defaulting qualitative score to 0.")
         return 0
 
 
+def _parse_score(content: str) -> int:
+    # Extract and sanitize the LLM response to get a score between 0 and 5
+    content = content.strip()
+    
+    # Robustly parse the integer score
+    try:
+        score_str = ''.join(filter(str.isdigit, content))
+        score = int(score_str) if score_str else 0
+        return max(0, min(MAX_LLM_QUALITATIVE_SCORE, score))
+    except ValueError:
+        print(f"Warning: LLM returned non-integer score: '{content}'. Defaulting to 0.")
+        return 0
+
+
+def _judge_skipped() -> int:
+    # Degraded mode: the job is marked degraded and can be re-scored later
+    print("[EVALUATOR] LLM judge skipped (provider degraded). Qualitative score defaulted to 0.")
+    return 0
+
+
 # =========================================================================
 # LLM Judge Function
 # =========================================================================
 
-def get_llm_qualitative_score(demo_code: str, exec_results: Dict[str, Any], project_summary: Dict[str, Any]) -> int:
+def get_llm_qualitative_score(demo_code: str, exec_results: Dict[str, Any], project_summary: Dict[str, Any],
+                              judge_input: Optional[Dict[str, Any]] = None) -> int:
     """
     Asks an LLM (OpenAI) to score the demo code qualitatively (5 points) using a prompt.
+    The logs and the summary go in condensed (see log_condenser.py); pass
+    `judge_input` if condense_judge_input() was already run.
     """
     # If there was a syntax error, the LLM score is automatically 0.
     if exec_results.get("status") == "syntax_error":
         return 0
     
     print("[EVALUATOR] Calling LLM (OpenAI) for qualitative scoring (5 points)...")
+    judge_input = judge_input or condense_judge_input(exec_results, project_summary)
+    return _call_openai(_judge_prompt(demo_code, judge_input))
+
+
+async def get_llm_qualitative_score_async(demo_code: str, exec_results: Dict[str, Any],
+                                          project_summary: Dict[str, Any],
+                                          judge_input: Optional[Dict[str, Any]] = None) -> int:
+    if exec_results.get("status") == "syntax_error":
+        return 0
+
+    print("[EVALUATOR] Calling LLM (OpenAI) for qualitative scoring (5 points)...")
+    judge_input = judge_input or condense_judge_input(exec_results, project_summary)
+    return await _call_openai_async(_judge_prompt(demo_code, judge_input))
+
 
-    prompt = f"""
+def _judge_prompt(demo_code: str, judge_input: Dict[str, Any]) -> str:
+    exception = f"\n    Final exception: {judge_input['exception_type']}\n" if judge_input["exception_type"] else ""
+    return f"""
     Evaluate the following generated demo script for a project summarized below. Remember to focus on the quality of the generated code itself. Execution failure due to external factors like missing pip dependencies are not penalized heavily if the code structure and logic are sound. 
 
     Project Summary:
-    {json.dumps(project_summary, indent=2)}
+    {judge_input["summary"]}
 
     Generated Code (Focus on this):
     --------------------
     {demo_code}
     --------------------
 
-    Execution Output (stdout):
+    Execution Output (stdout, condensed):
     --------------------
-    {exec_results["stdout"]}
+    {judge_input["stdout"]}
     --------------------
 
-    Execution Errors (stderr) - Use this only to assess if the error was due to bad code vs. environment (e.g., ModuleNotFoundError):
+    Execution Errors (stderr, condensed) - Use this only to assess if the error was due to bad code vs. environment (e.g., ModuleNotFoundError):
     --------------------
-    {exec_results["stderr"]}
+    {judge_input["stderr"]}
     --------------------
-
+{exception}
     Score the demo from 0 to {MAX_LLM_QUALITATIVE_SCORE} based on these revised, generous criteria:
 
     1. Relevance (2 points max): Did the code attempt to import and use the core functions of the project's library?
@@ -129,18 +172,111 @@ def get_llm_qualitative_score(demo_code: str, exec_results: Dict[str, Any], proj
 
     Output ONLY a single integer score from 0 to {MAX_LLM_QUALITATIVE_SCORE} (Sum of the above criteria).
     """
-    
-    return _call_openai(prompt)
 
 
 # =========================================================================
 # Execution and Automated Scoring (Remaining functions unchanged)
 # =========================================================================
 
-def execute_demo(demo_file_path: str, repo_path: str) -> Dict[str, Any]:
-    # ... (function body remains the same as previous) ...
-    # Omitted for brevity, but logically identical to the last version provided
+def execute_demo(demo_file_path: str, repo_path: str, repeats: int = DEMO_REPEATS,
+                 env: Optional[Dict[str, str]] = None, cwd: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Runs the demo and measures it (wall/CPU time, peak RSS, I/O, child
+    processes). With `repeats` > 1, a demo that exits 0 is run again to
+    report the spread of those measurements.
+
+    `env` adds variables to the demo's environment and `cwd` runs it from
+    another folder than repo_path (both used by the fix-up rules).
+    """
+    precheck = _precheck_demo(demo_file_path)
+    if precheck is not None:
+        return precheck
+
+    # 2. Subprocess Execution
+    command, repo_path, env = _demo_command(demo_file_path, repo_path, env, cwd)
+
+    start_time = time.time()
     
+    try:
+        # Own process group: a timeout or job deadline kills the demo and anything it spawned
+        result, resources = run_measured(command, timeout=MAX_EXECUTION_TIME, cwd=repo_path, env=env)
+        output = _completed_output(result, resources)
+
+    except subprocess.TimeoutExpired:
+        return _timeout_output(start_time)
+
+    except Exception as e:
+        return _setup_error_output(e)
+
+    reports = [resources]
+    while len(reports) < repeats and output["exit_code"] == 0:
+        try:
+            result, resources = run_measured(command, timeout=MAX_EXECUTION_TIME, cwd=repo_path, env=env)
+        except (subprocess.TimeoutExpired, OSError):
+            break
+        if result.returncode != 0:
+            break
+        reports.append(resources)
+    return _with_repeats(output, reports)
+
+
+async def execute_demo_async(demo_file_path: str, repo_path: str, repeats: int = DEMO_REPEATS,
+                             env: Optional[Dict[str, str]] = None, cwd: Optional[str] = None) -> Dict[str, Any]:
+    """execute_demo() for run_pipeline_async(): the demo is polled from the event loop."""
+    precheck = _precheck_demo(demo_file_path)
+    if precheck is not None:
+        return precheck
+
+    command, repo_path, env = _demo_command(demo_file_path, repo_path, env, cwd)
+    start_time = time.time()
+    try:
+        result, resources = await run_measured_async(command, timeout=MAX_EXECUTION_TIME, cwd=repo_path, env=env)
+        output = _completed_output(result, resources)
+    except subprocess.TimeoutExpired:
+        return _timeout_output(start_time)
+    except Exception as e:
+        return _setup_error_output(e)
+
+    reports = [resources]
+    while len(reports) < repeats and output["exit_code"] == 0:
+        try:
+            result, resources = await run_measured_async(command, timeout=MAX_EXECUTION_TIME, cwd=repo_path,
+                                                         env=env)
+        except (subprocess.TimeoutExpired, OSError):
+            break
+        if result.returncode != 0:
+            break
+        reports.append(resources)
+    return _with_repeats(output, reports)
+
+
+def _demo_command(demo_file_path: str, repo_path: str, env: Optional[Dict[str, str]],
+                  cwd: Optional[str]):
+    """(command, working directory, full environment or None)."""
+    # Use sys.executable for 'python'; the demo sits in repo_path unless it runs from elsewhere
+    script = os.path.abspath(demo_file_path) if cwd else os.path.basename(demo_file_path)
+    if env:
+        merged = dict(os.environ)
+        for key, value in env.items():
+            # PYTHONPATH entries are added in front of the existing ones
+            if key == "PYTHONPATH" and merged.get(key):
+                value = value + os.pathsep + merged[key]
+            merged[key] = value
+        env = merged
+    return [sys.executable, script], cwd or repo_path, env
+
+
+def _with_repeats(output: Dict[str, Any], reports: list) -> Dict[str, Any]:
+    # Only runs that exited 0 are compared; a flaky rerun just ends the series
+    if len(reports) > 1:
+        output["repeats"] = summarize_runs(reports)
+        print(f"[EVALUATOR] {len(reports)} runs: wall time {output['repeats']['wall_time']['mean']}s "
+              f"± {output['repeats']['wall_time']['stdev']}s")
+    return output
+
+
+def _precheck_demo(demo_file_path: str):
+    """Syntax-error / missing-file results, or None if the demo can be run."""
     print(f"[EVALUATOR] Executing demo script: {os.path.basename(demo_file_path)}")
     
     # 1. Pre-Check for Syntax Error (Vital for score 1)
@@ -165,58 +301,46 @@ def execute_demo(demo_file_path: str, repo_path: str) -> Dict[str, Any]:
             "stderr": "Demo file not found for execution.",
             "run_time": 0.0,
         }
+    return None
 
-    # 2. Subprocess Execution
-    command = [sys.executable, os.path.basename(demo_file_path)] # Use sys.executable for 'python'
 
-    start_time = time.time()
-    
-    try:
-        result = subprocess.run(
-            command,
-            cwd=repo_path,
-            capture_output=True,
-            text=True,
-            timeout=MAX_EXECUTION_TIME,
-            check=False
-        )
-        end_time = time.time()
-        
-        execution_output = {
-            "status": "completed",
-            "exit_code": result.returncode,
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "run_time": round(end_time - start_time, 2),
-        }
+def _completed_output(result, resources: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "status": "completed",
+        "exit_code": result.returncode,
+        "stdout": result.stdout,
+        "stderr": result.stderr,
+        "run_time": round(resources["wall_time"], 2),
+        "resources": resources,
+    }
 
-    except subprocess.TimeoutExpired:
-        end_time = time.time()
-        execution_output = {
-            "status": "timeout",
-            "exit_code": 1,
-            "stdout": "",
-            "stderr": f"Execution timed out after {MAX_EXECUTION_TIME} seconds.",
-            "run_time": round(end_time - start_time, 2),
-        }
 
-    except Exception as e:
-        execution_output = {
-            "status": "error",
-            "exit_code": 1,
-            "stdout": "",
-            "stderr": f"Subprocess setup error: {str(e)}",
-            "run_time": 0.0,
-        }
+def _timeout_output(start_time: float) -> Dict[str, Any]:
+    end_time = time.time()
+    return {
+        "status": "timeout",
+        "exit_code": 1,
+        "stdout": "",
+        "stderr": f"Execution timed out after {MAX_EXECUTION_TIME} seconds.",
+        "run_time": round(end_time - start_time, 2),
+    }
 
-    return execution_output
+
+def _setup_error_output(error: Exception) -> Dict[str, Any]:
+    return {
+        "status": "error",
+        "exit_code": 1,
+        "stdout": "",
+        "stderr": f"Subprocess setup error: {str(error)}",
+        "run_time": 0.0,
+    }
 
 
 def evaluate_demo(demo_code: str, exec_results: Dict[str, Any]) -> Dict[str, Any]:
     """
     Applies the automated 5-point scoring system to the execution results.
     """
-    print("[EVALUATOR] Scoring demo execution (5 Binary Points)...")
+    print("[EVALUATOR] Scoring demo execution (5 Points)...")
     
     score_breakdown = {
         "syntax_error": 0,
@@ -241,10 +365,12 @@ def evaluate_demo(demo_code: str, exec_results: Dict[str, Any]) -> Dict[str, Any
     else:
         print(f"X Non-zero exit code or failed status: {exec_results['exit_code']} ({exec_results['status']}).")
 
-    # Check 3: Finishes within reasonable time
+    # Check 3: Performance, graded by wall time and peak memory
     if exec_results["run_time"] < MAX_EXECUTION_TIME and exec_results["status"] != "timeout":
-        score_breakdown["within_time"] = SCORE_RUN_TIME
-        print(f"O Completed within {MAX_EXECUTION_TIME}s ({exec_results['run_time']}s).")
+        score_breakdown["within_time"] = performance_score(exec_results)
+        print(f"O Completed within {MAX_EXECUTION_TIME}s ({exec_results['run_time']}s): "
+              f"{score_breakdown['within_time']} / {SCORE_RUN_TIME}.")
+        _print_resources(exec_results.get("resources"))
     else:
         print(f"X Execution time exceeded {MAX_EXECUTION_TIME}s or timed out.")
 
@@ -263,31 +389,103 @@ def evaluate_demo(demo_code: str, exec_results: Dict[str, Any]) -> Dict[str, Any
         print("X Errors detected in stderr.")
         print("   --- Stderr Output ---\n" + exec_results["stderr"].strip())
     
-    total_automated_score = sum(score_breakdown.values()) - score_breakdown["llm_qualitative"]
+    total_automated_score = round(sum(score_breakdown.values()) - score_breakdown["llm_qualitative"], 2)
 
     return {
         "total_automated_score": total_automated_score,
         "score_breakdown": score_breakdown
     }
 
-def run_evaluation_pipeline(demo_code: str, demo_file_path: str, repo_path: str, project_summary: Dict[str, Any]) -> Dict[str, Any]:
+def performance_score(exec_results: Dict[str, Any]) -> float:
+    """Fraction of SCORE_RUN_TIME earned by a run that finished in time."""
+    wall_time = exec_results["run_time"]
+    repeats = exec_results.get("repeats") or {}
+    if "wall_time" in repeats:
+        wall_time = repeats["wall_time"]["mean"]
+    score = next((fraction for limit, fraction in PERFORMANCE_TIERS if wall_time < limit), 0.0)
+
+    peak_rss_mb = (exec_results.get("resources") or {}).get("peak_rss_mb")
+    if peak_rss_mb is not None and peak_rss_mb > MAX_PEAK_RSS_MB:
+        score -= PEAK_RSS_PENALTY
+    return round(max(0.0, score) * SCORE_RUN_TIME, 2)
+
+
+def _print_resources(resources: Any) -> None:
+    if not resources or "cpu_time" not in resources:
+        return
+    print(f"   CPU {resources['cpu_time']}s (user {resources['user_time']}s, sys {resources['system_time']}s), "
+          f"peak RSS {resources['peak_rss_mb']} MB, "
+          f"I/O {resources['io_read_bytes']} B read / {resources['io_write_bytes']} B written, "
+          f"{resources.get('child_processes', 0)} child processes")
+
+
+def run_evaluation_pipeline(demo_code: str, demo_file_path: str, repo_path: str, project_summary: Dict[str, Any],
+                            install_deps: bool = True, fixups: bool = FIXUPS_ENABLED) -> Dict[str, Any]:
     """
     Runs the full execution and scoring sequence, including the LLM qualitative score.
+    Dependencies are installed in one pip call BEFORE the timed run, so
+    install time never counts against MAX_EXECUTION_TIME, into a folder of
+    repo_path that only the demo's PYTHONPATH sees.
+    A failed run goes through the fix-up rules (fixups.py) and the last
+    run is the one scored.
     """
-    exec_results = execute_demo(demo_file_path, repo_path)
+    install_report = install_dependencies(repo_path, demo_code) if install_deps else {"status": "disabled", "install_time": 0.0}
+
+    exec_results = execute_demo(demo_file_path, repo_path, env=deps_env(repo_path))
+    if fixups:
+        exec_results, demo_code = run_fixups(demo_code, demo_file_path, repo_path, exec_results, execute_demo)
     eval_results = evaluate_demo(demo_code, exec_results)
     
     # Step 3: Get LLM Qualitative Score (Out of 5)
-    llm_score = get_llm_qualitative_score(demo_code, exec_results, project_summary)
-    
-    final_total_score = eval_results["total_automated_score"] + llm_score
+    judge_input = _condense_for_judge(exec_results, project_summary)
+    llm_score = get_llm_qualitative_score(demo_code, exec_results, project_summary, judge_input)
+    return _combine_scores(install_report, exec_results, eval_results, llm_score, judge_input)
+
+
+async def run_evaluation_pipeline_async(demo_code: str, demo_file_path: str, repo_path: str,
+                                        project_summary: Dict[str, Any], install_deps: bool = True,
+                                        fixups: bool = FIXUPS_ENABLED) -> Dict[str, Any]:
+    """run_evaluation_pipeline() for run_pipeline_async(): pip, the demo and the judge never block a thread."""
+    if install_deps:
+        install_report = await install_dependencies_async(repo_path, demo_code)
+    else:
+        install_report = {"status": "disabled", "install_time": 0.0}
+
+    exec_results = await execute_demo_async(demo_file_path, repo_path, env=deps_env(repo_path))
+    if fixups:
+        exec_results, demo_code = await run_fixups_async(demo_code, demo_file_path, repo_path, exec_results,
+                                                         execute_demo_async)
+    eval_results = evaluate_demo(demo_code, exec_results)
+    judge_input = _condense_for_judge(exec_results, project_summary)
+    llm_score = await get_llm_qualitative_score_async(demo_code, exec_results, project_summary, judge_input)
+    return _combine_scores(install_report, exec_results, eval_results, llm_score, judge_input)
+
+
+def _condense_for_judge(exec_results: Dict[str, Any], project_summary: Dict[str, Any]) -> Dict[str, Any]:
+    judge_input = condense_judge_input(exec_results, project_summary)
+    print(f"[EVALUATOR] Judge input condensed: {judge_input['tokens_before']} -> "
+          f"{judge_input['tokens_after']} tokens (logs + summary).")
+    return judge_input
+
+
+def _combine_scores(install_report: Dict[str, Any], exec_results: Dict[str, Any],
+                    eval_results: Dict[str, Any], llm_score: int,
+                    judge_input: Dict[str, Any]) -> Dict[str, Any]:
+    final_total_score = round(eval_results["total_automated_score"] + llm_score, 2)
     eval_results["score_breakdown"]["llm_qualitative"] = llm_score
 
     print(f"[EVALUATOR] LLM Qualitative Score: {llm_score} / {MAX_LLM_QUALITATIVE_SCORE}")
     print(f"[EVALUATOR] TOTAL SCORE: {final_total_score} / {MAX_TOTAL_SCORE}")
 
     return {
+        "dependency_install": install_report,
         "execution_results": exec_results,
+        # What the judge saw, in tokens; the full logs stay in execution_results
+        "judge_input": {
+            "tokens_before": judge_input["tokens_before"],
+            "tokens_after": judge_input["tokens_after"],
+            "exception_type": judge_input["exception_type"],
+        },
         "evaluation_results": {
             "total_score": final_total_score,
             "total_automated_score": eval_results["total_automated_score"],
@@ -0,0 +1,337 @@
+"""
+fixups.py
+----------
+Rule-based repair of a failed demo run, before the LLM is asked.
+
+Responsibilities:
+- classify_failure(): match the final traceback of a failed run against
+  FIX_RULES; the first rule that matches wins
+- Local fixes for the mechanical failures:
+      cuda_on_cpu      CUDA device / driver errors → CPU-only env vars,
+                       and "cuda" device literals in the demo set to "cpu"
+      missing_module   ModuleNotFoundError for a module inside the repo
+                       (src/ layout, nested package) → PYTHONPATH entry;
+                       for a module in IMPORT_TO_DIST or the repo's
+                       declared requirements → pip install of its
+                       distribution into the job's deps target (never
+                       the server's interpreter); other names are left
+                       to the LLM repair
+      wrong_cwd        FileNotFoundError for a relative path that exists
+                       under another repo folder → run from that folder
+- run_fixups(): apply one fix, re-run the demo, repeat within
+  MAX_FIXUP_RUNS and FIXUP_TIME_BUDGET; the LLM repairs the demo only
+  when no rule matches (or the matching rule has nothing left to try)
+- run_fixups_async(): the same for run_pipeline_async()
+
+Fixes change the demo's environment, its working directory or the demo
+file; the repo's own files are never edited. The last run is the one
+that gets scored, and exec_results["fixups"] records how it got there.
+"""
+
+import importlib.util
+import os
+import re
+import subprocess
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from src.analysis.dependency_resolver import (SKIP_DIRS, declared_distributions, deps_target,
+                                              import_to_distribution, is_known_distribution,
+                                              pip_install_command)
+from src.demo.demo_generator import repair_demo, repair_demo_async
+from src.evaluation.log_condenser import condense_log, extract_traceback
+from src.jobs.async_runtime import run_blocking
+from src.jobs.deadline import run_subprocess, run_subprocess_async
+from src.llm.health import LLMSkipped
+
+FIXUPS_ENABLED = os.getenv("AUTOAGENT_FIXUPS", "1") != "0"
+MAX_FIXUP_RUNS = 3              # re-runs after the first failure
+FIXUP_TIME_BUDGET = 240.0       # seconds for all fixes and re-runs of one demo (pip included)
+LLM_REPAIRS = 1
+PIP_TIMEOUT = 300               # per install, and never more than what is left of FIXUP_TIME_BUDGET
+SEARCH_DEPTH = 3                # folder levels searched for modules and data files
+REPAIR_ERROR_TOKENS = 800
+
+# Hide every GPU from torch / TensorFlow / JAX
+CPU_ENV = {"CUDA_VISIBLE_DEVICES": "", "JAX_PLATFORMS": "cpu"}
+
+# (rule, pattern); matched against the final traceback, first match wins
+FIX_RULES: List[Tuple[str, "re.Pattern"]] = [
+    ("cuda_on_cpu", re.compile(
+        r"Torch not compiled with CUDA enabled|Found no NVIDIA driver|no CUDA-capable device"
+        r"|CUDA driver version is insufficient|NVIDIA driver on your system is too old"
+        r"|cudaGetDeviceCount|CUDA_ERROR_NO_DEVICE|Attempting to deserialize object on a CUDA device")),
+    ("missing_module", re.compile(r"ModuleNotFoundError: No module named '([\w.]+)'")),
+    ("wrong_cwd", re.compile(
+        r"(?:FileNotFoundError|OSError|IOError): \[Errno 2\] No such file or directory: '([^']+)'")),
+]
+
+_CUDA_LITERAL = re.compile(r"""(["'])cuda(?::\d+)?\1""")
+_CUDA_CALL = re.compile(r"\.cuda\(\)")
+
+
+def classify_failure(stderr: str) -> Optional[Tuple[str, "re.Match"]]:
+    """(rule name, match) for the first rule matching the failure, or None."""
+    traceback, _ = extract_traceback(stderr or "")
+    text = traceback or stderr or ""
+    for name, pattern in FIX_RULES:
+        match = pattern.search(text)
+        if match:
+            return name, match
+    return None
+
+
+# ------------------------------------------------------------
+# Repo search
+# ------------------------------------------------------------
+def _walk_dirs(repo_path: str) -> Iterator[str]:
+    """Folders of the repo, shallowest first, down to SEARCH_DEPTH levels."""
+    level = [repo_path]
+    for _ in range(SEARCH_DEPTH + 1):
+        next_level = []
+        for folder in level:
+            yield folder
+            try:
+                names = sorted(os.listdir(folder))
+            except OSError:
+                continue
+            next_level.extend(os.path.join(folder, name) for name in names
+                              if name not in SKIP_DIRS and not name.startswith(".")
+                              and os.path.isdir(os.path.join(folder, name)))
+        level = next_level
+
+
+def _module_folder(repo_path: str, module: str) -> Optional[str]:
+    """Folder that makes `module` importable when put on sys.path."""
+    for folder in _walk_dirs(repo_path):
+        package = os.path.join(folder, module)
+        if os.path.isfile(package + ".py") or os.path.isfile(os.path.join(package, "__init__.py")):
+            return folder
+    return None
+
+
+# ------------------------------------------------------------
+# Fix state and planning
+# ------------------------------------------------------------
+class _FixState:
+    """What has been changed so far for one demo."""
+
+    def __init__(self, demo_code: str, demo_file_path: str, repo_path: str, exec_results: Dict[str, Any]):
+        self.demo_code = demo_code
+        self.original_code = demo_code
+        self.demo_file_path = demo_file_path
+        self.repo_path = repo_path
+        self.pythonpath: List[str] = []
+        # The job's installed packages stay importable, behind any repo folder a fix adds
+        self.deps_target = deps_target(repo_path)
+        self.env: Dict[str, str] = {"PYTHONPATH": self.deps_target}
+        self.cwd: Optional[str] = None
+        self.installed: List[str] = []
+        self._declared: Optional[Set[str]] = None
+        self.repairs = 0
+        self.runs = 0
+        self.started = time.monotonic()
+        self.applied: List[Dict[str, Any]] = []
+        _, exception = extract_traceback(exec_results.get("stderr") or "")
+        self.report = {"initial_exit_code": exec_results.get("exit_code"),
+                       "initial_exception": exception or exec_results.get("status")}
+
+    def within_budget(self) -> bool:
+        return self.runs < MAX_FIXUP_RUNS and time.monotonic() - self.started < FIXUP_TIME_BUDGET
+
+    def pip_timeout(self) -> float:
+        return max(1.0, min(PIP_TIMEOUT, FIXUP_TIME_BUDGET - (time.monotonic() - self.started)))
+
+    def declared(self) -> Set[str]:
+        # Parsed on first use: most failures never get to a pip install
+        if self._declared is None:
+            self._declared = declared_distributions(self.repo_path)
+        return self._declared
+
+    def apply(self, fix: Dict[str, Any]) -> None:
+        if fix.get("demo_code") is not None:
+            self.demo_code = fix["demo_code"]
+            with open(self.demo_file_path, "w", encoding="utf-8") as f:
+                f.write(self.demo_code)
+        if fix.get("pythonpath"):
+            self.pythonpath.append(fix["pythonpath"])
+            self.env["PYTHONPATH"] = os.pathsep.join(self.pythonpath + [self.deps_target])
+        self.env.update(fix.get("env") or {})
+        if fix.get("cwd"):
+            self.cwd = fix["cwd"]
+
+    def record(self, fix: Dict[str, Any], exit_code: Optional[int]) -> None:
+        self.applied.append({"rule": fix["rule"], "detail": fix["detail"], "exit_code": exit_code})
+        outcome = "failed" if exit_code is None else f"exit code {exit_code}"
+        print(f"[FIXUP] {fix['rule']}: {fix['detail']} → {outcome}")
+
+    def finish(self, exec_results: Dict[str, Any]) -> Dict[str, Any]:
+        exec_results["fixups"] = {
+            **self.report,
+            "runs": self.runs,
+            "fixed": exec_results.get("exit_code") == 0,
+            "applied": self.applied,
+        }
+        if self.demo_code != self.original_code:
+            exec_results["fixups"]["demo_code"] = self.demo_code
+        return exec_results
+
+
+def _plan_cuda_on_cpu(state: _FixState, match) -> Optional[Dict[str, Any]]:
+    code = _CUDA_CALL.sub(".cpu()", _CUDA_LITERAL.sub('"cpu"', state.demo_code))
+    env_missing = any(state.env.get(key) != value for key, value in CPU_ENV.items())
+    if not env_missing and code == state.demo_code:
+        return None   # the CUDA use is inside the repo's code
+    detail = "CPU-only env vars" + (", cuda device literals set to cpu" if code != state.demo_code else "")
+    return {"rule": "cuda_on_cpu", "detail": detail, "env": CPU_ENV,
+            "demo_code": code if code != state.demo_code else None}
+
+
+def _plan_missing_module(state: _FixState, match) -> Optional[Dict[str, Any]]:
+    module = match.group(1).split(".")[0]
+    folder = _module_folder(state.repo_path, module)
+    if folder is not None:
+        if folder in state.pythonpath:
+            return None
+        rel = os.path.relpath(folder, state.repo_path)
+        return {"rule": "missing_module", "detail": f"added {rel} to PYTHONPATH for '{module}'", "pythonpath": folder}
+    if importlib.util.find_spec(module) is not None:
+        return None   # installed; it's a submodule or an import inside the package that fails
+    if not is_known_distribution(module, state.declared()):
+        return None   # a name from a traceback is not a package to fetch from PyPI
+    distribution = import_to_distribution(module)
+    if distribution in state.installed:
+        return None
+    return {"rule": "missing_module", "detail": f"pip install {distribution}", "install": distribution}
+
+
+def _plan_wrong_cwd(state: _FixState, match) -> Optional[Dict[str, Any]]:
+    missing = match.group(1)
+    if os.path.isabs(missing):
+        return None
+    current = state.cwd or state.repo_path
+    for folder in _walk_dirs(state.repo_path):
+        if folder != current and os.path.exists(os.path.join(folder, missing)):
+            rel = os.path.relpath(folder, state.repo_path)
+            return {"rule": "wrong_cwd", "detail": f"run from {rel}, where '{missing}' exists", "cwd": folder}
+    return None
+
+
+_PLANNERS: Dict[str, Callable[[_FixState, Any], Optional[Dict[str, Any]]]] = {
+    "cuda_on_cpu": _plan_cuda_on_cpu,
+    "missing_module": _plan_missing_module,
+    "wrong_cwd": _plan_wrong_cwd,
+}
+
+
+def _next_fix(state: _FixState, exec_results: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The next local fix, an LLM repair when no rule helps, or None to stop."""
+    classified = classify_failure(exec_results.get("stderr") or "")
+    if classified is not None:
+        fix = _PLANNERS[classified[0]](state, classified[1])
+        if fix is not None:
+            return fix
+    if state.repairs >= LLM_REPAIRS:
+        return None
+    reason = f"no rule for {classified[0]} left to try" if classified else "no rule matched"
+    return {"rule": "llm_repair", "detail": reason, "repair": True}
+
+
+def _fixable(exec_results: Dict[str, Any]) -> bool:
+    # Timeouts and setup errors are about the host, not the demo
+    return exec_results.get("exit_code") != 0 and exec_results.get("status") in ("completed", "syntax_error")
+
+
+def _error_excerpt(exec_results: Dict[str, Any]) -> str:
+    return condense_log(exec_results.get("stderr") or "", REPAIR_ERROR_TOKENS)
+
+
+def _pip_command(state: _FixState, distribution: str) -> List[str]:
+    return pip_install_command([distribution], state.deps_target)
+
+
+# ------------------------------------------------------------
+# Loops
+# ------------------------------------------------------------
+def run_fixups(demo_code: str, demo_file_path: str, repo_path: str, exec_results: Dict[str, Any],
+               execute: Callable[..., Dict[str, Any]]) -> Tuple[Dict[str, Any], str]:
+    """
+    Fix and re-run a failed demo. `execute` is execute_demo().
+
+    Returns (results of the last run, demo code of the last run).
+    """
+    if not _fixable(exec_results):
+        return exec_results, demo_code
+    state = _FixState(demo_code, demo_file_path, repo_path, exec_results)
+    while state.within_budget():
+        fix = _next_fix(state, exec_results)
+        if fix is None:
+            break
+        if fix.get("repair"):
+            state.repairs += 1
+            try:
+                fix["demo_code"] = repair_demo(state.demo_code, _error_excerpt(exec_results))
+            except LLMSkipped as e:
+                print(f"[FIXUP] {e}")
+                break
+            except Exception as e:
+                print(f"[FIXUP] LLM repair failed: {e}")
+                break
+        if fix.get("install"):
+            state.installed.append(fix["install"])
+            try:
+                installed = run_subprocess(_pip_command(state, fix["install"]),
+                                           timeout=state.pip_timeout()).returncode == 0
+            except subprocess.TimeoutExpired:
+                installed = False
+            if not installed:
+                state.record(fix, None)
+                continue
+        state.apply(fix)
+        state.runs += 1
+        exec_results = execute(state.demo_file_path, state.repo_path, env=state.env, cwd=state.cwd)
+        state.record(fix, exec_results.get("exit_code"))
+        if not _fixable(exec_results):
+            break
+    return state.finish(exec_results), state.demo_code
+
+
+async def run_fixups_async(demo_code: str, demo_file_path: str, repo_path: str, exec_results: Dict[str, Any],
+                           execute: Callable[..., Any]) -> Tuple[Dict[str, Any], str]:
+    """run_fixups() for run_pipeline_async(); `execute` is execute_demo_async()."""
+    if not _fixable(exec_results):
+        return exec_results, demo_code
+    state = _FixState(demo_code, demo_file_path, repo_path, exec_results)
+    while state.within_budget():
+        # Planning walks the repo: keep it off the event loop
+        fix = await run_blocking(_next_fix, state, exec_results)
+        if fix is None:
+            break
+        if fix.get("repair"):
+            state.repairs += 1
+            try:
+                fix["demo_code"] = await repair_demo_async(state.demo_code, _error_excerpt(exec_results))
+            except LLMSkipped as e:
+                print(f"[FIXUP] {e}")
+                break
+            except Exception as e:
+                print(f"[FIXUP] LLM repair failed: {e}")
+                break
+        if fix.get("install"):
+            state.installed.append(fix["install"])
+            try:
+                result = await run_subprocess_async(_pip_command(state, fix["install"]),
+                                                    timeout=state.pip_timeout())
+                installed = result.returncode == 0
+            except subprocess.TimeoutExpired:
+                installed = False
+            if not installed:
+                state.record(fix, None)
+                continue
+        state.apply(fix)
+        state.runs += 1
+        exec_results = await execute(state.demo_file_path, state.repo_path, env=state.env, cwd=state.cwd)
+        state.record(fix, exec_results.get("exit_code"))
+        if not _fixable(exec_results):
+            break
+    return state.finish(exec_results), state.demo_code
@@ -0,0 +1,212 @@
+"""
+log_condenser.py
+-----------------
+Shrink demo logs and the scan summary to what the LLM judge needs.
+
+Responsibilities:
+- condense_log(): collapse progress bars (\\r redraws, tqdm / pip / keras
+  bars), fold repeated and near-identical lines, keep the final traceback
+  whole, and fill the rest of the budget with head and tail slices
+- extract_traceback(): the last traceback in a log and its exception type
+- compact_summary(): only the scan fields the judging rubric looks at
+- condense_judge_input(): all of the above for one evaluation, within
+  JUDGE_INPUT_TOKENS, with token counts before and after
+
+A chatty demo or a pip log can be megabytes; the judge only needs to see
+what the demo printed, how it failed, and what the project looks like.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.llm.tokens import CHARS_PER_TOKEN, estimate_tokens, truncate_to_tokens
+
+# Token budget for stdout + stderr + summary in one judge prompt
+JUDGE_INPUT_TOKENS = 2000
+STDERR_SHARE = 0.45
+STDOUT_SHARE = 0.35             # the summary gets the rest
+HEAD_SHARE = 0.35               # of what is left after the traceback; the tail gets the rest
+MIN_RUN_TO_FOLD = 3             # shorter runs of similar lines are kept as they are
+SUMMARY_LIST_LIMIT = 10
+
+# Rubric: relevance (does the demo use the project?), completeness (setup, inputs)
+SUMMARY_FIELDS = ("num_files", "languages", "entrypoints", "demos", "configs", "models")
+
+_PROGRESS = re.compile(
+    r"\d+%\|"                                   # tqdm
+    r"|\|[█▉▊▋▌▍▎▏ #=>-]{5,}\|"                 # bars drawn between pipes
+    r"|\[[=>.\- ]{5,}\]"                        # [=====>    ] keras / wget
+    r"|[━─]{5,}"                                # pip / rich
+    r"|\d+(?:\.\d+)?\s*[kMG]?i?B/s"             # transfer rates
+    r"|\d+(?:\.\d+)?\s*(?:it|s)/(?:s|it)\b"     # it/s, s/it
+)
+_NUMBER = re.compile(r"\d+(?:\.\d+)?(?:e[-+]?\d+)?")
+_TRACEBACK_START = "Traceback (most recent call last):"
+_EXCEPTION_LINE = re.compile(r"^([A-Za-z_][\w.]*)(?::|$)")
+
+
+# ------------------------------------------------------------
+# Line-level cleanup
+# ------------------------------------------------------------
+def _final_lines(text: str) -> List[str]:
+    # A progress bar redraws itself with \r: only its last state was ever visible
+    return [line.rsplit("\r", 1)[-1].rstrip() for line in text.replace("\r\n", "\n").split("\n")]
+
+
+def _shape(line: str) -> str:
+    """Line with its numbers masked: 'epoch 3 loss 0.12' and 'epoch 4 loss 0.10' look alike."""
+    return _NUMBER.sub("#", line)
+
+
+def collapse_lines(lines: List[str]) -> List[str]:
+    """Fold progress bars and runs of identical / near-identical lines."""
+    out: List[str] = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if _PROGRESS.search(line):
+            j = i
+            while j + 1 < len(lines) and _PROGRESS.search(lines[j + 1]):
+                j += 1
+            if j > i:
+                out.append(f"[... {j - i} progress lines ...]")
+            out.append(lines[j])
+            i = j + 1
+            continue
+
+        shape = _shape(line)
+        j = i
+        while j + 1 < len(lines) and _shape(lines[j + 1]) == shape:
+            j += 1
+        run = j - i + 1
+        if run >= MIN_RUN_TO_FOLD:
+            if all(other == line for other in lines[i:j + 1]):
+                out.append(f"{line}  [repeated {run}x]")
+            else:
+                out.extend([line, f"[... {run - 2} similar lines ...]", lines[j]])
+        else:
+            out.extend(lines[i:j + 1])
+        i = j + 1
+    return out
+
+
+# ------------------------------------------------------------
+# Tracebacks
+# ------------------------------------------------------------
+def _find_traceback(text: str) -> Tuple[int, int, Optional[str]]:
+    """(start, end, exception type) of the last traceback; start is -1 if there is none."""
+    start = text.rfind(_TRACEBACK_START)
+    if start < 0:
+        return -1, -1, None
+    lines = text[start:].split("\n")
+    end, exception_line = len(lines), ""
+    for i, line in enumerate(lines[1:], start=1):
+        # Frames are indented; the exception is the first unindented line after them
+        if line and not line[0].isspace():
+            exception_line, end = line, i + 1
+            # Multi-line messages stay attached
+            while end < len(lines) and lines[end].startswith(" "):
+                end += 1
+            break
+    match = _EXCEPTION_LINE.match(exception_line)
+    return start, start + len("\n".join(lines[:end])), match.group(1) if match else None
+
+
+def extract_traceback(text: str) -> Tuple[str, Optional[str]]:
+    """(last traceback block, exception type), or ("", None) if the log has none."""
+    start, end, exception_type = _find_traceback(text)
+    return (text[start:end].rstrip(), exception_type) if start >= 0 else ("", None)
+
+
+def _head_and_tail(lines: List[str], max_tokens: int) -> str:
+    text = "\n".join(lines)
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    head = truncate_to_tokens(text, int(max_tokens * HEAD_SHARE))
+    tail_budget = max_tokens - estimate_tokens(head)
+    # Keep whole lines from the end until the tail budget is used up
+    tail: List[str] = []
+    used = 0
+    for line in reversed(lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > tail_budget:
+            break
+        tail.append(line)
+        used += cost
+    tail.reverse()
+    omitted = len(lines) - head.count("\n") - 1 - len(tail)
+    return f"{head}\n[... {max(omitted, 0)} lines omitted ...]\n" + "\n".join(tail)
+
+
+def condense_log(text: str, max_tokens: int) -> str:
+    """`text` cut down to about `max_tokens`, keeping the final traceback whole when it fits."""
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text or ""
+    start, end, _ = _find_traceback(text)
+    if start < 0:
+        return _head_and_tail(collapse_lines(_final_lines(text)), max_tokens)
+
+    traceback = text[start:end].rstrip()
+    # Deep tracebacks (recursion, framework stacks): the last frames matter most
+    traceback_tokens = min(estimate_tokens(traceback), max_tokens // 2)
+    if estimate_tokens(traceback) > traceback_tokens:
+        traceback = "[... earlier frames omitted ...]\n" + traceback[-traceback_tokens * CHARS_PER_TOKEN:]
+    # Output around the traceback shares what is left; anything after it is usually short
+    remaining = max_tokens - traceback_tokens
+    after = _head_and_tail(collapse_lines(_final_lines(text[end:])), remaining // 4) if text[end:].strip() else ""
+    before = _head_and_tail(collapse_lines(_final_lines(text[:start])), remaining - estimate_tokens(after))
+    return "\n".join(part for part in (before.strip(), traceback, after.strip()) if part)
+
+
+# ------------------------------------------------------------
+# Scan summary
+# ------------------------------------------------------------
+def compact_summary(project_summary: Any) -> Dict[str, Any]:
+    """The rubric's fields of a ScanReport (or its dict), long lists cut to SUMMARY_LIST_LIMIT."""
+    summary = project_summary.to_dict() if hasattr(project_summary, "to_dict") else dict(project_summary or {})
+    compact = {}
+    for field in SUMMARY_FIELDS:
+        value = summary.get(field)
+        if isinstance(value, list) and len(value) > SUMMARY_LIST_LIMIT:
+            value = value[:SUMMARY_LIST_LIMIT] + [f"... {len(value) - SUMMARY_LIST_LIMIT} more"]
+        if value not in (None, []):
+            compact[field] = value
+    return compact
+
+
+def condense_judge_input(exec_results: Dict[str, Any], project_summary: Any,
+                         max_tokens: int = JUDGE_INPUT_TOKENS) -> Dict[str, Any]:
+    """
+    stdout, stderr and summary for the judge prompt, within `max_tokens`.
+
+    Returns {"stdout", "stderr", "summary", "exception_type",
+             "tokens_before", "tokens_after"}
+    """
+    stdout, stderr = exec_results.get("stdout") or "", exec_results.get("stderr") or ""
+    full_summary = project_summary.to_dict() if hasattr(project_summary, "to_dict") else project_summary
+    tokens_before = (estimate_tokens(stdout) + estimate_tokens(stderr)
+                     + estimate_tokens(json.dumps(full_summary, indent=2, default=str)))
+
+    summary = json.dumps(compact_summary(project_summary))
+    summary_budget = max_tokens - int(max_tokens * STDERR_SHARE) - int(max_tokens * STDOUT_SHARE)
+    summary = truncate_to_tokens(summary, summary_budget)
+    # Whatever one log doesn't need, the other can use
+    stderr_budget = int(max_tokens * STDERR_SHARE) + max(0, summary_budget - estimate_tokens(summary))
+    stdout_budget = int(max_tokens * STDOUT_SHARE)
+    if estimate_tokens(stderr) < stderr_budget:
+        stdout_budget += stderr_budget - estimate_tokens(stderr)
+    elif estimate_tokens(stdout) < stdout_budget:
+        stderr_budget += stdout_budget - estimate_tokens(stdout)
+
+    condensed_stdout = condense_log(stdout, stdout_budget)
+    condensed_stderr = condense_log(stderr, stderr_budget)
+    _, exception_type = extract_traceback(stderr)
+    return {
+        "stdout": condensed_stdout,
+        "stderr": condensed_stderr,
+        "summary": summary,
+        "exception_type": exception_type,
+        "tokens_before": tokens_before,
+        "tokens_after": estimate_tokens(condensed_stdout) + estimate_tokens(condensed_stderr) + estimate_tokens(summary),
+    }
@@ -0,0 +1,307 @@
+"""
+resource_monitor.py
+--------------------
+Measure what a demo run costs, not just whether it finished in time.
+
+Responsibilities:
+- run_measured(): run a command in its own process group (same timeout,
+  deadline and kill semantics as run_subprocess()) and return its result
+  together with a resource report
+- run_measured_async(): the same for run_pipeline_async(); the event loop
+  polls the process instead of a thread blocking on it
+- summarize_runs(): mean / stdev / min / max over repeated runs
+
+The report combines two sources:
+- wait4() rusage of the demo process: user/system CPU time, peak RSS and
+  block I/O, including every descendant it waited for
+- /proc samples of the whole process group every SAMPLE_INTERVAL: peak
+  RSS of all processes together, how many processes were spawned and how
+  many ran at once, and bytes read/written through syscalls
+
+Without /proc (macOS) only the rusage part is filled in; without wait4()
+(Windows) only the wall time. If something else reaped the demo first,
+the rusage part is missing and the report falls back to the samples.
+"""
+
+import asyncio
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.jobs.deadline import budget, current_deadline, run_subprocess
+
+SAMPLE_INTERVAL = 0.1           # seconds between /proc samples (also the exit-poll interval)
+PROC_ROOT = "/proc"
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+BLOCK_SIZE = 512                # ru_inblock / ru_oublock unit
+MEASUREMENT_SUPPORTED = hasattr(os, "wait4")
+
+
+# ------------------------------------------------------------
+# /proc sampling
+# ------------------------------------------------------------
+def _read_group(pgid: int) -> Dict[int, int]:
+    """{pid: RSS in bytes} of the live processes in a process group."""
+    processes = {}
+    try:
+        names = os.listdir(PROC_ROOT)
+    except OSError:
+        return processes
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(os.path.join(PROC_ROOT, name, "stat"), "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue   # exited between listdir and open
+        # The command name can contain spaces and parentheses: split after the last ')'
+        fields = stat[stat.rfind(b")") + 2:].split()
+        if len(fields) < 22 or int(fields[2]) != pgid or fields[0] == b"Z":
+            continue
+        processes[int(name)] = int(fields[21]) * PAGE_SIZE
+    return processes
+
+
+def _read_io_chars(pid: int) -> Optional[Tuple[int, int]]:
+    """(rchar, wchar) of a process: bytes passed to read/write calls, cache hits included."""
+    try:
+        with open(os.path.join(PROC_ROOT, str(pid), "io")) as f:
+            values = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(values["rchar"]), int(values["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class _Measurement:
+    """One monitored run: spawn, sample, reap with wait4()."""
+
+    def __init__(self, command: List[str], timeout: Optional[float], cwd: Optional[str],
+                 env: Optional[Dict[str, str]]):
+        # Output goes to files, so nothing has to drain pipes while we poll
+        self.stdout_file = tempfile.TemporaryFile()
+        self.stderr_file = tempfile.TemporaryFile()
+        self.timeout = timeout
+        self.timed_out = False
+        self.rusage = None
+        self.peak_group_rss = 0
+        self.max_processes = 0
+        self.samples = 0
+        self.seen_pids = set()
+        self.io_chars: Dict[int, Tuple[int, int]] = {}
+        self.sampling = os.path.isdir(PROC_ROOT)
+        self.started = time.monotonic()
+        try:
+            self.process = subprocess.Popen(command, cwd=cwd, env=env, stdout=self.stdout_file,
+                                            stderr=self.stderr_file, start_new_session=True)
+        except BaseException:
+            self.close()
+            raise
+        self.wall_time = 0.0
+
+    def poll(self) -> bool:
+        """Take one sample; True once the command has exited and been reaped."""
+        if self.sampling:
+            self._sample()
+        try:
+            pid, status, rusage = os.wait4(self.process.pid, os.WNOHANG)
+        except ChildProcessError:
+            self._reaped_elsewhere()
+            return True
+        if pid:
+            self._reaped(status, rusage)
+            return True
+        if self.timeout is not None and time.monotonic() - self.started >= self.timeout:
+            self.timed_out = True
+            self.kill()
+            return True
+        return False
+
+    def _sample(self) -> None:
+        group = _read_group(self.process.pid)
+        self.samples += 1
+        self.seen_pids.update(group)
+        self.peak_group_rss = max(self.peak_group_rss, sum(group.values()))
+        self.max_processes = max(self.max_processes, len(group))
+        for pid in group:
+            chars = _read_io_chars(pid)
+            if chars is not None:
+                self.io_chars[pid] = chars
+
+    def _reaped(self, status: int, rusage) -> None:
+        self.wall_time = time.monotonic() - self.started
+        self.rusage = rusage
+        # Popen must not waitpid() a pid we already reaped
+        self.process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        self.kill_group()   # background processes the demo left behind don't outlive the run
+
+    def _reaped_elsewhere(self) -> None:
+        # Someone else (a Popen.poll() elsewhere) collected the exit status and the rusage with it
+        self.wall_time = time.monotonic() - self.started
+        self.rusage = None
+        if self.process.returncode is None:
+            self.process.returncode = -signal.SIGKILL
+        self.kill_group()
+
+    def kill_group(self) -> None:
+        """SIGKILL the process group. Never reaps, so it is safe from a deadline's cancel thread."""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def kill(self) -> None:
+        if self.process.returncode is not None:
+            return
+        self.kill_group()
+        try:
+            _, status, rusage = os.wait4(self.process.pid, 0)
+        except ChildProcessError:
+            self._reaped_elsewhere()
+            return
+        self._reaped(status, rusage)
+
+    def result(self, command: List[str], text: bool) -> subprocess.CompletedProcess:
+        stdout, stderr = self._read(self.stdout_file), self._read(self.stderr_file)
+        if text:
+            stdout = stdout.decode("utf-8", errors="replace")
+            stderr = stderr.decode("utf-8", errors="replace")
+        return subprocess.CompletedProcess(command, self.process.returncode, stdout, stderr)
+
+    @staticmethod
+    def _read(f) -> bytes:
+        f.seek(0)
+        return f.read()
+
+    def close(self) -> None:
+        self.stdout_file.close()
+        self.stderr_file.close()
+
+    def report(self) -> Dict[str, Any]:
+        usage = self.rusage
+        if usage is None:
+            report = {"wall_time": round(self.wall_time, 3)}
+            if self.peak_group_rss:
+                report["peak_rss_mb"] = round(self.peak_group_rss / 2 ** 20, 1)
+            return self._with_samples(report)
+        # ru_maxrss is KiB on Linux, bytes on macOS; it is the largest single process
+        maxrss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+        cpu_time = usage.ru_utime + usage.ru_stime
+        report = {
+            "wall_time": round(self.wall_time, 3),
+            "user_time": round(usage.ru_utime, 3),
+            "system_time": round(usage.ru_stime, 3),
+            "cpu_time": round(cpu_time, 3),
+            "cpu_utilization": round(cpu_time / self.wall_time, 2) if self.wall_time > 0 else 0.0,
+            "peak_rss_mb": round(max(maxrss, self.peak_group_rss) / 2 ** 20, 1),
+            "io_read_bytes": usage.ru_inblock * BLOCK_SIZE,
+            "io_write_bytes": usage.ru_oublock * BLOCK_SIZE,
+        }
+        return self._with_samples(report)
+
+    def _with_samples(self, report: Dict[str, Any]) -> Dict[str, Any]:
+        if self.sampling:
+            report.update({
+                # Sampled: processes shorter than SAMPLE_INTERVAL can be missed
+                "child_processes": len(self.seen_pids - {self.process.pid}),
+                "max_concurrent_processes": self.max_processes,
+                "io_read_chars": sum(chars[0] for chars in self.io_chars.values()),
+                "io_write_chars": sum(chars[1] for chars in self.io_chars.values()),
+                "samples": self.samples,
+            })
+        return report
+
+
+# ------------------------------------------------------------
+# Runners
+# ------------------------------------------------------------
+def run_measured(command: List[str], timeout: Optional[float] = None, cwd: Optional[str] = None,
+                 env: Optional[Dict[str, str]] = None,
+                 text: bool = True) -> Tuple[subprocess.CompletedProcess, Dict[str, Any]]:
+    """
+    run_subprocess() plus a resource report: (result, report).
+
+    Raises subprocess.TimeoutExpired / DeadlineExceeded like run_subprocess().
+    """
+    if not MEASUREMENT_SUPPORTED:
+        return _run_unmeasured(command, timeout, cwd, env, text)
+
+    deadline = current_deadline()
+    measurement = _Measurement(command, budget(timeout), cwd, env)
+    hook = deadline.add_cancel_hook(measurement.kill_group) if deadline is not None else None
+    try:
+        while not measurement.poll():
+            time.sleep(SAMPLE_INTERVAL)
+        return _finish(measurement, command, text)
+    except BaseException:
+        measurement.kill()
+        raise
+    finally:
+        if hook is not None:
+            deadline.remove_cancel_hook(hook)
+        measurement.close()
+
+
+async def run_measured_async(command: List[str], timeout: Optional[float] = None, cwd: Optional[str] = None,
+                             env: Optional[Dict[str, str]] = None,
+                             text: bool = True) -> Tuple[subprocess.CompletedProcess, Dict[str, Any]]:
+    """run_measured() for coroutines: the process is polled between awaits, no thread is held."""
+    if not MEASUREMENT_SUPPORTED:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, _run_unmeasured, command, timeout, cwd, env, text)
+
+    deadline = current_deadline()
+    measurement = _Measurement(command, budget(timeout), cwd, env)
+    hook = deadline.add_cancel_hook(measurement.kill_group) if deadline is not None else None
+    try:
+        while not measurement.poll():
+            await asyncio.sleep(SAMPLE_INTERVAL)
+        return _finish(measurement, command, text)
+    except BaseException:   # includes the task being cancelled
+        measurement.kill()
+        raise
+    finally:
+        if hook is not None:
+            deadline.remove_cancel_hook(hook)
+        measurement.close()
+
+
+def _finish(measurement: _Measurement, command: List[str],
+            text: bool) -> Tuple[subprocess.CompletedProcess, Dict[str, Any]]:
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.check()   # the job's budget ran out or cancel() killed the run
+    if measurement.timed_out:
+        raise subprocess.TimeoutExpired(command, measurement.timeout)
+    return measurement.result(command, text), measurement.report()
+
+
+def _run_unmeasured(command, timeout, cwd, env, text) -> Tuple[subprocess.CompletedProcess, Dict[str, Any]]:
+    started = time.monotonic()
+    result = run_subprocess(command, timeout=timeout, cwd=cwd, env=env, text=text)
+    return result, {"wall_time": round(time.monotonic() - started, 3)}
+
+
+# ------------------------------------------------------------
+# Repeated runs
+# ------------------------------------------------------------
+def summarize_runs(reports: List[Dict[str, Any]],
+                   metrics: Tuple[str, ...] = ("wall_time", "cpu_time", "peak_rss_mb")) -> Dict[str, Any]:
+    """Spread of each metric over several runs of the same command."""
+    summary: Dict[str, Any] = {"runs": len(reports)}
+    for metric in metrics:
+        values = [report[metric] for report in reports if metric in report]
+        if not values:
+            continue
+        summary[metric] = {
+            "mean": round(statistics.mean(values), 3),
+            "stdev": round(statistics.stdev(values), 3) if len(values) > 1 else 0.0,
+            "min": min(values),
+            "max": max(values),
+        }
+    return summary
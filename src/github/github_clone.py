@@ -5,8 +5,11 @@ Handles cloning of GitHub repositories.
 
 Responsibilities:
 - Clone a GitHub repo into ./ImportedProjects/<repo_name>
+  (or into a target folder chosen by the workspace manager)
 - Handle cases where the repo already exists (overwrite or skip)
 - Return the local filesystem path to the cloned repo
+- Look up a repo's size before cloning (to pick disk vs tmpfs)
+- clone_repository_async() for run_pipeline_async() (asyncio subprocess)
 
 This file must only do:
     repo_url -> local_path
@@ -14,41 +17,80 @@ No scanning, no analysis.
 """
 import os
 import shutil
-from git import Repo
+from typing import Optional
 
-def clone_repository(repo_url: str, base_folder: str = "ImportedProjects") -> str:
+import requests
+
+from src.jobs.deadline import budget, run_subprocess, run_subprocess_async
+
+CLONE_TIMEOUT = 600  # seconds, further capped by the job deadline
+GITHUB_API = "https://api.github.com/repos"
+SIZE_LOOKUP_TIMEOUT = 5
+
+def clone_repository(repo_url: str, base_folder: str = "ImportedProjects",
+                     target_folder: Optional[str] = None) -> str:
     """
     Returns: Local path to the cloned repository
     Exception: If cloning fails
     """
-    print(f"[CLONING] Starting clone of: {repo_url}")
-    
-    repo_name = _extract_repo_name(repo_url)
-    
-    # Create base folder if it doesn't exist
-    os.makedirs(base_folder, exist_ok=True)
-    
-    # Generate unique folder name
-    target_folder = _generate_unique_folder(base_folder, repo_name)
-    
-    print(f"[CLONING] Cloning into: {target_folder}")
+    target_folder = _resolve_target(repo_url, base_folder, target_folder)
     
     try:
-        # Clone the repository
-        Repo.clone_from(repo_url, target_folder)
+        # Clone the repository (git runs in its own process group so a deadline can kill it)
+        result = run_subprocess(["git", "clone", "--quiet", repo_url, target_folder], timeout=CLONE_TIMEOUT)
+        return _check_clone(result, target_folder)
         
-        print(f"[CLONING] Successfully cloned to {target_folder}")
-        return target_folder
+    except BaseException as e:
+        _clone_failed(e, repo_url, target_folder)
+
+
+async def clone_repository_async(repo_url: str, base_folder: str = "ImportedProjects",
+                                 target_folder: Optional[str] = None) -> str:
+    """clone_repository() without blocking a thread while git runs."""
+    target_folder = _resolve_target(repo_url, base_folder, target_folder)
+    try:
+        result = await run_subprocess_async(["git", "clone", "--quiet", repo_url, target_folder],
+                                            timeout=CLONE_TIMEOUT)
+        return _check_clone(result, target_folder)
+    except BaseException as e:   # includes the task being cancelled
+        _clone_failed(e, repo_url, target_folder)
+
+
+def _resolve_target(repo_url: str, base_folder: str, target_folder: Optional[str]) -> str:
+    print(f"[CLONING] Starting clone of: {repo_url}")
+    
+    if target_folder is None:
+        repo_name = extract_repo_name(repo_url)
         
-    except Exception as e:
-        # Clean up partial clone if it failed
-        if os.path.exists(target_folder):
-            shutil.rmtree(target_folder)
+        # Create base folder if it doesn't exist
+        os.makedirs(base_folder, exist_ok=True)
         
-        raise Exception(f"[CLONING] Failed to clone {repo_url}: {e}")
+        # Generate unique folder name
+        target_folder = _generate_unique_folder(base_folder, repo_name)
+    
+    print(f"[CLONING] Cloning into: {target_folder}")
+    return target_folder
+
+
+def _check_clone(result, target_folder: str) -> str:
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"git exited with code {result.returncode}")
+    
+    print(f"[CLONING] Successfully cloned to {target_folder}")
+    return target_folder
+
+
+def _clone_failed(error: BaseException, repo_url: str, target_folder: str) -> None:
+    # Clean up partial clone if it failed (or the job ran out of time)
+    if os.path.exists(target_folder):
+        shutil.rmtree(target_folder)
+    if not isinstance(error, Exception):
+        raise error
+    
+    raise Exception(f"[CLONING] Failed to clone {repo_url}: {error}")
 
 
-def _extract_repo_name(repo_url: str) -> str:
+def extract_repo_name(repo_url: str) -> str:
     # Remove trailing .git if present
     url = repo_url.rstrip('/')
     if url.endswith('.git'):
@@ -78,4 +120,29 @@ def _generate_unique_folder(base_folder: str, repo_name: str) -> str:
         target = os.path.join(base_folder, f"{repo_name}_{counter}")
         if not os.path.exists(target):
             return target
-        counter += 1
\ No newline at end of file
+        counter += 1
+
+
+def remote_repo_size(repo_url: str) -> Optional[int]:
+    """
+    Size in bytes reported by the GitHub API (None if unknown).
+    Unauthenticated calls are rate limited; set GITHUB_TOKEN to raise the limit.
+    """
+    url = repo_url.rstrip("/")
+    if url.endswith(".git"):
+        url = url[:-4]
+    parts = url.split("github.com/", 1)[-1].split("/")
+    if len(parts) < 2:
+        return None
+
+    headers = {"Accept": "application/vnd.github+json"}
+    if os.getenv("GITHUB_TOKEN"):
+        headers["Authorization"] = f"Bearer {os.getenv('GITHUB_TOKEN')}"
+    try:
+        response = requests.get(f"{GITHUB_API}/{parts[0]}/{parts[1]}", headers=headers,
+                                timeout=budget(SIZE_LOOKUP_TIMEOUT))
+        if response.status_code != 200:
+            return None
+        return int(response.json().get("size", 0)) * 1024   # the API reports KB
+    except (requests.RequestException, ValueError):
+        return None
@@ -12,36 +12,103 @@ This gives us stable and reliable repo selection.
 
 import os
 import re
-from typing import List
-import requests
+from typing import List, Optional
 
 from dotenv import load_dotenv
 load_dotenv()  # This reads .env files in the project root
 
-def select_best_repository(github_links: List[str], paper_text: str) -> str:
+from src.jobs.async_runtime import run_blocking
+from src.llm.client import call_llm, call_llm_async
+from src.pdf.paper_index import ABSTRACT_TOKENS, LINK_WINDOW_TOKENS, TITLE_TOKENS, PaperIndex
+
+# Paper context in the selection prompt: title + abstract + one window per link
+SELECTION_TOKEN_BUDGET = 900
+MIN_LINK_WINDOW_TOKENS = 40
+
+def build_selection_context(github_links: List[str], paper_text: str,
+                            page_starts: Optional[List[int]] = None) -> str:
+    """Title, abstract and a context window around each candidate link, within SELECTION_TOKEN_BUDGET."""
+    index = PaperIndex(paper_text, page_starts)
+    title = index.title(TITLE_TOKENS)
+    abstract = index.abstract(ABSTRACT_TOKENS)
+
+    # Whatever the front matter leaves is shared evenly between the links. Below the
+    # floor a window is useless, so only the first links get one and the total stays in budget.
+    remaining = SELECTION_TOKEN_BUDGET - TITLE_TOKENS - ABSTRACT_TOKENS
+    per_link = max(MIN_LINK_WINDOW_TOKENS, min(LINK_WINDOW_TOKENS, remaining // len(github_links)))
+    windowed = remaining // per_link
+
+    lines = [f"Title: {title or '(unknown)'}", f"Abstract: {abstract or '(not found)'}", "", "Where each repository is mentioned:"]
+    for i, url in enumerate(github_links):
+        context = index.link_context(url, per_link if i < windowed else 0)
+        where = f"page {context['page']}, " if context["page"] else ""
+        lines.append(f"{i+1}. {url} ({where}{context['mentions']} mention(s))")
+        if i < windowed:
+            lines.append(f"   \"{context['window'] or 'no surrounding text found'}\"")
+    return "\n".join(lines)
+
+def select_best_repository(github_links: List[str], paper_text: str,
+                           page_starts: Optional[List[int]] = None) -> str:
+    if _single_candidate(github_links):
+        return github_links[0]
+        
+    # Format repos for LLM, each with the sentences around its mention
+    prompt = _selection_prompt(build_selection_context(github_links, paper_text, page_starts))
+    
+    # Call LLM
+    try:
+        answer = _call_openai(prompt)
+        selected = _parse_selection(answer, github_links)
+        if selected:
+            return selected
+    
+    except Exception as e:
+        print(f"LLM call failed: {e}")
+    
+    # Fallback: return first repo
+    print(f"Falling back to first repo: {github_links[0]}")
+    return github_links[0]
+
+
+async def select_best_repository_async(github_links: List[str], paper_text: str,
+                                       page_starts: Optional[List[int]] = None) -> str:
+    """select_best_repository() for run_pipeline_async(): context on the pool, LLM call on the loop."""
+    if _single_candidate(github_links):
+        return github_links[0]
+
+    paper_context = await run_blocking(build_selection_context, github_links, paper_text, page_starts)
+    try:
+        answer = await call_llm_async(_selection_prompt(paper_context), call_site="finder.select_repository")
+        selected = _parse_selection(answer, github_links)
+        if selected:
+            return selected
+
+    except Exception as e:
+        print(f"LLM call failed: {e}")
+
+    print(f"Falling back to first repo: {github_links[0]}")
+    return github_links[0]
+
+
+def _single_candidate(github_links: List[str]) -> bool:
     # only one repo in the list
     if len(github_links) == 1:
         print(f"Only one repo: {github_links[0]}")
-        return github_links[0]
+        return True
     
     # no repo in the list
     if not github_links:
         raise ValueError("No GitHub links provided")
-        
-    # Format repos for LLM
-    repos_text = "\n".join([f"{i+1}. {url}" for i, url in enumerate(github_links)])
-    
-    # Truncate paper to first 2000 chars 
-    paper_summary = paper_text[:2000]
-    
+    return False
+
+
+def _selection_prompt(paper_context: str) -> str:
     # Create prompt for the LLM
-    prompt = f"""You are analyzing a scientific paper to find its most relevant GitHub repository.
+    return f"""You are analyzing a scientific paper to find its most relevant GitHub repository.
 
-Paper Summary:
-{paper_summary}
+{paper_context}
 
-List of GitHub Repositories to choose from (only consider these):
-{repos_text}
+Only consider the numbered repositories above.
 
 Which repository is the PRIMARY implementation described in this paper?
 - It should be the actual project code, not a citation or dependency
@@ -51,53 +118,21 @@ Which repository is the PRIMARY implementation described in this paper?
 Respond with ONLY the number (1, 2, 3, etc.) and brief reason.
 Format: "Repository X: [reason]"
 """
-    
-    # Call LLM
-    try:
-        answer = _call_openai(prompt)
-        print(f"[FINDER]{answer}")
-        
-        # Parse response
-        match = re.search(r'Repository\s+(\d+)', answer, re.IGNORECASE)
-        if match:
-            idx = int(match.group(1)) - 1
-            if 0 <= idx < len(github_links):
-                selected = github_links[idx]
-                print(f"Selected: {selected}")
-                return selected
-    
-    except Exception as e:
-        print(f"LLM call failed: {e}")
-    
-    # Fallback: return first repo
-    print(f"Falling back to first repo: {github_links[0]}")
-    return github_links[0]
-
 
-def _call_openai(prompt: str) -> str:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise Exception("OPENAI_API_KEY is not set in the environment variables.")
-
-    url = "https://api.openai.com/v1/chat/completions"
-
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
 
-    payload = {
-        "model": "gpt-4o-mini",   # or any: gpt-4o, gpt-4.1, o1-mini, etc.
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0,
-        "max_tokens": 512
-    }
-
-    response = requests.post(url, headers=headers, json=payload)
+def _parse_selection(answer: str, github_links: List[str]) -> Optional[str]:
+    print(f"[FINDER]{answer}")
+    
+    # Parse response
+    match = re.search(r'Repository\s+(\d+)', answer, re.IGNORECASE)
+    if match:
+        idx = int(match.group(1)) - 1
+        if 0 <= idx < len(github_links):
+            selected = github_links[idx]
+            print(f"Selected: {selected}")
+            return selected
+    return None
 
-    if response.status_code != 200:
-        raise Exception(f"OpenAI API error {response.status_code}: {response.text}")
 
-    return response.json()["choices"][0]["message"]["content"]
\ No newline at end of file
+def _call_openai(prompt: str) -> str:
+    return call_llm(prompt, call_site="finder.select_repository")
\ No newline at end of file
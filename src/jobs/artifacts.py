@@ -0,0 +1,173 @@
+"""
+artifacts.py
+-------------
+Large job outputs as separate files, and the compact summary that points to them.
+
+Responsibilities:
+- Write the bulky parts of a job's results (demo code, demo stdout/stderr,
+  scan report, paper text, full results) to Jobs/<job_id>/artifacts/,
+  each with a precompressed .gz copy
+- ensure_artifacts(): write them only if the job has none yet, so a
+  finished queued job is written once, not on every response or poll
+- Build the compact summary the API returns instead of the full results:
+  status, scores, repo, and one URL per artifact
+- Resolve an artifact name to its file for the download endpoint
+
+The web server serves these files with Range support (identity encoding)
+or as the stored gzip, so nothing is compressed per request.
+"""
+
+import gzip
+import json
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+from src.jobs.checkpoints import JOBS_FOLDER, CheckpointStore
+
+ARTIFACTS_FOLDER = "artifacts"
+GZIP_MIN_BYTES = 1024          # smaller files aren't worth a second copy
+ARTIFACT_URL = "/api/jobs/{job_id}/artifacts/{name}"
+
+# name -> (file name, content type)
+ARTIFACT_FILES: Dict[str, tuple] = {
+    "demo_code": ("demo_generated.py", "text/x-python; charset=utf-8"),
+    "stdout": ("stdout.log", "text/plain; charset=utf-8"),
+    "stderr": ("stderr.log", "text/plain; charset=utf-8"),
+    "scan_report": ("scan_report.json", "application/json"),
+    "paper_text": ("paper_text.txt", "text/plain; charset=utf-8"),
+    "results": ("results.json", "application/json"),
+}
+
+
+def _to_json(data: Any) -> str:
+    return json.dumps(data, indent=2,
+                      default=lambda o: o.to_dict() if hasattr(o, "to_dict") else str(o))
+
+
+def _artifact_texts(results: Dict[str, Any], store: CheckpointStore) -> Dict[str, str]:
+    execution = (results.get("evaluation") or {}).get("execution_results") or {}
+    texts = {
+        "demo_code": results.get("demo_code"),
+        "stdout": execution.get("stdout"),
+        "stderr": execution.get("stderr"),
+        "scan_report": _to_json(results["scan_report"]) if results.get("scan_report") is not None else None,
+        "paper_text": store.load_text("paper_text.txt"),
+        # Written last: its presence means the whole set is there (see ensure_artifacts)
+        "results": _to_json(results),
+    }
+    return {name: text for name, text in texts.items() if text is not None}
+
+
+def write_artifacts(results: Dict[str, Any], store: Optional[CheckpointStore] = None) -> Dict[str, int]:
+    """Write the job's artifacts; returns {name: size in bytes}."""
+    store = store or CheckpointStore(results["job_id"])
+    folder = os.path.join(store.path, ARTIFACTS_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+
+    sizes = {}
+    for name, text in _artifact_texts(results, store).items():
+        data = text.encode("utf-8")
+        path = os.path.join(folder, ARTIFACT_FILES[name][0])
+        _write_atomic(path, data)
+        if len(data) >= GZIP_MIN_BYTES:
+            _write_atomic(path + ".gz", gzip.compress(data, compresslevel=6))
+        elif os.path.exists(path + ".gz"):
+            os.remove(path + ".gz")
+        sizes[name] = len(data)
+    return sizes
+
+
+def ensure_artifacts(results: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Sizes of the job's artifacts, writing them first if they don't exist yet.
+    For finished jobs, whose results no longer change.
+    """
+    if artifact_path(results["job_id"], "results") is not None:
+        return _existing_sizes(results["job_id"])
+    return write_artifacts(results)
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    # A unique temp file: concurrent writers (server threads, workers) never share one
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def artifact_path(job_id: str, name: str) -> Optional[str]:
+    """File of an artifact, or None if the name is unknown or the file is missing."""
+    if name not in ARTIFACT_FILES or os.sep in job_id or job_id.startswith("."):
+        return None
+    # Absolute: Flask's send_file resolves relative paths against the app folder, not the cwd
+    path = os.path.abspath(os.path.join(JOBS_FOLDER, job_id, ARTIFACTS_FOLDER, ARTIFACT_FILES[name][0]))
+    return path if os.path.exists(path) else None
+
+
+def content_type(name: str) -> str:
+    return ARTIFACT_FILES[name][1]
+
+
+# ------------------------------------------------------------
+# Compact summary
+# ------------------------------------------------------------
+def summarize(results: Dict[str, Any], sizes: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """Small response body: everything the result page shows up front, plus artifact URLs."""
+    job_id = results["job_id"]
+    evaluation = results.get("evaluation") or {}
+    execution = evaluation.get("execution_results") or {}
+    scores = evaluation.get("evaluation_results") or {}
+    scan = results.get("scan_report")
+
+    summary = {
+        "job_id": job_id,
+        "status": results.get("status"),
+        "errors": results.get("errors", []),
+        "failed_stage": results.get("failed_stage"),
+        "input_url": results.get("input_url"),
+        "best_repo_url": results.get("best_repo_url"),
+        "github_links": results.get("github_links", []),
+        "degraded": results.get("degraded", False),
+        "skipped_llm_calls": results.get("skipped_llm_calls", []),
+        "evaluation": {
+            "total_score": scores.get("total_score"),
+            "total_automated_score": scores.get("total_automated_score"),
+            "llm_qualitative_score": scores.get("llm_qualitative_score"),
+            "score_breakdown": scores.get("score_breakdown"),
+            "execution_status": execution.get("status"),
+            "exit_code": execution.get("exit_code"),
+            "run_time": execution.get("run_time"),
+            "dependency_install": (evaluation.get("dependency_install") or {}).get("status"),
+        } if evaluation else None,
+        "scan": {
+            "num_files": scan.get("num_files"),
+            "languages": scan.get("languages"),
+            "entrypoints": scan.get("entrypoints"),
+        } if scan is not None else None,
+    }
+    if results.get("deadline_exceeded"):
+        summary["deadline_exceeded"] = True
+
+    sizes = sizes if sizes is not None else _existing_sizes(job_id)
+    summary["artifacts"] = {
+        name: {"url": ARTIFACT_URL.format(job_id=job_id, name=name), "bytes": size}
+        for name, size in sizes.items()
+    }
+    return summary
+
+
+def _existing_sizes(job_id: str) -> Dict[str, int]:
+    sizes = {}
+    for name in ARTIFACT_FILES:
+        path = artifact_path(job_id, name)
+        if path:
+            sizes[name] = os.path.getsize(path)
+    return sizes
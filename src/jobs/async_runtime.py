@@ -0,0 +1,80 @@
+"""
+async_runtime.py
+-----------------
+Shared plumbing for run_pipeline_async().
+
+Responsibilities:
+- run_blocking(): run CPU-bound or not-yet-async code (PDF parsing,
+  repo scanning, BM25 indexing) on a bounded thread pool, with the
+  caller's contextvars (job deadline, temp-file scope, degradation scope,
+  profiled stage). Network waits (LLM calls) belong on the event loop:
+  a pool thread blocked on one is a CPU worker lost to every job.
+- http_session(): one aiohttp ClientSession per event loop, so hundreds
+  of jobs in one process share a connection pool
+- close_http_session(): release it when the loop is done
+
+aiohttp is optional. Without it, async_http_available() is False and
+the async HTTP helpers fall back to their `requests` versions on the
+thread pool (same results, one pool thread per in-flight request).
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from src.jobs.profiling import run_profiled
+
+try:
+    import aiohttp
+except ImportError:   # optional dependency
+    aiohttp = None
+
+CPU_WORKERS = int(os.getenv("AUTOAGENT_CPU_WORKERS", str(os.cpu_count() or 4)))
+HTTP_CONNECTION_LIMIT = 100     # open connections shared by every job on one loop
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="pipeline-cpu")
+        return _executor
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Await func(*args, **kwargs) running on the pool, inside a copy of the current context."""
+    context = contextvars.copy_context()
+    # run_profiled() is a plain call unless the caller's stage is being profiled
+    call = functools.partial(context.run, run_profiled, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), call)
+
+
+def async_http_available() -> bool:
+    return aiohttp is not None
+
+
+def http_session():
+    """The running loop's shared aiohttp session (requires aiohttp)."""
+    if aiohttp is None:
+        raise RuntimeError("aiohttp is not installed (pip install aiohttp)")
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=HTTP_CONNECTION_LIMIT))
+        _sessions[loop] = session
+    return session
+
+
+async def close_http_session() -> None:
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
@@ -0,0 +1,138 @@
+"""
+checkpoints.py
+---------------
+Per-job checkpoint storage for pipeline stages.
+
+Responsibilities:
+- Give every pipeline job its own directory: ./Jobs/<job_id>/
+- Persist the output of each stage as <stage>.json once it succeeds
+- Store larger text artifacts (paper text, demo code) as plain files
+- Tell the pipeline which stage is the first one still missing
+
+This file only reads and writes files.
+It does not know how a stage is computed.
+"""
+
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+# Order matters: every stage depends only on the stages before it
+STAGES: List[str] = ["links", "select", "clone", "scan", "generate", "evaluate"]
+
+JOBS_FOLDER = "Jobs"
+
+
+def new_job_id() -> str:
+    """Return a sortable, unique job id (UTC timestamp + short random suffix)."""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    return f"{stamp}-{uuid.uuid4().hex[:8]}"
+
+
+def stage_index(stage: str) -> int:
+    """Position of a stage in STAGES; raises ValueError for unknown names."""
+    if stage not in STAGES:
+        raise ValueError(f"Unknown stage '{stage}'. Expected one of: {', '.join(STAGES)}")
+    return STAGES.index(stage)
+
+
+def _json_default(obj: Any) -> Any:
+    # Typed results (e.g. ScanReport) know how to serialize themselves
+    if hasattr(obj, "to_checkpoint"):
+        return obj.to_checkpoint()
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    return str(obj)
+
+
+class CheckpointStore:
+    """Reads and writes the checkpoints of a single job."""
+
+    def __init__(self, job_id: str, base_folder: str = JOBS_FOLDER):
+        self.job_id = job_id
+        self.path = os.path.join(base_folder, job_id)
+        os.makedirs(self.path, exist_ok=True)
+
+    # ------------------------------------------------------------
+    # Job metadata
+    # ------------------------------------------------------------
+    def save_meta(self, meta: Dict[str, Any]) -> None:
+        self._write_json("job.json", meta)
+
+    def load_meta(self) -> Dict[str, Any]:
+        meta = self._read_json("job.json")
+        if meta is None:
+            raise FileNotFoundError(f"No job found with id '{self.job_id}' in {self.path}")
+        return meta
+
+    def save_results(self, results: Dict[str, Any]) -> None:
+        self._write_json("results.json", results)
+
+    # ------------------------------------------------------------
+    # Stage checkpoints
+    # ------------------------------------------------------------
+    def has(self, stage: str) -> bool:
+        return os.path.exists(self._stage_file(stage))
+
+    def load(self, stage: str) -> Optional[Dict[str, Any]]:
+        return self._read_json(f"{stage}.json")
+
+    def save(self, stage: str, data: Dict[str, Any]) -> None:
+        stage_index(stage)
+        self._write_json(f"{stage}.json", data)
+
+    def invalidate_from(self, stage: str) -> None:
+        """Delete the checkpoint of `stage` and of every stage after it."""
+        for name in STAGES[stage_index(stage):]:
+            if self.has(name):
+                os.remove(self._stage_file(name))
+
+    def first_incomplete(self) -> Optional[str]:
+        """Return the first stage without a checkpoint, or None if all are done."""
+        for name in STAGES:
+            if not self.has(name):
+                return name
+        return None
+
+    # ------------------------------------------------------------
+    # Text artifacts
+    # ------------------------------------------------------------
+    def save_text(self, name: str, text: str) -> str:
+        path = os.path.join(self.path, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def load_text(self, name: str) -> Optional[str]:
+        path = os.path.join(self.path, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def delete(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    # ------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------
+    def _stage_file(self, stage: str) -> str:
+        return os.path.join(self.path, f"{stage}.json")
+
+    def _write_json(self, name: str, data: Dict[str, Any]) -> None:
+        # Write to a temp file first so a crash never leaves a half-written checkpoint
+        path = os.path.join(self.path, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, default=_json_default)
+        os.replace(tmp_path, path)
+
+    def _read_json(self, name: str) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self.path, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
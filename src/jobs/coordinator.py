@@ -0,0 +1,92 @@
+"""
+coordinator.py
+---------------
+Fans pipeline submissions out to worker nodes through the shared queue.
+
+Responsibilities:
+- submit()/submit_many() enqueue papers (from server.py or batch mode);
+  a batch is normalized to PDF URLs, queued once per paper and
+  interleaved across hosts, so workers don't all wait on one host's
+  download limits (see src/pdf/fetch_policy.py)
+- wait() blocks until a job is done/failed and returns its results
+- status() reports a job's state for polling clients
+- The queue is the single results store: every worker writes there
+
+Only the queue is shared, so the coordinator runs no pipeline code itself.
+"""
+
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.jobs.job_queue import DONE, FAILED, JobQueue, open_queue
+from src.pdf.fetch_policy import interleave_by_host, normalize_paper_url
+
+WAIT_POLL_INTERVAL = 1.0
+
+
+class JobFailed(Exception):
+    """A queued job ran out of attempts."""
+    pass
+
+
+class Coordinator:
+
+    def __init__(self, queue: Optional[JobQueue] = None):
+        self.queue = queue or open_queue()
+
+    def submit(self, pdf_url: str, from_stage: Optional[str] = None, deadline: Optional[float] = None,
+               profile: bool = False) -> str:
+        payload: Dict[str, Any] = {"pdf_url": pdf_url}
+        if from_stage:
+            payload["from_stage"] = from_stage
+        if deadline:
+            payload["deadline"] = deadline
+        if profile:
+            payload["profile"] = True
+        job_id = self.queue.enqueue(payload)
+        print(f"[COORDINATOR] Queued job {job_id} for {pdf_url}")
+        return job_id
+
+    def submit_many(self, pdf_urls: Iterable[str]) -> List[str]:
+        """One job id per input URL, in input order; spellings of the same paper share a job."""
+        normalized = [normalize_paper_url(url) for url in pdf_urls]
+        job_ids = {url: self.submit(url) for url in interleave_by_host(dict.fromkeys(normalized))}
+        if len(job_ids) < len(normalized):
+            print(f"[COORDINATOR] {len(normalized) - len(job_ids)} duplicate URL(s) share a job")
+        return [job_ids[url] for url in normalized]
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.queue.get(job_id)
+        if job is None:
+            return None
+        return {
+            "job_id": job_id,
+            "status": job["status"],
+            "attempts": job["attempts"],
+            "worker": job.get("lease_owner"),
+            "error": job.get("error"),
+        }
+
+    def wait(self, job_id: str, timeout: Optional[float] = None,
+             poll_interval: float = WAIT_POLL_INTERVAL) -> Dict[str, Any]:
+        """Results of a finished job; raises JobFailed or TimeoutError."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.queue.get(job_id)
+            if job is None:
+                raise KeyError(f"Unknown job: {job_id}")
+            if job["status"] == DONE:
+                return job["result"]
+            if job["status"] == FAILED:
+                raise JobFailed(f"Job {job_id} failed after {job['attempts']} attempts: {job['error']}")
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Job {job_id} still {job['status']} after {timeout}s")
+            time.sleep(poll_interval)
+
+    def run(self, pdf_url: str, timeout: Optional[float] = None, deadline: Optional[float] = None,
+            profile: bool = False) -> Dict[str, Any]:
+        """submit() + wait(): drop-in for run_pipeline() when workers do the work."""
+        return self.wait(self.submit(pdf_url, deadline=deadline, profile=profile), timeout=timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return self.queue.stats()
@@ -0,0 +1,224 @@
+"""
+deadline.py
+------------
+Per-job deadlines and cooperative cancellation.
+
+Responsibilities:
+- Deadline: one time budget for a whole job, plus the stage it is in
+- deadline_scope() makes the job's deadline visible to every call below
+  it (contextvars, so concurrent jobs in one server don't mix)
+- budget(default) turns the remaining time into a timeout for one I/O
+  call (LLM request, download, pdftotext, pip, git, demo run)
+- check_deadline() is the cooperative check for long Python loops
+- run_subprocess() runs a command in its own process group and kills
+  the whole group on timeout, deadline or cancel()
+- run_subprocess_async() is the same for run_pipeline_async() (asyncio
+  subprocess, no thread blocked while the command runs)
+
+DeadlineExceeded derives from BaseException (like asyncio.CancelledError)
+so the broad `except Exception` fallbacks inside stages can't swallow it;
+run_pipeline() catches it explicitly and fails the job.
+"""
+
+import asyncio
+import contextvars
+import math
+import os
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+DEADLINE_ENV = "AUTOAGENT_JOB_DEADLINE"
+DEFAULT_JOB_DEADLINE = 1800.0   # seconds for a whole job (download → evaluation)
+
+_current: contextvars.ContextVar[Optional["Deadline"]] = contextvars.ContextVar("job_deadline", default=None)
+
+
+class DeadlineExceeded(BaseException):
+    """The job ran out of time (or was cancelled)."""
+
+    def __init__(self, stage: Optional[str] = None, cancelled: bool = False):
+        self.stage = stage
+        self.cancelled = cancelled
+        reason = "job cancelled" if cancelled else "deadline exceeded"
+        super().__init__(f"{reason} in stage {stage}" if stage else reason)
+
+
+class Deadline:
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+        self.stage: Optional[str] = None
+        self.cancelled = False
+        self._hooks: Dict[int, Callable[[], None]] = {}
+        self._next_hook = 0
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.cancelled or self.remaining() <= 0
+
+    def check(self) -> None:
+        if self.expired():
+            raise DeadlineExceeded(self.stage, self.cancelled)
+
+    def timeout(self, default: Optional[float] = None) -> Optional[float]:
+        """Timeout for one call: `default` capped by the remaining budget (None = no limit)."""
+        self.check()
+        remaining = self.remaining()
+        if remaining == math.inf:
+            return default
+        return remaining if default is None else min(default, remaining)
+
+    # ------------------------------------------------------------
+    # Cancellation
+    # ------------------------------------------------------------
+    def add_cancel_hook(self, hook: Callable[[], None]) -> int:
+        with self._lock:
+            self._next_hook += 1
+            self._hooks[self._next_hook] = hook
+            return self._next_hook
+
+    def remove_cancel_hook(self, handle: int) -> None:
+        with self._lock:
+            self._hooks.pop(handle, None)
+
+    def cancel(self) -> None:
+        """Stop the job: running subprocesses are killed, the next check raises."""
+        with self._lock:
+            self.cancelled = True
+            hooks = list(self._hooks.values())
+        for hook in hooks:
+            try:
+                hook()
+            except Exception as e:
+                print(f"[DEADLINE] Cancel hook failed: {e}")
+
+
+def job_deadline(seconds: Optional[float] = None) -> Deadline:
+    """Deadline for a new job: explicit seconds, else $AUTOAGENT_JOB_DEADLINE, else the default (0 = none)."""
+    if seconds is None:
+        seconds = float(os.getenv(DEADLINE_ENV, DEFAULT_JOB_DEADLINE))
+    return Deadline(seconds if seconds and seconds > 0 else None)
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline):
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def set_stage(stage: str) -> None:
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.stage = stage
+
+
+def check_deadline() -> None:
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def budget(default: Optional[float] = None) -> Optional[float]:
+    """`default` capped by the current job's remaining time; raises if none is left."""
+    deadline = _current.get()
+    return default if deadline is None else deadline.timeout(default)
+
+
+# ------------------------------------------------------------
+# Subprocesses
+# ------------------------------------------------------------
+def kill_process_group(process) -> None:
+    # Works for subprocess.Popen and asyncio.subprocess.Process
+    if process.returncode is not None or (hasattr(process, "poll") and process.poll() is not None):
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)   # the command and everything it spawned
+    except (ProcessLookupError, PermissionError, AttributeError):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
+def run_subprocess(command: List[str], timeout: Optional[float] = None, cwd: Optional[str] = None,
+                   env: Optional[Dict[str, str]] = None, text: bool = True) -> subprocess.CompletedProcess:
+    """
+    subprocess.run(capture_output=True) that respects the job deadline.
+
+    Raises subprocess.TimeoutExpired when `timeout` runs out, and
+    DeadlineExceeded when the job's deadline runs out or it is cancelled.
+    In both cases the process group is killed first.
+    """
+    deadline = _current.get()
+    effective = budget(timeout)
+
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               text=text, start_new_session=True)
+    hook = deadline.add_cancel_hook(lambda: kill_process_group(process)) if deadline is not None else None
+    try:
+        stdout, stderr = process.communicate(timeout=effective)
+    except subprocess.TimeoutExpired:
+        kill_process_group(process)
+        process.communicate()
+        if deadline is not None:
+            deadline.check()   # the job's budget ran out, not the command's own timeout
+        raise
+    except BaseException:
+        kill_process_group(process)
+        raise
+    finally:
+        if hook is not None:
+            deadline.remove_cancel_hook(hook)
+
+    if deadline is not None:
+        deadline.check()   # killed by cancel()
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+async def run_subprocess_async(command: List[str], timeout: Optional[float] = None, cwd: Optional[str] = None,
+                               env: Optional[Dict[str, str]] = None, text: bool = True) -> subprocess.CompletedProcess:
+    """run_subprocess() for coroutines: same timeouts, same exceptions, same group kill."""
+    deadline = _current.get()
+    effective = budget(timeout)
+
+    process = await asyncio.create_subprocess_exec(*command, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                                                   stderr=subprocess.PIPE, start_new_session=True)
+    hook = deadline.add_cancel_hook(lambda: kill_process_group(process)) if deadline is not None else None
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), effective)
+    except asyncio.TimeoutError:
+        kill_process_group(process)
+        await process.wait()
+        if deadline is not None:
+            deadline.check()
+        raise subprocess.TimeoutExpired(command, effective)
+    except BaseException:   # includes the task being cancelled
+        kill_process_group(process)
+        raise
+    finally:
+        if hook is not None:
+            deadline.remove_cancel_hook(hook)
+
+    if deadline is not None:
+        deadline.check()
+    if text:
+        stdout = stdout.decode("utf-8", errors="replace")
+        stderr = stderr.decode("utf-8", errors="replace")
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
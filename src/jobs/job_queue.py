@@ -0,0 +1,588 @@
+"""
+job_queue.py
+-------------
+Durable job queue shared by the coordinator and remote workers.
+
+Responsibilities:
+- enqueue(payload) → job_id
+- lease(worker_id) hands ONE job to ONE worker for a visibility timeout
+- heartbeat() extends the lease while the worker is alive
+- if a worker dies, its lease expires and the job is handed out again
+  (up to max_attempts, then it is marked failed)
+- complete()/fail() store the outcome, so results from every worker end
+  up in one place
+
+Backends:
+- SQLiteJobQueue — default, a single WAL-mode file: many processes on ONE
+                   host. Not for network filesystems (NFS, SMB, ...):
+                   WAL needs shared memory and reliable file locks,
+                   which they don't provide
+- RedisJobQueue  — for multi-node deployments (needs the `redis` package);
+                   LocalRedis is an in-process stand-in for tests
+
+open_queue(url) picks the backend:
+    sqlite:///abs/path/queue.sqlite3   sqlite:Jobs/queue.sqlite3
+    redis://host:6379/0                local-redis://
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+
+from src.jobs.checkpoints import JOBS_FOLDER, new_job_id
+
+DEFAULT_QUEUE_URL = f"sqlite:{JOBS_FOLDER}/queue.sqlite3"
+DEFAULT_VISIBILITY_TIMEOUT = 120.0  # seconds a lease lives without a heartbeat
+DEFAULT_MAX_ATTEMPTS = 3
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class LeaseLost(Exception):
+    """The worker's lease expired or was taken over; it must stop working on the job."""
+    pass
+
+
+class Lease:
+    """A job handed to a worker. `token` proves ownership for heartbeat/complete/fail."""
+
+    def __init__(self, job_id: str, token: str, payload: Dict[str, Any], attempt: int):
+        self.job_id = job_id
+        self.token = token
+        self.payload = payload
+        self.attempt = attempt
+
+    def __repr__(self):
+        return f"Lease(job_id={self.job_id!r}, attempt={self.attempt})"
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, default=lambda o: o.to_dict() if hasattr(o, "to_dict") else str(o))
+
+
+class JobQueue:
+    """Interface shared by all backends."""
+
+    def enqueue(self, payload: Dict[str, Any], job_id: Optional[str] = None,
+                max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> str:
+        raise NotImplementedError
+
+    def lease(self, worker_id: str, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT) -> Optional[Lease]:
+        raise NotImplementedError
+
+    def heartbeat(self, lease: Lease, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT) -> None:
+        raise NotImplementedError
+
+    def complete(self, lease: Lease, result: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def fail(self, lease: Lease, error: str, retry: bool = True) -> None:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """{"job_id", "status", "attempts", "payload", "result", "error", ...} or None."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+
+# =========================================================================
+# SQLite backend
+# =========================================================================
+
+class SQLiteJobQueue(JobQueue):
+
+    def __init__(self, path: str):
+        self.path = path
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id        TEXT PRIMARY KEY,
+                    payload       TEXT NOT NULL,
+                    status        TEXT NOT NULL,
+                    attempts      INTEGER NOT NULL DEFAULT 0,
+                    max_attempts  INTEGER NOT NULL,
+                    lease_owner   TEXT,
+                    lease_token   TEXT,
+                    lease_expires REAL,
+                    result        TEXT,
+                    error         TEXT,
+                    created_at    REAL NOT NULL,
+                    updated_at    REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call keeps this safe across threads and processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(self, payload, job_id=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        job_id = job_id or new_job_id()
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, payload, status, max_attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, _dumps(payload), QUEUED, max_attempts, now, now),
+            )
+        return job_id
+
+    def lease(self, worker_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Expired leases whose attempts are used up are dead: mark them failed
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = COALESCE(error, 'lease expired (worker lost)'), "
+                "lease_owner = NULL, lease_token = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                (FAILED, now, LEASED, now),
+            )
+            row = conn.execute(
+                "SELECT job_id, payload, attempts FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (QUEUED, LEASED, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            token = uuid.uuid4().hex
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?, lease_token = ?, "
+                "lease_expires = ?, updated_at = ? WHERE job_id = ?",
+                (LEASED, worker_id, token, now + visibility_timeout, now, row["job_id"]),
+            )
+            conn.execute("COMMIT")
+            return Lease(row["job_id"], token, json.loads(row["payload"]), row["attempts"] + 1)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _update_owned(self, lease: Lease, sql: str, params: tuple) -> None:
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(sql + " WHERE job_id = ? AND lease_token = ? AND status = ?",
+                                  params + (lease.job_id, lease.token, LEASED))
+            if cursor.rowcount == 0:
+                raise LeaseLost(f"Lease on job {lease.job_id} is no longer held")
+
+    def heartbeat(self, lease, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        now = time.time()
+        self._update_owned(lease, "UPDATE jobs SET lease_expires = ?, updated_at = ?",
+                           (now + visibility_timeout, now))
+
+    def complete(self, lease, result):
+        self._update_owned(
+            lease,
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_token = NULL, updated_at = ?",
+            (DONE, _dumps(result), time.time()),
+        )
+
+    def fail(self, lease, error, retry=True):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE job_id = ?",
+                               (lease.job_id,)).fetchone()
+        final = not retry or (row is not None and row["attempts"] >= row["max_attempts"])
+        self._update_owned(
+            lease,
+            "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_token = NULL, "
+            "lease_expires = NULL, updated_at = ?",
+            (FAILED if final else QUEUED, error, time.time()),
+        )
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {QUEUED: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+
+# =========================================================================
+# Redis backend
+# =========================================================================
+
+class WatchError(Exception):
+    """LocalRedis: a watched key changed before EXEC (redis.exceptions.WatchError for real Redis)."""
+    pass
+
+
+def _watch_errors() -> tuple:
+    try:
+        from redis.exceptions import WatchError as RedisWatchError
+    except ImportError:
+        return (WatchError,)
+    return (WatchError, RedisWatchError)
+
+
+_AGAIN = object()   # claim(): the head of the ready list moved, read it again
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Keys (prefix "autoagent:"):
+        job:<id>  hash    payload, status, attempts, max_attempts, lease_token,
+                          lease_expires, result, error
+        ready     list    job ids waiting for a worker
+        leases    zset    job id → lease expiry (unix time), to find expired leases
+
+    Every state change is one WATCH/MULTI/EXEC transaction on the job's
+    hash (and, to claim, on the ready list): a job is never popped without
+    being leased, and a worker whose lease expired or was taken over can't
+    complete, fail or heartbeat it (LeaseLost). The hash is the source of
+    truth; the zset is only an index.
+
+    `client` is a redis.Redis(decode_responses=True) or a LocalRedis.
+    """
+
+    TRANSACTION_RETRIES = 50
+
+    def __init__(self, client, prefix: str = "autoagent:"):
+        self.r = client
+        self.prefix = prefix
+        self._watch_errors = _watch_errors()
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}{name}"
+
+    def _job_key(self, job_id: str) -> str:
+        return self._key(f"job:{job_id}")
+
+    def _transaction(self, watch: List[str], body):
+        """
+        Run body(pipe) with `watch` watched; body reads in immediate mode,
+        calls pipe.multi() and queues its writes. Retried while another
+        client changes a watched key first. Returns body's return value.
+        """
+        for _ in range(self.TRANSACTION_RETRIES):
+            with self.r.pipeline() as pipe:
+                try:
+                    pipe.watch(*watch)
+                    outcome = body(pipe)
+                    if pipe.explicit_transaction:
+                        pipe.execute()
+                    return outcome
+                except self._watch_errors:
+                    continue
+        raise RuntimeError(f"Queue transaction on {watch} kept conflicting; giving up")
+
+    def enqueue(self, payload, job_id=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        job_id = job_id or new_job_id()
+        now = time.time()
+        with self.r.pipeline() as pipe:
+            pipe.multi()
+            pipe.hset(self._job_key(job_id), mapping={
+                "payload": _dumps(payload), "status": QUEUED, "attempts": 0,
+                "max_attempts": max_attempts, "created_at": now, "updated_at": now,
+            })
+            pipe.lpush(self._key("ready"), job_id)
+            pipe.execute()
+        return job_id
+
+    def _reclaim_expired(self) -> None:
+        now = time.time()
+        for job_id in self.r.zrangebyscore(self._key("leases"), 0, now):
+            self._transaction([self._job_key(job_id)], lambda pipe, job_id=job_id: self._reclaim(pipe, job_id, now))
+
+    def _reclaim(self, pipe, job_id: str, now: float) -> None:
+        job = pipe.hgetall(self._job_key(job_id))
+        if job.get("status") == LEASED and float(job.get("lease_expires") or 0) >= now:
+            return   # a heartbeat got there first
+        pipe.multi()
+        pipe.zrem(self._key("leases"), job_id)
+        if job.get("status") != LEASED:
+            return   # stale index entry
+        if int(job.get("attempts", 0)) >= int(job.get("max_attempts", DEFAULT_MAX_ATTEMPTS)):
+            pipe.hset(self._job_key(job_id), mapping={
+                "status": FAILED, "error": job.get("error") or "lease expired (worker lost)",
+                "lease_token": "", "updated_at": now,
+            })
+        else:
+            pipe.hset(self._job_key(job_id), mapping={"status": QUEUED, "lease_token": "", "updated_at": now})
+            pipe.lpush(self._key("ready"), job_id)
+
+    def lease(self, worker_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        self._reclaim_expired()
+        ready = self._key("ready")
+        while True:
+            job_id = self.r.lindex(ready, -1)
+            if job_id is None:
+                return None
+
+            def claim(pipe, job_id=job_id):
+                if pipe.lindex(ready, -1) != job_id:
+                    return _AGAIN   # another worker took it between the two reads
+                job = pipe.hgetall(self._job_key(job_id))
+                pipe.multi()
+                pipe.rpop(ready)
+                if job.get("status") != QUEUED:
+                    return None   # stale entry (job finished or failed meanwhile): drop it
+                now = time.time()
+                token = uuid.uuid4().hex
+                attempts = int(job.get("attempts", 0)) + 1
+                pipe.hset(self._job_key(job_id), mapping={
+                    "status": LEASED, "attempts": attempts, "lease_owner": worker_id,
+                    "lease_token": token, "lease_expires": now + visibility_timeout, "updated_at": now,
+                })
+                pipe.zadd(self._key("leases"), {job_id: now + visibility_timeout})
+                return Lease(job_id, token, json.loads(job["payload"]), attempts)
+
+            lease = self._transaction([ready, self._job_key(job_id)], claim)
+            if lease is not None and lease is not _AGAIN:
+                return lease
+
+    def _owned(self, lease: Lease, update) -> None:
+        """update(pipe, job) queues the writes, if `lease` still holds the job."""
+        def body(pipe):
+            job = pipe.hgetall(self._job_key(lease.job_id))
+            if job.get("status") != LEASED or job.get("lease_token") != lease.token:
+                raise LeaseLost(f"Lease on job {lease.job_id} is no longer held")
+            pipe.multi()
+            update(pipe, job)
+
+        self._transaction([self._job_key(lease.job_id)], body)
+
+    def heartbeat(self, lease, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        def update(pipe, job):
+            now = time.time()
+            pipe.hset(self._job_key(lease.job_id), mapping={"lease_expires": now + visibility_timeout,
+                                                            "updated_at": now})
+            pipe.zadd(self._key("leases"), {lease.job_id: now + visibility_timeout})
+
+        self._owned(lease, update)
+
+    def complete(self, lease, result):
+        def update(pipe, job):
+            pipe.zrem(self._key("leases"), lease.job_id)
+            pipe.hset(self._job_key(lease.job_id), mapping={
+                "status": DONE, "result": _dumps(result), "error": "", "lease_token": "",
+                "updated_at": time.time(),
+            })
+
+        self._owned(lease, update)
+
+    def fail(self, lease, error, retry=True):
+        def update(pipe, job):
+            final = not retry or int(job.get("attempts", 0)) >= int(job.get("max_attempts", DEFAULT_MAX_ATTEMPTS))
+            pipe.zrem(self._key("leases"), lease.job_id)
+            pipe.hset(self._job_key(lease.job_id), mapping={
+                "status": FAILED if final else QUEUED, "error": error, "lease_token": "",
+                "updated_at": time.time(),
+            })
+            if not final:
+                pipe.lpush(self._key("ready"), lease.job_id)
+
+        self._owned(lease, update)
+
+    def get(self, job_id):
+        job = self.r.hgetall(self._job_key(job_id))
+        if not job:
+            return None
+        return {
+            "job_id": job_id,
+            "status": job.get("status"),
+            "attempts": int(job.get("attempts", 0)),
+            "max_attempts": int(job.get("max_attempts", DEFAULT_MAX_ATTEMPTS)),
+            "lease_owner": job.get("lease_owner") or None,
+            "payload": json.loads(job["payload"]),
+            "result": json.loads(job["result"]) if job.get("result") else None,
+            "error": job.get("error") or None,
+        }
+
+    def stats(self):
+        counts = {QUEUED: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        for key in self.r.scan_iter(match=self._job_key("*")):
+            status = self.r.hget(key, "status")
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+
+class LocalRedis:
+    """
+    In-process stand-in for the handful of redis commands RedisJobQueue
+    uses (strings decoded, like decode_responses=True), including
+    WATCH/MULTI/EXEC pipelines. Not durable.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._hashes: Dict[str, Dict[str, str]] = {}
+        self._lists: Dict[str, List[str]] = {}
+        self._zsets: Dict[str, Dict[str, float]] = {}
+        self._versions: Dict[str, int] = {}   # bumped on every write, for WATCH
+
+    def _touch(self, key):
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def pipeline(self):
+        return _LocalPipeline(self)
+
+    def hset(self, key, mapping):
+        with self._lock:
+            self._hashes.setdefault(key, {}).update({k: str(v) for k, v in mapping.items()})
+            self._touch(key)
+
+    def hget(self, key, field):
+        with self._lock:
+            return self._hashes.get(key, {}).get(field)
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._hashes.get(key, {}))
+
+    def lpush(self, key, value):
+        with self._lock:
+            self._lists.setdefault(key, []).insert(0, value)
+            self._touch(key)
+
+    def rpop(self, key):
+        with self._lock:
+            items = self._lists.get(key)
+            if not items:
+                return None
+            self._touch(key)
+            return items.pop()
+
+    def lindex(self, key, index):
+        with self._lock:
+            items = self._lists.get(key) or []
+            try:
+                return items[index]
+            except IndexError:
+                return None
+
+    def zadd(self, key, mapping):
+        with self._lock:
+            self._zsets.setdefault(key, {}).update(mapping)
+            self._touch(key)
+
+    def zrem(self, key, member):
+        with self._lock:
+            removed = self._zsets.get(key, {}).pop(member, None) is not None
+            if removed:
+                self._touch(key)
+            return 1 if removed else 0
+
+    def zrangebyscore(self, key, low, high):
+        with self._lock:
+            items = self._zsets.get(key, {}).items()
+            return [m for m, score in sorted(items, key=lambda i: i[1]) if low <= score <= high]
+
+    def scan_iter(self, match):
+        prefix = match.rstrip("*")
+        with self._lock:
+            return [key for key in list(self._hashes) if key.startswith(prefix)]
+
+
+class _LocalPipeline:
+    """redis-py Pipeline semantics: commands run at once after watch(), are queued after multi()."""
+
+    def __init__(self, client: LocalRedis):
+        self._client = client
+        self._watched: Dict[str, int] = {}
+        self._queued: Optional[List[tuple]] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.reset()
+        return False
+
+    @property
+    def explicit_transaction(self) -> bool:
+        return self._queued is not None
+
+    def watch(self, *keys):
+        with self._client._lock:
+            for key in keys:
+                self._watched[key] = self._client._versions.get(key, 0)
+
+    def multi(self):
+        self._queued = []
+
+    def execute(self):
+        with self._client._lock:
+            changed = [key for key, version in self._watched.items()
+                       if self._client._versions.get(key, 0) != version]
+            if changed:
+                raise WatchError(f"Watched keys changed: {changed}")
+            results = [getattr(self._client, name)(*args, **kwargs) for name, args, kwargs in self._queued or []]
+        self.reset()
+        return results
+
+    def reset(self):
+        self._watched = {}
+        self._queued = None
+
+    def __getattr__(self, name):
+        command = getattr(self._client, name)
+        if self._queued is None:
+            return command
+
+        def queue(*args, **kwargs):
+            self._queued.append((name, args, kwargs))
+            return self
+        return queue
+
+
+# =========================================================================
+# Factory
+# =========================================================================
+
+_local_redis = None
+
+
+def open_queue(url: Optional[str] = None) -> JobQueue:
+    """Open the queue named by `url` (default: AUTOAGENT_QUEUE or the local SQLite file)."""
+    global _local_redis
+    url = url or os.getenv("AUTOAGENT_QUEUE") or DEFAULT_QUEUE_URL
+
+    if url.startswith("sqlite:"):
+        path = url[len("sqlite:"):]
+        if path.startswith("//"):
+            path = path[2:]   # sqlite:///abs/path → /abs/path
+        return SQLiteJobQueue(path)
+
+    if url.startswith("local-redis:"):
+        if _local_redis is None:
+            _local_redis = LocalRedis()
+        return RedisJobQueue(_local_redis)
+
+    if url.startswith(("redis://", "rediss://")):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for redis:// queues (pip install redis)")
+        return RedisJobQueue(redis.Redis.from_url(url, decode_responses=True))
+
+    raise ValueError(f"Unsupported queue URL: {url}")
@@ -0,0 +1,247 @@
+"""
+profiling.py
+-------------
+Opt-in CPU and memory profiling of pipeline stages.
+
+Responsibilities:
+- Wrap one stage at a time with cProfile and tracemalloc
+- Follow the stage into the thread pool: run_blocking() calls made
+  during the stage go through run_profiled(), which profiles them on the
+  pool thread and adds that thread to the stack sampler
+- Sample the stage's call stacks in the background for flamegraphs
+- Write, per stage, into Jobs/<job_id>/profile/:
+    <stage>.pstats       cProfile data (snakeviz, `python -m pstats`)
+    <stage>.alloc.txt    top allocation sites (net, by line)
+    <stage>.collapsed    collapsed stacks (flamegraph.pl, speedscope)
+- Keep a summary.json with wall/CPU time and memory per stage
+
+Disabled profiling costs nothing: run_pipeline() only enters
+StageProfiler.stage() when a profiler was requested.
+
+cProfile and the stack sampler cover the event-loop thread and the pool
+threads while they run the stage's run_blocking() calls; the event loop
+also runs other jobs' coroutines, so those show up in the stage's
+profile when several jobs share a process. On Python 3.12+ only one
+cProfile can be active per process, so pool threads are then covered by
+the stack samples only. tracemalloc is process-wide, so with several
+profiled jobs in one process the allocation sites include the other
+jobs' allocations.
+"""
+
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Set
+
+PROFILE_FOLDER = "profile"
+TOP_ALLOCATIONS = 30
+TRACEMALLOC_FRAMES = 1          # frames kept per allocation (more = slower)
+SAMPLE_INTERVAL = 0.005         # seconds between stack samples
+MAX_STACK_DEPTH = 128
+
+# tracemalloc is global: start it for the first profiled stage, stop after the last one
+_tracemalloc_users = 0
+_tracemalloc_lock = threading.Lock()
+
+
+def _start_tracemalloc() -> bool:
+    """Returns True if tracing is ours to stop later."""
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and tracemalloc.is_tracing():
+            return False   # started by someone else (e.g. python -X tracemalloc)
+        if _tracemalloc_users == 0:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracemalloc_users += 1
+        return True
+
+
+def _stop_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+class _StackSampler:
+    """Samples the stacks of a changing set of threads every SAMPLE_INTERVAL into collapsed-stack counts."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._threads: Set[int] = {thread_id}
+        self._threads_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def add_thread(self, thread_id: int) -> None:
+        with self._threads_lock:
+            self._threads.add(thread_id)
+
+    def remove_thread(self, thread_id: int) -> None:
+        with self._threads_lock:
+            self._threads.discard(thread_id)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._threads_lock:
+                thread_ids = list(self._threads)
+            current = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = current.get(thread_id)
+                frames: List[str] = []
+                while frame is not None and len(frames) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if frames:
+                    self.stacks[";".join(reversed(frames))] += 1
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class _ActiveStage:
+    """What run_profiled() needs from the stage being profiled."""
+
+    def __init__(self, sampler: _StackSampler):
+        self.sampler = sampler
+        self.worker_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def run(self, func: Callable, args, kwargs) -> Any:
+        thread_id = threading.get_ident()
+        profiler: Optional[cProfile.Profile] = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            profiler = None   # Python 3.12+: the stage's own cProfile is the only one allowed
+        self.sampler.add_thread(thread_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.sampler.remove_thread(thread_id)
+            if profiler is not None:
+                profiler.disable()
+                with self._lock:
+                    self.worker_profiles.append(profiler)
+
+
+# The stage being profiled in this context; run_blocking() copies it into pool threads
+_active_stage: contextvars.ContextVar[Optional[_ActiveStage]] = contextvars.ContextVar(
+    "autoagent_profiled_stage", default=None)
+
+
+def run_profiled(func: Callable, *args, **kwargs) -> Any:
+    """func(*args, **kwargs), profiled as part of the current stage if one is being profiled."""
+    stage = _active_stage.get()
+    if stage is None:
+        return func(*args, **kwargs)
+    return stage.run(func, args, kwargs)
+
+
+class StageProfiler:
+    """Collects per-stage profiles for one job."""
+
+    def __init__(self, job_path: str):
+        self.path = os.path.join(job_path, PROFILE_FOLDER)
+        os.makedirs(self.path, exist_ok=True)
+        self.summary: Dict[str, Dict] = {}
+        # A resumed job keeps the profiles of the stages it doesn't rerun
+        try:
+            with open(os.path.join(self.path, "summary.json"), "r", encoding="utf-8") as f:
+                self.summary = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    @contextmanager
+    def stage(self, name: str):
+        profiler: Optional[cProfile.Profile] = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active in this process (Python 3.12+ allows only one)
+            print(f"[PROFILE] cProfile busy; stage '{name}' gets memory and stack samples only.")
+            profiler = None
+
+        owns_tracing = _start_tracemalloc()
+        if hasattr(tracemalloc, "reset_peak"):   # Python 3.9+
+            tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        started, cpu_started = time.perf_counter(), time.process_time()
+
+        sampler = _StackSampler(threading.get_ident())
+        active = _ActiveStage(sampler)
+        token = _active_stage.set(active)
+        try:
+            with sampler:
+                yield
+        finally:
+            _active_stage.reset(token)
+            wall = time.perf_counter() - started
+            cpu = time.process_time() - cpu_started
+            if profiler is not None:
+                profiler.disable()
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if owns_tracing:
+                _stop_tracemalloc()
+            self._write(name, [profiler] + active.worker_profiles, sampler, before, after, wall, cpu, peak)
+
+    # ------------------------------------------------------------
+    # Output
+    # ------------------------------------------------------------
+    def _write(self, name: str, profilers: List[Optional[cProfile.Profile]], sampler: _StackSampler,
+               before: tracemalloc.Snapshot, after: tracemalloc.Snapshot,
+               wall: float, cpu: float, peak: int) -> None:
+        # The stage thread's profile and those of the pool threads, in one file
+        profilers = [p for p in profilers if p is not None]
+        if profilers:
+            stats = pstats.Stats(profilers[0])
+            for extra in profilers[1:]:
+                stats.add(extra)
+            stats.dump_stats(os.path.join(self.path, f"{name}.pstats"))
+        sampler.write(os.path.join(self.path, f"{name}.collapsed"))
+
+        # The profiler's own bookkeeping is not interesting
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        diffs = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+        top = [d for d in diffs if d.size_diff > 0][:TOP_ALLOCATIONS]
+        with open(os.path.join(self.path, f"{name}.alloc.txt"), "w", encoding="utf-8") as f:
+            f.write(f"# stage {name}: peak traced memory {peak / 1024 / 1024:.1f} MiB\n")
+            for diff in top:
+                frame = diff.traceback[0]
+                f.write(f"{diff.size_diff / 1024:10.1f} KiB  {diff.count_diff:8d} blocks  "
+                        f"{frame.filename}:{frame.lineno}\n")
+
+        self.summary[name] = {
+            "wall_time": round(wall, 3),
+            "cpu_time": round(cpu, 3),
+            "peak_traced_bytes": peak,
+            "net_allocated_bytes": sum(d.size_diff for d in diffs),
+            "stack_samples": sum(sampler.stacks.values()),
+        }
+        with open(os.path.join(self.path, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(self.summary, f, indent=2)
+        print(f"[PROFILE] Stage '{name}': {wall:.2f}s wall, {cpu:.2f}s CPU, "
+              f"peak {peak / 1024 / 1024:.1f} MiB -> {self.path}")
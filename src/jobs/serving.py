@@ -0,0 +1,220 @@
+"""
+serving.py
+-----------
+Production serving for server.py: one master process, N pre-forked workers.
+
+Responsibilities:
+- preload(): import server.py, the pipeline and the modules it otherwise
+  imports lazily (pdfminer, pypdf, GitPython, aiohttp) once in the master,
+  then freeze the GC so forked workers keep sharing those pages
+  copy-on-write instead of each paying for its own copy
+- serve(): run the Flask app under gunicorn with threaded workers,
+  max-requests recycling (with jitter, so workers don't restart together)
+  and a graceful timeout long enough for in-flight jobs to finish
+- count only requests that do work towards max-requests: health probes,
+  stats, static files, job polls and artifact downloads don't grow memory
+  and must not recycle workers on their own
+- server_state: this worker's liveness / readiness / draining state,
+  served at /healthz and /readyz
+
+Everything in-process is per worker: SingleFlight only coalesces identical
+URLs that reach the same worker, and each worker has its own LLMHealth
+breaker and /api/stats counters. Share work across workers with the job
+queue (AUTOAGENT_QUEUE).
+
+Signals (sent to the master):
+    TERM / INT   stop accepting, drain in-flight jobs, exit
+    HUP          replace the workers; old ones drain first. Preloaded code
+                 is NOT reloaded: restart the master to deploy new code.
+    TTIN / TTOU  one worker more / less
+
+`python server.py` remains the single-process development server.
+"""
+
+import gc
+import importlib
+import os
+import random
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from src.jobs.deadline import DEFAULT_JOB_DEADLINE, DEADLINE_ENV
+
+SERVER_BIND = os.getenv("AUTOAGENT_SERVER_BIND", "0.0.0.0:5000")
+SERVER_WORKERS = int(os.getenv("AUTOAGENT_SERVER_WORKERS", str(os.cpu_count() or 2)))
+SERVER_THREADS = int(os.getenv("AUTOAGENT_SERVER_THREADS", "4"))       # concurrent requests per worker
+MAX_REQUESTS = int(os.getenv("AUTOAGENT_SERVER_MAX_REQUESTS", "200"))  # then the worker is replaced (0 = never)
+MAX_REQUESTS_JITTER = 0.1       # fraction of MAX_REQUESTS
+DRAIN_MARGIN = 60.0             # seconds on top of the job deadline
+
+# Not counted towards max-requests: cheap, and probes alone would recycle an idle worker
+UNCOUNTED_PATHS = ("/healthz", "/readyz", "/api/stats")
+UNCOUNTED_PREFIXES = ("/static/", "/api/jobs/")   # job status polls and artifact downloads
+
+# Imported inside functions elsewhere (to keep CLI startup fast); a server wants them up front
+PRELOAD_MODULES = (
+    "server",
+    "pdfminer.high_level",
+    "pdfminer.layout",
+    "pypdf",
+    "git",
+    "aiohttp",
+    "bs4",
+)
+
+
+# ------------------------------------------------------------
+# Worker state
+# ------------------------------------------------------------
+class ServerState:
+    """Per-process counters behind the health endpoints."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.max_requests = 0   # set by serve(); 0 = never recycle
+        self.reset()
+
+    def reset(self) -> None:
+        # Called again in every forked worker: the master's values mean nothing there
+        with self._lock:
+            self.pid = os.getpid()
+            self.started = time.time()
+            self.in_flight = 0
+            self.handled = 0
+            self.draining = False
+            self.drain_reason: Optional[str] = None
+            self.counted = 0
+            jitter = int(self.max_requests * MAX_REQUESTS_JITTER)
+            self.recycle_after = self.max_requests + random.randint(0, jitter) if self.max_requests else 0
+
+    @contextmanager
+    def job(self):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.handled += 1
+
+    def count_request(self) -> bool:
+        """Count one request towards max-requests; True once the worker should be replaced."""
+        with self._lock:
+            self.counted += 1
+            return bool(self.recycle_after) and self.counted >= self.recycle_after
+
+    def start_draining(self, reason: str) -> None:
+        with self._lock:
+            if not self.draining:
+                self.draining, self.drain_reason = True, reason
+                print(f"[SERVER] Worker {self.pid} draining ({reason}), {self.in_flight} job(s) in flight")
+
+    def liveness(self) -> Dict[str, Any]:
+        return {"status": "alive", "pid": self.pid, "uptime": round(time.time() - self.started, 1),
+                "in_flight": self.in_flight, "handled": self.handled}
+
+    def readiness(self) -> Tuple[bool, Dict[str, Any]]:
+        if self.draining:
+            return False, {"status": "draining", "pid": self.pid, "reason": self.drain_reason,
+                           "in_flight": self.in_flight}
+        return True, {"status": "ready", "pid": self.pid, "in_flight": self.in_flight}
+
+
+server_state = ServerState()
+
+
+# ------------------------------------------------------------
+# Preloading
+# ------------------------------------------------------------
+def preload() -> Any:
+    """Import everything a request can touch and return server.app."""
+    started = time.perf_counter()
+    loaded = []
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except ImportError:
+            pass   # optional dependency: the worker behaves as it would without preloading
+    # Objects that survive until the fork are never freed; keep the collector off their pages
+    gc.collect()
+    gc.freeze()
+    print(f"[SERVER] Preloaded {len(loaded)} modules in {time.perf_counter() - started:.2f}s "
+          f"({gc.get_freeze_count()} objects frozen)")
+    return importlib.import_module("server").app
+
+
+def _post_fork(server, worker) -> None:
+    server_state.reset()
+
+
+def _post_worker_init(worker) -> None:
+    # gunicorn's own TERM handler stops the accept loop; mark the worker unready first
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def on_term(signum, frame):
+        server_state.start_draining("shutdown")
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGTERM, on_term)
+
+
+def _counts_towards_recycling(path: str) -> bool:
+    return path not in UNCOUNTED_PATHS and not path.startswith(UNCOUNTED_PREFIXES)
+
+
+def _pre_request(worker, req) -> None:
+    # gunicorn's own max_requests counts every request; this one skips probes and downloads.
+    # Clearing `alive` is what gunicorn does itself: stop accepting, finish in-flight, exit.
+    if _counts_towards_recycling(req.path) and server_state.count_request():
+        worker.alive = False
+        server_state.start_draining("max requests")
+
+
+# ------------------------------------------------------------
+# gunicorn
+# ------------------------------------------------------------
+def serve(bind: str = SERVER_BIND, workers: int = SERVER_WORKERS, threads: int = SERVER_THREADS,
+          max_requests: int = MAX_REQUESTS) -> None:
+    """Run server.app with pre-forked workers until the master is told to stop."""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise RuntimeError("Production serving requires gunicorn (pip install gunicorn); "
+                           "use `python server.py` for development")
+
+    drain_timeout = int(float(os.getenv(DEADLINE_ENV) or DEFAULT_JOB_DEADLINE) + DRAIN_MARGIN)
+    options = {
+        "bind": bind,
+        "workers": workers,
+        "worker_class": "gthread",
+        "threads": threads,
+        "preload_app": True,
+        "max_requests": 0,   # counted in _pre_request instead
+        # A draining worker stops heartbeating, so the master must not count the drain as a hang
+        "graceful_timeout": drain_timeout,
+        "timeout": drain_timeout,
+        "post_fork": _post_fork,
+        "post_worker_init": _post_worker_init,
+        "pre_request": _pre_request,
+    }
+
+    class _PreforkApplication(BaseApplication):
+
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return preload()
+
+    server_state.max_requests = max_requests   # each forked worker draws its jitter in reset()
+
+    print(f"[SERVER] Serving on {bind}: {workers} workers x {threads} threads, "
+          f"recycled every ~{max_requests} pipeline requests")
+    _PreforkApplication().run()
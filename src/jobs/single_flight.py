@@ -0,0 +1,135 @@
+"""
+single_flight.py
+-----------------
+Coalesces identical in-flight pipeline submissions.
+
+Responsibilities:
+- Normalize paper URLs into a stable coalescing key
+- Run ONE execution per key at a time
+- Let every concurrent caller with the same key wait for that execution
+  and receive its result (or its exception)
+- Keep counters so the coalescing ratio can be exposed in stats
+
+Keys are plain strings: url_key() gives "url:<normalized url>", plus
+"#deadline=<seconds>" when the request brings its own time budget, so
+a caller never inherits a run started with a shorter one.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from src.pdf.fetch_policy import normalize_paper_url
+
+
+def normalize_pdf_url(url: str) -> str:
+    """
+    Normalize a paper URL so trivially different spellings share one key.
+
+    - lowercases scheme and host, drops "www." and default ports
+    - upgrades http to https
+    - drops the fragment and sorts the query string
+    - strips trailing slashes
+    - arXiv abs/ and OpenReview forum pages become their PDF URLs
+    """
+    parts = urlsplit(normalize_paper_url(url))
+
+    scheme = (parts.scheme or "https").lower()
+    if scheme == "http":
+        scheme = "https"
+
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def url_key(url: str, deadline: Optional[float] = None) -> str:
+    """Coalescing key for a submission identified by its paper URL (and explicit deadline)."""
+    key = f"url:{normalize_pdf_url(url)}"
+    return key if deadline is None else f"{key}#deadline={deadline:g}"
+
+
+class _Call:
+    """One in-flight execution that followers can attach to."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Thread-safe single-flight group.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running block and share the leader's outcome.
+    Once the execution finishes the key is released, so later submissions
+    run fresh. In-process only: under pre-forked serving, each worker has
+    its own group.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._requests = 0
+        self._executions = 0
+        self._coalesced = 0
+
+    def do(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) once per in-flight key and return its result."""
+        with self._lock:
+            self._requests += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self._coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executions += 1
+                leader = True
+
+        if not leader:
+            print(f"[SINGLEFLIGHT] Attached to in-flight execution: {key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self) -> Dict[str, int]:
+        """Return {key: number of attached followers} for running executions."""
+        with self._lock:
+            return {key: call.followers for key, call in self._calls.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and the coalescing ratio (share of requests that attached)."""
+        with self._lock:
+            requests_seen = self._requests
+            return {
+                "requests": requests_seen,
+                "executions": self._executions,
+                "coalesced": self._coalesced,
+                "in_flight": len(self._calls),
+                "coalescing_ratio": round(self._coalesced / requests_seen, 4) if requests_seen else 0.0,
+            }
@@ -0,0 +1,486 @@
+"""
+snapshots.py
+-------------
+Disposable copy-on-write views of a cloned repository.
+
+Responsibilities:
+- Snapshot: one writable view of a pristine clone, made with the cheapest
+  method the host allows:
+      overlay   overlayfs mount (root only); nothing is copied
+      reflink   per-file FICLONE (btrfs, XFS, bcachefs): shared extents
+      hardlink  directory tree rebuilt, large files hard-linked (and made
+                read-only), small ones copied; not used as root
+      copy      plain copy (other filesystems, Windows)
+- Snapshot.reset(): back to pristine by undoing only what changed (new
+  files removed, modified or deleted ones restored)
+- SnapshotPool: idle, already reset snapshots per clone, so reruns and
+  concurrent executions skip the setup
+- clean_stale_snapshots(): remove views left behind by dead processes
+
+The clone itself is never written: demos run in a snapshot, and whatever
+they create (outputs, caches, downloads) goes away with it.
+
+A hard link is the clone's own file. Creating, deleting or renaming files
+in the view is isolated, but rewriting a linked file in place would
+change the clone too. That is why only files of HARDLINK_MIN_BYTES or
+more (weights, datasets) are linked, why their write bits are removed
+(the shared inode, so the clone's copy turns read-only as well: discard()
+gives the owner write bit back once no other view links the file), and
+why the method is skipped as root, where file modes don't stop writes. Should
+a linked file change anyway (a demo that chmods it back), reset() reports
+it in `mutated_shared`, does not link the damaged file back in, and the
+pool drops the view; the caller has to clone again. Reflink and overlay
+views have no such gap.
+"""
+
+import errno
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:   # Windows: no reflinks
+    fcntl = None
+
+from src.jobs.workspace import SNAPSHOT_FOLDER, TMPFS_ROOT, WORKSPACE_ROOT, _pid_alive
+
+# SNAPSHOT_FOLDER sits next to the clone, so links and reflinks stay on one filesystem
+SNAPSHOT_METHOD = os.getenv("AUTOAGENT_SNAPSHOT_METHOD", "auto")   # auto | overlay | reflink | hardlink | copy
+METHODS = ("overlay", "reflink", "hardlink", "copy")
+HARDLINK_MIN_BYTES = 64 * 1024       # smaller files (source, configs) are copied: cheap, and safe to edit
+POOL_IDLE_PER_CLONE = 2
+POOL_MAX_IDLE = 8
+STALE_AFTER = 60.0                   # seconds before an unlabeled snapshot folder counts as abandoned
+FICLONE = 0x40049409                 # linux/fs.h: _IOW(0x94, 9, int)
+_NO_REFLINK = (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.ENOSYS, errno.EPERM)
+
+# (kind, inode, size, mtime_ns) of every entry in a fresh view
+Manifest = Dict[str, Tuple[str, int, int, int]]
+
+# st_dev -> whether FICLONE works there
+_reflink_support: Dict[int, bool] = {}
+
+
+# ------------------------------------------------------------
+# File materialization
+# ------------------------------------------------------------
+def _reflink(src: str, dst: str) -> None:
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+    shutil.copystat(src, dst)
+
+
+def _reflink_works(source_root: str, snapshot_root: str) -> bool:
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    device = os.stat(snapshot_root).st_dev
+    if device not in _reflink_support:
+        probe_src = os.path.join(snapshot_root, ".reflink-probe-src")
+        probe_dst = os.path.join(snapshot_root, ".reflink-probe-dst")
+        try:
+            with open(probe_src, "wb") as f:
+                f.write(b"probe")
+            _reflink(probe_src, probe_dst)
+            _reflink_support[device] = os.stat(source_root).st_dev == device
+        except OSError as e:
+            if e.errno not in _NO_REFLINK:
+                raise
+            _reflink_support[device] = False
+        finally:
+            for path in (probe_src, probe_dst):
+                if os.path.exists(path):
+                    os.remove(path)
+    return _reflink_support[device]
+
+
+def _mount_overlay(lower: str, upper: str, work: str, merged: str) -> bool:
+    options = f"lowerdir={os.path.abspath(lower)},upperdir={upper},workdir={work}"
+    try:
+        result = subprocess.run(["mount", "-t", "overlay", "overlay", "-o", options, merged],
+                                capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return result.returncode == 0
+
+
+def _unmount(merged: str) -> None:
+    subprocess.run(["umount", "-l", merged], capture_output=True, timeout=30)
+
+
+def _links_protected() -> bool:
+    # Read-only modes only stop writes from non-root processes
+    return not hasattr(os, "geteuid") or os.geteuid() != 0
+
+
+def _make_read_only(path: str) -> None:
+    mode = os.lstat(path).st_mode
+    if mode & 0o222:
+        os.chmod(path, mode & ~0o222)
+
+
+def _restore_write(path: str) -> None:
+    # Git checks files out 0644 / 0755: the owner write bit is all _make_read_only() took
+    mode = os.lstat(path).st_mode
+    os.chmod(path, mode | 0o200)
+
+
+def _clear(path: str) -> None:
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+# ------------------------------------------------------------
+# Snapshot
+# ------------------------------------------------------------
+class Snapshot:
+    """One writable view of `source` under <source's parent>/.snapshots/."""
+
+    def __init__(self, source: str, method: str = SNAPSHOT_METHOD):
+        self.source = os.path.abspath(source)
+        if not os.path.isdir(self.source):
+            raise FileNotFoundError(f"Cannot snapshot missing clone: {source}")
+        name = f"{os.path.basename(self.source)}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.root = os.path.join(os.path.dirname(self.source), SNAPSHOT_FOLDER, name)
+        # Keep the repo's folder name: some demos look at their own path
+        self.path = os.path.join(self.root, os.path.basename(self.source))
+        self.manifest: Manifest = {}
+        self.mutated_shared: List[str] = []
+        self.resets = 0
+        os.makedirs(self.root)
+        with open(os.path.join(self.root, "snapshot.json"), "w", encoding="utf-8") as f:
+            json.dump({"source": self.source, "pid": os.getpid()}, f)
+
+        started = time.monotonic()
+        try:
+            self.method = self._create(method)
+        except BaseException:
+            self.discard()
+            raise
+        self.setup_time = round(time.monotonic() - started, 3)
+        print(f"[SNAPSHOT] {os.path.basename(self.source)}: {self.method} view in {self.setup_time}s")
+
+    # ------------------------------------------------------------
+    # Creation
+    # ------------------------------------------------------------
+    def _create(self, method: str) -> str:
+        if method not in ("auto",) + METHODS:
+            raise ValueError(f"Unknown snapshot method: {method}")
+        wanted = METHODS if method == "auto" else METHODS[METHODS.index(method):]
+        if "overlay" in wanted and self._create_overlay():
+            return "overlay"
+        if "reflink" in wanted and _reflink_works(self.source, self.root):
+            self._build_tree("reflink")
+            return "reflink"
+        if "hardlink" in wanted and not _links_protected():
+            print("[SNAPSHOT] Running as root: linked files can't be protected, copying instead of hard-linking")
+        elif "hardlink" in wanted:
+            try:
+                self._build_tree("hardlink")
+                return "hardlink"
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+                shutil.rmtree(self.path, ignore_errors=True)
+        self._build_tree("copy")
+        return "copy"
+
+    def _create_overlay(self) -> bool:
+        if not sys.platform.startswith("linux") or os.geteuid() != 0:
+            return False
+        upper, work = os.path.join(self.root, ".upper"), os.path.join(self.root, ".work")
+        for folder in (upper, work, self.path):
+            os.makedirs(folder)
+        if _mount_overlay(self.source, upper, work, self.path):
+            return True
+        # No overlay support here (e.g. the root is itself an overlay without nesting)
+        for folder in (upper, work, self.path):
+            os.rmdir(folder)
+        return False
+
+    def _build_tree(self, method: str) -> None:
+        self._method = method
+        os.makedirs(self.path, exist_ok=True)
+        for rel, kind in self._walk(self.source):
+            self._materialize(rel, kind)
+        self.manifest = self._scan()
+
+    def _materialize(self, rel: str, kind: str) -> None:
+        src, dst = os.path.join(self.source, rel), os.path.join(self.path, rel)
+        if kind == "d":
+            os.makedirs(dst, exist_ok=True)
+        elif kind == "l":
+            os.symlink(os.readlink(src), dst)
+        elif self._method == "reflink":
+            _reflink(src, dst)
+        elif self._method == "hardlink" and os.lstat(src).st_size >= HARDLINK_MIN_BYTES:
+            os.link(src, dst)
+            _make_read_only(dst)
+        else:
+            shutil.copy2(src, dst, follow_symlinks=False)
+
+    @staticmethod
+    def _walk(top: str) -> Iterator[Tuple[str, str]]:
+        """(relative path, kind) for every entry, parents before children."""
+        stack = [""]
+        while stack:
+            current = stack.pop()
+            with os.scandir(os.path.join(top, current)) as entries:
+                for entry in entries:
+                    rel = os.path.join(current, entry.name)
+                    if entry.is_symlink():
+                        yield rel, "l"
+                    elif entry.is_dir():
+                        yield rel, "d"
+                        stack.append(rel)
+                    else:
+                        yield rel, "f"
+
+    def _scan(self) -> Manifest:
+        manifest = {}
+        for rel, kind in self._walk(self.path):
+            st = os.lstat(os.path.join(self.path, rel))
+            manifest[rel] = (kind, st.st_ino, st.st_size, st.st_mtime_ns)
+        return manifest
+
+    # ------------------------------------------------------------
+    # Reset / discard
+    # ------------------------------------------------------------
+    def reset(self) -> Dict:
+        """Make the view pristine again; returns what had to be undone."""
+        started = time.monotonic()
+        if self.method == "overlay":
+            # Everything the run changed lives in upperdir
+            _unmount(self.path)
+            upper, work = os.path.join(self.root, ".upper"), os.path.join(self.root, ".work")
+            changed = sum(1 for _ in self._walk(upper))
+            _clear(upper)
+            _clear(work)
+            if not _mount_overlay(self.source, upper, work, self.path):
+                raise RuntimeError(f"Could not remount overlay snapshot of {self.source}")
+            removed, restored = changed, 0
+        else:
+            removed, restored = self._undo_changes()
+        self.resets += 1
+        report = {"removed": removed, "restored": restored, "reset_time": round(time.monotonic() - started, 3)}
+        if self.mutated_shared:
+            report["mutated_shared"] = list(self.mutated_shared)
+        return report
+
+    def _undo_changes(self) -> Tuple[int, int]:
+        removed = restored = 0
+        present = set()
+        for rel, kind in list(self._walk(self.path)):
+            expected = self.manifest.get(rel)
+            full = os.path.join(self.path, rel)
+            if not os.path.lexists(full):
+                continue   # inside a folder removed earlier in this pass
+            if expected is None or expected[0] != kind:
+                if kind == "d":
+                    shutil.rmtree(full)
+                else:
+                    os.remove(full)
+                removed += 1
+                continue
+            present.add(rel)
+            if kind != "d":
+                st = os.lstat(full)
+                if (st.st_ino, st.st_size, st.st_mtime_ns) != expected[1:]:
+                    if st.st_ino == expected[1] and st.st_nlink > 1:
+                        # Rewritten in place through a hard link: the clone has the same bytes now
+                        self.mutated_shared.append(rel)
+                        print(f"[SNAPSHOT] Warning: {rel} was modified in place; the clone changed too.")
+                    os.remove(full)
+                    present.discard(rel)
+        for rel in sorted(self.manifest):   # parents sort before their children
+            if rel in self.mutated_shared:
+                continue   # the clone's own copy is damaged: linking it back would only hide that
+            if rel not in present and not os.path.lexists(os.path.join(self.path, rel)):
+                self._materialize(rel, self.manifest[rel][0])
+                restored += 1
+        # Restored entries have new inodes and times
+        self.manifest = self._scan()
+        return removed, restored
+
+    def discard(self) -> None:
+        if getattr(self, "method", None) == "overlay":
+            _unmount(self.path)
+        elif getattr(self, "method", None) == "hardlink":
+            self._unprotect_links()
+        shutil.rmtree(self.root, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(self.root))   # only succeeds once the last snapshot is gone
+        except OSError:
+            pass
+
+    def _unprotect_links(self) -> None:
+        """Give the clone's linked files their write bit back, unless another view still links them."""
+        for rel, (kind, inode, _, _) in self.manifest.items():
+            full = os.path.join(self.path, rel)
+            try:
+                st = os.lstat(full)
+                # 2 links: the clone's and this view's
+                if kind == "f" and st.st_ino == inode and st.st_nlink == 2:
+                    _restore_write(full)
+            except OSError:
+                continue
+
+    def report(self) -> Dict:
+        return {"method": self.method, "setup_time": self.setup_time, "resets": self.resets}
+
+
+# ------------------------------------------------------------
+# Pool
+# ------------------------------------------------------------
+class SnapshotPool:
+    """Reset snapshots kept per clone; acquire() hands one out or makes a new one."""
+
+    def __init__(self, idle_per_clone: int = POOL_IDLE_PER_CLONE, max_idle: int = POOL_MAX_IDLE):
+        self.idle_per_clone = idle_per_clone
+        self.max_idle = max_idle
+        self._idle: Dict[str, List[Snapshot]] = {}
+        self._order: List[Snapshot] = []   # idle snapshots, least recently released first
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "reused": 0, "resets": 0, "discarded": 0, "reset_time": 0.0}
+
+    def acquire(self, source: str) -> Snapshot:
+        source = os.path.abspath(source)
+        # Clones evicted by the workspace manager take their idle views with them
+        for gone in [key for key in list(self._idle) if not os.path.isdir(key)]:
+            self.discard_all(gone)
+        with self._lock:
+            idle = self._idle.get(source) or []
+            snapshot = idle.pop() if idle else None
+            if snapshot is not None:
+                self._order.remove(snapshot)
+                self._stats["reused"] += 1
+        if snapshot is not None:
+            return snapshot
+        snapshot = Snapshot(source)
+        with self._lock:
+            self._stats["created"] += 1
+        return snapshot
+
+    def release(self, snapshot: Snapshot) -> Dict:
+        """Reset `snapshot` and keep it for the next acquire() (or discard it)."""
+        try:
+            report = snapshot.reset()
+        except Exception as e:
+            print(f"[SNAPSHOT] Reset failed ({e}); discarding {snapshot.root}")
+            self._discard(snapshot)
+            return {"error": str(e)}
+        evicted = []
+        with self._lock:
+            self._stats["resets"] += 1
+            self._stats["reset_time"] = round(self._stats["reset_time"] + report["reset_time"], 3)
+            idle = self._idle.setdefault(snapshot.source, [])
+            # A clone rewritten through a hard link is no longer pristine: don't hand out views of it
+            keep = os.path.isdir(snapshot.source) and not snapshot.mutated_shared \
+                and len(idle) < self.idle_per_clone
+            if keep:
+                idle.append(snapshot)
+                self._order.append(snapshot)
+                while len(self._order) > self.max_idle:
+                    oldest = self._order.pop(0)
+                    self._idle[oldest.source].remove(oldest)
+                    evicted.append(oldest)
+        for old in evicted + ([] if keep else [snapshot]):
+            self._discard(old)
+        return report
+
+    @contextmanager
+    def checkout(self, source: str):
+        """Snapshot of `source` for the duration of the block."""
+        snapshot = self.acquire(source)
+        try:
+            yield snapshot
+        finally:
+            self.release(snapshot)
+
+    def discard_all(self, source: Optional[str] = None) -> None:
+        with self._lock:
+            keys = [os.path.abspath(source)] if source else list(self._idle)
+            doomed = [snapshot for key in keys for snapshot in self._idle.pop(key, [])]
+            self._order = [s for s in self._order if s not in doomed]
+        for snapshot in doomed:
+            self._discard(snapshot)
+
+    def _discard(self, snapshot: Snapshot) -> None:
+        snapshot.discard()
+        with self._lock:
+            self._stats["discarded"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {**self._stats, "idle": len(self._order)}
+
+
+def clean_stale_snapshots(workspace_root: str) -> List[str]:
+    """Remove snapshots whose owning process is gone (crashes, kill -9)."""
+    removed = []
+    folder = os.path.join(workspace_root, SNAPSHOT_FOLDER)
+    for name in os.listdir(folder) if os.path.isdir(folder) else []:
+        root = os.path.join(folder, name)
+        try:
+            with open(os.path.join(root, "snapshot.json"), "r", encoding="utf-8") as f:
+                pid = json.load(f)["pid"]
+        except (OSError, ValueError, KeyError):
+            pid = None
+        if pid is not None and _pid_alive(pid):
+            continue
+        if pid is None and time.time() - os.path.getmtime(root) < STALE_AFTER:
+            continue   # still being created
+        merged = os.path.join(root, name.rsplit("-", 2)[0])
+        if os.path.ismount(merged):
+            _unmount(merged)
+        shutil.rmtree(root, ignore_errors=True)
+        removed.append(name)
+    if removed:
+        print(f"[SNAPSHOT] Removed {len(removed)} stale snapshot(s).")
+    return removed
+
+
+def discard_clone_snapshots(source: str) -> None:
+    """
+    Remove every snapshot of `source` (the clone is being deleted): this
+    process's idle ones through the pool, then any left on disk by other
+    processes' pools, which drop their stale entries on their next acquire().
+    """
+    source = os.path.abspath(source)
+    if _pool is not None:
+        _pool.discard_all(source)
+    folder = os.path.join(os.path.dirname(source), SNAPSHOT_FOLDER)
+    for name in os.listdir(folder) if os.path.isdir(folder) else []:
+        root = os.path.join(folder, name)
+        try:
+            with open(os.path.join(root, "snapshot.json"), "r", encoding="utf-8") as f:
+                if json.load(f)["source"] != source:
+                    continue
+        except (OSError, ValueError, KeyError):
+            continue
+        merged = os.path.join(root, os.path.basename(source))
+        if os.path.ismount(merged):
+            _unmount(merged)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+_pool: Optional[SnapshotPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_snapshot_pool() -> SnapshotPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            for root in (WORKSPACE_ROOT, TMPFS_ROOT):
+                if root:
+                    clean_stale_snapshots(root)
+            _pool = SnapshotPool()
+        return _pool
@@ -0,0 +1,124 @@
+"""
+Tests for job_queue.py: the SQLite backend and the Redis backend on LocalRedis.
+
+Run with: python -m pytest src/jobs/test_job_queue.py
+"""
+
+import threading
+import time
+
+import pytest
+
+from src.jobs.job_queue import (
+    DONE, FAILED, LEASED, QUEUED, LeaseLost, LocalRedis, RedisJobQueue, SQLiteJobQueue,
+)
+
+SHORT_LEASE = 0.2  # seconds; tests sleep past it to expire a lease
+
+
+@pytest.fixture(params=["sqlite", "local-redis"])
+def queue(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteJobQueue(str(tmp_path / "queue.sqlite3"))
+    return RedisJobQueue(LocalRedis())
+
+
+def test_lease_and_complete(queue):
+    job_id = queue.enqueue({"url": "x"})
+    assert queue.get(job_id)["status"] == QUEUED
+
+    lease = queue.lease("w1")
+    assert lease.job_id == job_id and lease.attempt == 1 and lease.payload == {"url": "x"}
+    assert queue.get(job_id)["status"] == LEASED
+    assert queue.lease("w2") is None
+
+    queue.complete(lease, {"ok": True})
+    job = queue.get(job_id)
+    assert job["status"] == DONE and job["result"] == {"ok": True}
+    assert queue.lease("w2") is None
+
+
+def test_expired_lease_is_handed_out_again(queue):
+    job_id = queue.enqueue({"url": "x"})
+    first = queue.lease("w1", visibility_timeout=SHORT_LEASE)
+    time.sleep(SHORT_LEASE * 2)
+
+    second = queue.lease("w2")
+    assert second.job_id == job_id and second.attempt == 2
+
+    # The first worker came back too late: it no longer owns the job
+    with pytest.raises(LeaseLost):
+        queue.heartbeat(first)
+    with pytest.raises(LeaseLost):
+        queue.complete(first, {"from": "w1"})
+
+    queue.complete(second, {"from": "w2"})
+    assert queue.get(job_id)["result"] == {"from": "w2"}
+
+
+def test_heartbeat_keeps_the_lease(queue):
+    queue.enqueue({"url": "x"})
+    lease = queue.lease("w1", visibility_timeout=SHORT_LEASE)
+    for _ in range(3):
+        time.sleep(SHORT_LEASE / 2)
+        queue.heartbeat(lease, visibility_timeout=SHORT_LEASE)
+    assert queue.lease("w2") is None
+    queue.complete(lease, {})
+
+
+def test_fail_retries_until_max_attempts(queue):
+    job_id = queue.enqueue({"url": "x"}, max_attempts=2)
+
+    lease = queue.lease("w1")
+    queue.fail(lease, "boom")
+    assert queue.get(job_id)["status"] == QUEUED
+
+    lease = queue.lease("w1")
+    assert lease.attempt == 2
+    queue.fail(lease, "boom again")
+    job = queue.get(job_id)
+    assert job["status"] == FAILED and job["error"] == "boom again"
+    assert queue.lease("w1") is None
+
+
+def test_fail_without_retry_is_final(queue):
+    job_id = queue.enqueue({"url": "x"})
+    queue.fail(queue.lease("w1"), "bad input", retry=False)
+    assert queue.get(job_id)["status"] == FAILED
+    assert queue.lease("w1") is None
+
+
+def test_expired_last_attempt_is_marked_failed(queue):
+    job_id = queue.enqueue({"url": "x"}, max_attempts=1)
+    lease = queue.lease("w1", visibility_timeout=SHORT_LEASE)
+    time.sleep(SHORT_LEASE * 2)
+
+    assert queue.lease("w2") is None
+    job = queue.get(job_id)
+    assert job["status"] == FAILED and job["error"]
+    with pytest.raises(LeaseLost):
+        queue.complete(lease, {})
+
+
+def test_concurrent_workers_lease_each_job_once(queue):
+    job_ids = {queue.enqueue({"n": n}) for n in range(40)}
+    leased = []
+    lock = threading.Lock()
+
+    def work(worker_id):
+        while True:
+            lease = queue.lease(worker_id)
+            if lease is None:
+                return
+            with lock:
+                leased.append(lease.job_id)
+            queue.complete(lease, {"by": worker_id})
+
+    threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(leased) == sorted(job_ids)
+    assert queue.stats()[DONE] == len(job_ids)
@@ -0,0 +1,135 @@
+"""
+worker.py
+----------
+Worker process that pulls pipeline jobs from the shared queue.
+
+Responsibilities:
+- Lease one job at a time from the queue (see job_queue.py)
+- Heartbeat in the background so the lease outlives long stages
+- Run the pipeline with the QUEUE's job id, so a job retried after a
+  worker died resumes from that job's checkpoints instead of starting over
+- Store the results (or the error) back into the queue
+
+Run one per node / container:
+    python main.py worker [--queue URL] [--worker-id NAME]
+"""
+
+import os
+import socket
+import threading
+import time
+from typing import Optional
+
+from src.jobs.deadline import Deadline, job_deadline
+from src.jobs.job_queue import (
+    DEFAULT_VISIBILITY_TIMEOUT, JobQueue, Lease, LeaseLost, open_queue,
+)
+
+POLL_INTERVAL = 2.0  # seconds between lease attempts when the queue is empty
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class _Heartbeat:
+    """Extends a lease every visibility_timeout / 3 until stopped."""
+
+    def __init__(self, queue: JobQueue, lease: Lease, visibility_timeout: float, deadline: Deadline):
+        self.queue = queue
+        self.lease = lease
+        self.visibility_timeout = visibility_timeout
+        self.deadline = deadline
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{lease.job_id}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.visibility_timeout / 3):
+            try:
+                self.queue.heartbeat(self.lease, self.visibility_timeout)
+            except LeaseLost:
+                print(f"[WORKER] Lost the lease on job {self.lease.job_id}; another worker may take it over.")
+                self.lost = True
+                self.deadline.cancel()   # stop the local run (kills git / pip / demo subprocesses)
+                return
+            except Exception as e:
+                # A missed beat is not fatal; the next one may succeed before the lease expires
+                print(f"[WORKER] Heartbeat failed for job {self.lease.job_id}: {e}")
+
+
+class Worker:
+
+    def __init__(self, queue: JobQueue, worker_id: Optional[str] = None,
+                 visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT,
+                 poll_interval: float = POLL_INTERVAL):
+        self.queue = queue
+        self.worker_id = worker_id or default_worker_id()
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.processed = 0
+
+    def run_once(self) -> bool:
+        """Lease and run one job. Returns False if the queue was empty."""
+        lease = self.queue.lease(self.worker_id, self.visibility_timeout)
+        if lease is None:
+            return False
+
+        print(f"[WORKER] {self.worker_id} running job {lease.job_id} (attempt {lease.attempt}).")
+        deadline = job_deadline(lease.payload.get("deadline"))
+        with _Heartbeat(self.queue, lease, self.visibility_timeout, deadline) as heartbeat:
+            try:
+                results = self._execute(lease, deadline)
+                error = None
+            except Exception as e:
+                results, error = None, f"{type(e).__name__}: {e}"
+
+        if heartbeat.lost:
+            return True   # the job belongs to someone else now; don't overwrite their outcome
+
+        try:
+            if error is None:
+                self.queue.complete(lease, results)
+            else:
+                self.queue.fail(lease, error)
+        except LeaseLost:
+            print(f"[WORKER] Job {lease.job_id} was taken over before it could be stored.")
+        self.processed += 1
+        return True
+
+    def _execute(self, lease: Lease, deadline: Deadline) -> dict:
+        # Imported here so the worker process starts fast and only loads the pipeline once
+        from pipeline import run_pipeline
+
+        payload = lease.payload
+        return run_pipeline(payload["pdf_url"], job_id=lease.job_id, from_stage=payload.get("from_stage"),
+                            deadline=deadline, profile=bool(payload.get("profile")))
+
+    def run_forever(self, max_jobs: Optional[int] = None, exit_when_empty: bool = False) -> int:
+        print(f"[WORKER] {self.worker_id} polling for jobs...")
+        while max_jobs is None or self.processed < max_jobs:
+            if not self.run_once():
+                if exit_when_empty:
+                    break
+                time.sleep(self.poll_interval)
+        return self.processed
+
+
+def run_worker(queue_url: Optional[str] = None, worker_id: Optional[str] = None,
+               max_jobs: Optional[int] = None, exit_when_empty: bool = False) -> int:
+    worker = Worker(open_queue(queue_url), worker_id=worker_id)
+    try:
+        return worker.run_forever(max_jobs=max_jobs, exit_when_empty=exit_when_empty)
+    except KeyboardInterrupt:
+        # The current lease simply expires and the job is retried elsewhere
+        print(f"[WORKER] {worker.worker_id} stopped after {worker.processed} jobs.")
+        return worker.processed
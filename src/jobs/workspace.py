@@ -0,0 +1,341 @@
+"""
+workspace.py
+-------------
+Disk-budgeted workspaces for cloned repositories and per-job scratch files.
+
+Responsibilities:
+- Allocate one workspace per (job, repository) under ImportedProjects/
+  (or on tmpfs when one is configured and the repo is small)
+- Track each workspace's size and last use in a small registry file
+- Pin the workspaces of in-flight jobs so they are never evicted
+- Count each clone's snapshots (src/jobs/snapshots.py, kept in .snapshots/
+  beside the clones) against the same budget, and discard them with the
+  clone when it is evicted
+- Evict least-recently-used workspaces to stay under the disk budget
+- Give each job a scratch directory for temp artifacts (downloaded PDFs)
+  that is removed when the job ends
+- Report usage statistics
+
+The registry (ImportedProjects/.workspaces.json) is guarded by a file
+lock, so several workers on one host can share the same root. Folders
+found in the root that the registry doesn't know (older clones) are
+adopted with their mtime as last use, so they can be evicted too.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:   # Windows: fall back to the in-process lock only
+    fcntl = None
+
+WORKSPACE_ROOT = "ImportedProjects"
+REGISTRY_FILE = ".workspaces.json"
+LOCK_FILE = ".workspaces.lock"
+SCRATCH_FOLDER = ".scratch"
+SNAPSHOT_FOLDER = ".snapshots"   # snapshots.py puts a clone's views here, on the clone's filesystem
+
+DISK_BUDGET_BYTES = int(float(os.getenv("AUTOAGENT_DISK_BUDGET_GB", "20")) * 1024 ** 3)
+TMPFS_ROOT = os.getenv("AUTOAGENT_TMPFS_ROOT")            # e.g. /dev/shm/autoagent; unset = no tmpfs
+TMPFS_MAX_REPO_BYTES = 200 * 1024 * 1024                  # only repos smaller than this go to tmpfs
+TMPFS_BUDGET_BYTES = int(float(os.getenv("AUTOAGENT_TMPFS_BUDGET_GB", "2")) * 1024 ** 3)
+
+
+def dir_size(path: str) -> int:
+    """Bytes used by the files under `path` (symlinks not followed)."""
+    total = 0
+    stack = [path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            total += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total
+
+
+def snapshot_usage(base: str) -> Dict[str, int]:
+    """
+    Bytes held by the snapshots under base/.snapshots, per source clone.
+    Hard-linked files are the clone's own and overlay mounts show the
+    clone, so neither is counted again; reflinked files count in full.
+    """
+    usage: Dict[str, int] = {}
+    folder = os.path.join(base, SNAPSHOT_FOLDER)
+    for name in os.listdir(folder) if os.path.isdir(folder) else []:
+        root = os.path.join(folder, name)
+        try:
+            with open(os.path.join(root, "snapshot.json"), "r", encoding="utf-8") as f:
+                source = json.load(f)["source"]
+        except (OSError, ValueError, KeyError):
+            continue
+        total = 0
+        stack = [root]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not os.path.ismount(entry.path):
+                                    stack.append(entry.path)
+                                continue
+                            st = entry.stat(follow_symlinks=False)
+                            if st.st_nlink == 1 or entry.is_symlink():
+                                total += st.st_size
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        usage[source] = usage.get(source, 0) + total
+    return usage
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class WorkspaceManager:
+
+    def __init__(self, root: str = WORKSPACE_ROOT, budget_bytes: int = DISK_BUDGET_BYTES,
+                 tmpfs_root: Optional[str] = TMPFS_ROOT, tmpfs_budget_bytes: int = TMPFS_BUDGET_BYTES):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.tmpfs_root = tmpfs_root
+        self.tmpfs_budget_bytes = tmpfs_budget_bytes
+        self.evictions = 0
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+
+    # ------------------------------------------------------------
+    # Registry (file-locked JSON)
+    # ------------------------------------------------------------
+    @contextmanager
+    def _registry(self):
+        """Yield the registry dict; changes are written back on exit."""
+        with self._lock:
+            lock_file = open(os.path.join(self.root, LOCK_FILE), "a")
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                path = os.path.join(self.root, REGISTRY_FILE)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        registry = json.load(f)
+                except (OSError, ValueError):
+                    registry = {}
+                self._adopt_untracked(registry)
+                yield registry
+                tmp = f"{path}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(registry, f, indent=2)
+                os.replace(tmp, path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def _adopt_untracked(self, registry: Dict) -> None:
+        known = {entry["path"] for entry in registry.values()}
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            # Symlinks point at tmpfs workspaces, which are registered under their real path
+            if name.startswith(".") or os.path.islink(path) or not os.path.isdir(path) or path in known:
+                continue
+            registry[name] = {
+                "path": path, "job_id": None, "size": dir_size(path), "tmpfs": False,
+                "created": os.path.getmtime(path), "last_used": os.path.getmtime(path), "pins": [],
+            }
+        # Forget workspaces deleted by hand (allocated-but-not-yet-cloned ones are still pinned)
+        for name in [n for n, e in registry.items() if not os.path.isdir(e["path"]) and not self._is_pinned(e)]:
+            del registry[name]
+
+    # ------------------------------------------------------------
+    # Allocation
+    # ------------------------------------------------------------
+    def allocate(self, job_id: str, name: str, expected_bytes: Optional[int] = None) -> str:
+        """
+        Path for a new workspace (not created: `git clone` wants to create it).
+        Space for `expected_bytes` is freed first when the size is known.
+        """
+        key = f"{name}_{job_id}"
+        on_tmpfs = bool(self.tmpfs_root and expected_bytes is not None
+                        and expected_bytes <= TMPFS_MAX_REPO_BYTES)
+        with self._registry() as registry:
+            if on_tmpfs and self._used(registry, tmpfs=True) + expected_bytes > self.tmpfs_budget_bytes:
+                on_tmpfs = False
+            base = self.tmpfs_root if on_tmpfs else self.root
+            os.makedirs(base, exist_ok=True)
+            path = os.path.join(base, key)
+            if os.path.isdir(path):
+                # Left over by an earlier attempt of the same job that died mid-clone
+                shutil.rmtree(path, ignore_errors=True)
+            now = time.time()
+            registry[key] = {
+                "path": path, "job_id": job_id, "size": 0, "tmpfs": on_tmpfs,
+                "created": now, "last_used": now, "pins": [os.getpid()],
+            }
+            if not on_tmpfs:
+                self._evict(registry, needed=expected_bytes or 0)
+        if on_tmpfs:
+            print(f"[WORKSPACE] Using tmpfs for {name} ({expected_bytes} bytes expected).")
+            # Disk view of tmpfs workspaces: a symlink keeps ImportedProjects/ browsable
+            link = os.path.join(self.root, key)
+            if not os.path.lexists(link):
+                os.symlink(os.path.abspath(path), link)
+        return path
+
+    def refresh(self, path: str) -> int:
+        """Re-measure a workspace after it was filled (clone finished) and enforce the budget."""
+        size = dir_size(path)
+        with self._registry() as registry:
+            for entry in registry.values():
+                if entry["path"] == path:
+                    entry["size"] = size
+                    entry["last_used"] = time.time()
+            self._evict(registry)
+        return size
+
+    def touch(self, path: str) -> None:
+        with self._registry() as registry:
+            for entry in registry.values():
+                if entry["path"] == path:
+                    entry["last_used"] = time.time()
+
+    # ------------------------------------------------------------
+    # Pinning
+    # ------------------------------------------------------------
+    @contextmanager
+    def pinned(self, job_id: str):
+        """Pin every workspace of `job_id` (including ones allocated inside the block)."""
+        self._set_pin(job_id, add=True)
+        try:
+            yield
+        finally:
+            self._set_pin(job_id, add=False)
+
+    def _set_pin(self, job_id: str, add: bool) -> None:
+        pid = os.getpid()
+        with self._registry() as registry:
+            for entry in registry.values():
+                if entry.get("job_id") != job_id:
+                    continue
+                pins = [p for p in entry.get("pins", []) if p != pid]
+                entry["pins"] = pins + [pid] if add else pins
+                entry["last_used"] = time.time()
+
+    @staticmethod
+    def _is_pinned(entry: Dict) -> bool:
+        return any(_pid_alive(pid) for pid in entry.get("pins", []))
+
+    # ------------------------------------------------------------
+    # Eviction
+    # ------------------------------------------------------------
+    @staticmethod
+    def _used(registry: Dict, tmpfs: bool = False) -> int:
+        return sum(e["size"] for e in registry.values() if e.get("tmpfs", False) == tmpfs)
+
+    def _snapshot_usage(self, tmpfs: bool = False) -> Dict[str, int]:
+        base = self.tmpfs_root if tmpfs else self.root
+        return snapshot_usage(base) if base else {}
+
+    def _evict(self, registry: Dict, needed: int = 0) -> List[str]:
+        evicted = []
+        for tmpfs, budget in ((False, self.budget_bytes), (True, self.tmpfs_budget_bytes)):
+            snapshots = self._snapshot_usage(tmpfs)
+            used = self._used(registry, tmpfs) + sum(snapshots.values()) + (needed if not tmpfs else 0)
+            candidates = sorted(
+                (name for name, e in registry.items() if e.get("tmpfs", False) == tmpfs and not self._is_pinned(e)),
+                key=lambda name: registry[name]["last_used"],
+            )
+            for name in candidates:
+                if used <= budget:
+                    break
+                entry = registry.pop(name)
+                # Unpinned, so no job is running in its snapshots: they go first, then the clone
+                _discard_snapshots(entry["path"])
+                shutil.rmtree(entry["path"], ignore_errors=True)
+                link = os.path.join(self.root, name)
+                if os.path.islink(link):
+                    os.remove(link)
+                used -= entry["size"] + snapshots.get(os.path.abspath(entry["path"]), 0)
+                evicted.append(name)
+        if evicted:
+            self.evictions += len(evicted)
+            print(f"[WORKSPACE] Evicted {len(evicted)} workspace(s) to stay under budget: {', '.join(evicted)}")
+        return evicted
+
+    def enforce_budget(self) -> List[str]:
+        with self._registry() as registry:
+            return self._evict(registry)
+
+    # ------------------------------------------------------------
+    # Scratch space
+    # ------------------------------------------------------------
+    @contextmanager
+    def scratch(self, job_id: str):
+        """Per-job temp directory (downloaded PDFs, ...), removed on exit."""
+        path = os.path.join(self.root, SCRATCH_FOLDER, job_id)
+        os.makedirs(path, exist_ok=True)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    # ------------------------------------------------------------
+    # Stats
+    # ------------------------------------------------------------
+    def stats(self) -> Dict:
+        with self._registry() as registry:
+            entries = list(registry.values())
+        snapshot_bytes = sum(self._snapshot_usage().values())
+        tmpfs_snapshot_bytes = sum(self._snapshot_usage(tmpfs=True).values())
+        return {
+            "workspaces": len(entries),
+            "disk_used_bytes": sum(e["size"] for e in entries if not e.get("tmpfs")) + snapshot_bytes,
+            "disk_budget_bytes": self.budget_bytes,
+            "snapshot_bytes": snapshot_bytes + tmpfs_snapshot_bytes,
+            "tmpfs_used_bytes": sum(e["size"] for e in entries if e.get("tmpfs")) + tmpfs_snapshot_bytes,
+            "tmpfs_budget_bytes": self.tmpfs_budget_bytes if self.tmpfs_root else 0,
+            "pinned": sum(1 for e in entries if self._is_pinned(e)),
+            "evictions": self.evictions,
+            "scratch_bytes": dir_size(os.path.join(self.root, SCRATCH_FOLDER)),
+        }
+
+
+def _discard_snapshots(clone_path: str) -> None:
+    from src.jobs.snapshots import discard_clone_snapshots   # snapshots.py imports this module
+    discard_clone_snapshots(clone_path)
+
+
+_manager: Optional[WorkspaceManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_workspace_manager() -> WorkspaceManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = WorkspaceManager()
+        return _manager
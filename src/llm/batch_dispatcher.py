@@ -0,0 +1,468 @@
+"""
+batch_dispatcher.py
+--------------------
+Aggregates non-urgent LLM prompts from many concurrent jobs into
+batch-API submissions.
+
+How it works:
+1. A job calls submit(payload, call_site) and gets a Future back.
+2. Prompts whose call-site policy is "batch" are queued.
+3. A background thread flushes the queue into a JSONL file (one
+   chat-completion request per line, OpenAI Batch API format) when it is
+   full or when the oldest prompt hits its policy's max_wait.
+4. The file is submitted to a backend, polled until done, and every
+   line of the output resolves the matching Future. A failure in any of
+   these steps (backend error, unreadable or malformed output) fails the
+   Futures it concerns; the thread keeps serving the other batches.
+
+Backends:
+- OpenAIBatchBackend — the real /v1/files + /v1/batches API
+- LocalStubBackend   — answers in-process with a responder function,
+                        used for tests and local dry runs
+
+The dispatcher is OFF unless configure_dispatcher() is called (or
+AUTOAGENT_LLM_BATCH=1 is set), so single interactive runs are unchanged.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, InvalidStateError
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+OPENAI_API_BASE = "https://api.openai.com/v1"
+CHAT_ENDPOINT = "/v1/chat/completions"
+BATCH_FOLDER = "LLMBatches"
+
+DEFAULT_MAX_BATCH_SIZE = 500
+DEFAULT_POLL_INTERVAL = 10.0  # seconds
+
+
+# ------------------------------------------------------------
+# Call-site policies (latency vs throughput)
+# ------------------------------------------------------------
+class CallSitePolicy:
+    """
+    mode="immediate": the job is blocked on this answer, send it now.
+    mode="batch":     throughput matters more; wait up to max_wait seconds
+                      for other prompts to share the submission.
+    optional=True:    the caller has a heuristic fallback, so the call is
+                      skipped while the provider is degraded (see health.py).
+    max_result_wait:  seconds a caller waits for a batched answer (None =
+                      as long as the job deadline allows). An optional
+                      call that runs out of it, or gets close to the job
+                      deadline, is skipped instead of failing the job.
+    """
+
+    def __init__(self, mode: str = "immediate", max_wait: float = 0.0, optional: bool = False,
+                 max_result_wait: Optional[float] = None):
+        if mode not in ("immediate", "batch"):
+            raise ValueError(f"Unknown call-site mode '{mode}'")
+        self.mode = mode
+        self.max_wait = max_wait
+        self.optional = optional
+        self.max_result_wait = max_result_wait
+
+    def __repr__(self):
+        return (f"CallSitePolicy(mode={self.mode!r}, max_wait={self.max_wait}, optional={self.optional}, "
+                f"max_result_wait={self.max_result_wait})")
+
+
+CALL_SITE_POLICIES: Dict[str, CallSitePolicy] = {
+    # Repo selection and demo generation gate the next stage: keep them interactive
+    "finder.select_repository": CallSitePolicy("immediate"),
+    "demo.validate": CallSitePolicy("immediate"),
+    "demo.generate": CallSitePolicy("immediate"),
+    # Repairing a failed demo is a bonus: the run is scored either way
+    "demo.repair": CallSitePolicy("immediate", optional=True),
+    # Detector refinements run inside the scan stage, which waits on them: a batch
+    # turnaround (minutes to hours) would stall the job, so they stay interactive
+    "scanner.models": CallSitePolicy("immediate", optional=True),
+    "scanner.configs": CallSitePolicy("immediate", optional=True),
+    "scanner.entrypoints": CallSitePolicy("immediate", optional=True),
+    "scanner.demos": CallSitePolicy("immediate", optional=True),
+    # The judge is only needed at the end of a job, and a batch can take hours:
+    # past max_result_wait the job is scored without it rather than held open
+    "evaluator.judge": CallSitePolicy("batch", max_wait=120.0, optional=True, max_result_wait=600.0),
+}
+
+_DEFAULT_POLICY = CallSitePolicy("immediate")
+
+
+def policy_for(call_site: str) -> CallSitePolicy:
+    return CALL_SITE_POLICIES.get(call_site, _DEFAULT_POLICY)
+
+
+# ------------------------------------------------------------
+# Backends
+# ------------------------------------------------------------
+class BatchBackend:
+    """Submits a JSONL file of requests and reports when its output is ready."""
+
+    def submit(self, input_path: str) -> str:
+        """Start a batch and return its id."""
+        raise NotImplementedError
+
+    def poll(self, batch_id: str, output_path: str) -> bool:
+        """
+        Return True (and write the output JSONL to output_path) once the
+        batch is done, False while it is still running. Raise if it failed.
+        """
+        raise NotImplementedError
+
+
+class OpenAIBatchBackend(BatchBackend):
+    def __init__(self, api_key: Optional[str] = None, api_base: str = OPENAI_API_BASE,
+                 completion_window: str = "24h"):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not self.api_key:
+            raise Exception("OPENAI_API_KEY is not set in the environment variables.")
+        self.api_base = api_base
+        self.completion_window = completion_window
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def submit(self, input_path: str) -> str:
+        with open(input_path, "rb") as f:
+            upload = requests.post(f"{self.api_base}/files", headers=self._headers(),
+                                   data={"purpose": "batch"}, files={"file": f}, timeout=60)
+        if upload.status_code != 200:
+            raise Exception(f"OpenAI file upload error {upload.status_code}: {upload.text}")
+
+        batch = requests.post(
+            f"{self.api_base}/batches",
+            headers=self._headers(),
+            json={
+                "input_file_id": upload.json()["id"],
+                "endpoint": CHAT_ENDPOINT,
+                "completion_window": self.completion_window,
+            },
+            timeout=60,
+        )
+        if batch.status_code != 200:
+            raise Exception(f"OpenAI batch error {batch.status_code}: {batch.text}")
+        return batch.json()["id"]
+
+    def poll(self, batch_id: str, output_path: str) -> bool:
+        response = requests.get(f"{self.api_base}/batches/{batch_id}", headers=self._headers(), timeout=30)
+        if response.status_code != 200:
+            raise Exception(f"OpenAI batch status error {response.status_code}: {response.text}")
+        batch = response.json()
+
+        status = batch.get("status")
+        if status in ("failed", "expired", "cancelled"):
+            raise Exception(f"OpenAI batch {batch_id} ended with status '{status}'")
+        if status != "completed":
+            return False
+
+        # Successful lines and per-request errors live in two separate files
+        with open(output_path, "wb") as out:
+            for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+                if not file_id:
+                    continue
+                content = requests.get(f"{self.api_base}/files/{file_id}/content",
+                                       headers=self._headers(), timeout=120)
+                if content.status_code != 200:
+                    raise Exception(f"OpenAI file download error {content.status_code}: {content.text}")
+                out.write(content.content.rstrip(b"\n") + b"\n")
+        return True
+
+
+class LocalStubBackend(BatchBackend):
+    """
+    In-process backend. `responder(body) -> str` produces the completion
+    text for each request; `latency` seconds pass before a batch completes.
+    """
+
+    def __init__(self, responder: Callable[[Dict], str], latency: float = 0.0):
+        self.responder = responder
+        self.latency = latency
+        self.submitted: Dict[str, Dict] = {}
+
+    def submit(self, input_path: str) -> str:
+        batch_id = f"stub_batch_{uuid.uuid4().hex[:12]}"
+        self.submitted[batch_id] = {"input_path": input_path, "ready_at": time.monotonic() + self.latency}
+        return batch_id
+
+    def poll(self, batch_id: str, output_path: str) -> bool:
+        batch = self.submitted[batch_id]
+        if time.monotonic() < batch["ready_at"]:
+            return False
+
+        with open(batch["input_path"], "r", encoding="utf-8") as src, \
+                open(output_path, "w", encoding="utf-8") as out:
+            for line in src:
+                request = json.loads(line)
+                try:
+                    content = self.responder(request["body"])
+                    result = {
+                        "custom_id": request["custom_id"],
+                        "response": {"status_code": 200,
+                                     "body": {"choices": [{"message": {"role": "assistant", "content": content}}]}},
+                        "error": None,
+                    }
+                except Exception as e:
+                    result = {"custom_id": request["custom_id"], "response": None,
+                              "error": {"message": str(e)}}
+                out.write(json.dumps(result) + "\n")
+        return True
+
+
+# ------------------------------------------------------------
+# Dispatcher
+# ------------------------------------------------------------
+class _Pending:
+    def __init__(self, payload: Dict, call_site: str, flush_by: float):
+        self.custom_id = f"req_{uuid.uuid4().hex}"
+        self.payload = payload
+        self.call_site = call_site
+        self.flush_by = flush_by
+        self.future: Future = Future()
+
+
+class BatchDispatcher:
+    """Collects queued prompts, submits them as batches and resolves Futures."""
+
+    def __init__(self, backend: BatchBackend, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, work_dir: str = BATCH_FOLDER):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.poll_interval = poll_interval
+        self.work_dir = work_dir
+        os.makedirs(work_dir, exist_ok=True)
+
+        self._cond = threading.Condition()
+        self._queue: List[_Pending] = []
+        self._running: Dict[str, Dict] = {}   # batch_id -> {"requests", "output_path", "next_poll"}
+        self._closed = False
+        self._stats = {"prompts": 0, "batches": 0, "failed_batches": 0}
+
+        self._thread = threading.Thread(target=self._loop, name="llm-batch-dispatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, payload: Dict, call_site: str) -> Future:
+        """Queue one chat-completion payload; the Future resolves to the message content."""
+        policy = policy_for(call_site)
+        pending = _Pending(payload, call_site, time.monotonic() + policy.max_wait)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BatchDispatcher is closed")
+            self._queue.append(pending)
+            self._stats["prompts"] += 1
+            self._cond.notify()
+        return pending.future
+
+    def flush(self) -> None:
+        """Submit everything queued right now, regardless of max_wait."""
+        with self._cond:
+            for pending in self._queue:
+                pending.flush_by = 0.0
+            self._cond.notify()
+
+    def close(self, wait: bool = True) -> None:
+        """Flush the queue and stop; with wait=True block until all batches resolve."""
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if wait:
+            self._thread.join()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return dict(self._stats, queued=len(self._queue), running_batches=len(self._running))
+
+    # ------------------------------------------------------------
+    # Background loop
+    # ------------------------------------------------------------
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                if self._closed and not self._queue and not self._running:
+                    return
+                batch = self._take_ready_batch()
+                if batch is None:
+                    self._cond.wait(timeout=self._next_wakeup())
+                    batch = self._take_ready_batch()
+
+            if batch:
+                try:
+                    self._submit_batch(batch)
+                except Exception as e:
+                    print(f"[LLM-BATCH] Could not submit batch: {e}")
+                    self._fail(batch, e)
+            try:
+                self._poll_running()
+            except Exception as e:
+                # _poll_running() settles each batch itself; never let a bug end the thread
+                print(f"[LLM-BATCH] Polling error: {e}")
+
+    def _take_ready_batch(self) -> Optional[List[_Pending]]:
+        # Caller holds self._cond
+        if not self._queue:
+            return None
+        now = time.monotonic()
+        oldest_due = min(p.flush_by for p in self._queue)
+        if len(self._queue) >= self.max_batch_size or oldest_due <= now or self._closed:
+            batch = self._queue[:self.max_batch_size]
+            self._queue = self._queue[self.max_batch_size:]
+            return batch
+        return None
+
+    def _next_wakeup(self) -> float:
+        # Caller holds self._cond
+        now = time.monotonic()
+        deadlines = [p.flush_by for p in self._queue]
+        deadlines += [run["next_poll"] for run in self._running.values()]
+        if not deadlines:
+            return self.poll_interval
+        return max(0.0, min(deadlines) - now)
+
+    def _submit_batch(self, batch: List[_Pending]) -> None:
+        name = f"batch_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+        input_path = os.path.join(self.work_dir, f"{name}_input.jsonl")
+        output_path = os.path.join(self.work_dir, f"{name}_output.jsonl")
+
+        with open(input_path, "w", encoding="utf-8") as f:
+            for pending in batch:
+                f.write(json.dumps({
+                    "custom_id": pending.custom_id,
+                    "method": "POST",
+                    "url": CHAT_ENDPOINT,
+                    "body": pending.payload,
+                }) + "\n")
+
+        try:
+            batch_id = self.backend.submit(input_path)
+        except Exception as e:
+            print(f"[LLM-BATCH] Submission failed: {e}")
+            self._fail(batch, e)
+            return
+
+        print(f"[LLM-BATCH] Submitted {batch_id} with {len(batch)} prompts.")
+        with self._cond:
+            self._stats["batches"] += 1
+            self._running[batch_id] = {
+                "requests": {p.custom_id: p for p in batch},
+                "output_path": output_path,
+                "next_poll": time.monotonic(),
+            }
+
+    def _poll_running(self) -> None:
+        now = time.monotonic()
+        with self._cond:
+            due = [(batch_id, run) for batch_id, run in self._running.items() if run["next_poll"] <= now]
+
+        for batch_id, run in due:
+            try:
+                done = self.backend.poll(batch_id, run["output_path"])
+            except Exception as e:
+                print(f"[LLM-BATCH] Batch {batch_id} failed: {e}")
+                with self._cond:
+                    self._running.pop(batch_id, None)
+                self._fail(list(run["requests"].values()), e)
+                continue
+
+            if not done:
+                run["next_poll"] = time.monotonic() + self.poll_interval
+                continue
+
+            with self._cond:
+                self._running.pop(batch_id, None)
+            try:
+                self._resolve(run["requests"], run["output_path"])
+            except Exception as e:
+                print(f"[LLM-BATCH] Could not read output of {batch_id}: {e}")
+                self._fail(list(run["requests"].values()), e)
+
+    def _resolve(self, requests_by_id: Dict[str, _Pending], output_path: str) -> None:
+        # Resolved entries are popped, so a failure half-way leaves only the unresolved ones
+        with open(output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    result = json.loads(line)
+                    custom_id = result.get("custom_id")
+                except (ValueError, AttributeError):
+                    print(f"[LLM-BATCH] Skipping malformed output line: {line[:200]!r}")
+                    continue
+                pending = requests_by_id.pop(custom_id, None)
+                if pending is None:
+                    continue
+
+                response = result.get("response") or {}
+                if result.get("error") or response.get("status_code") != 200:
+                    detail = result.get("error") or response.get("body")
+                    _settle(pending, error=Exception(f"OpenAI batch request error: {detail}"))
+                    continue
+                try:
+                    content = response["body"]["choices"][0]["message"]["content"]
+                except (KeyError, IndexError, TypeError) as e:
+                    _settle(pending, error=Exception(f"OpenAI batch response has no message content ({e!r})"))
+                    continue
+                _settle(pending, result=content)
+
+        # Anything the provider silently dropped (or wrote on a malformed line)
+        while requests_by_id:
+            _, pending = requests_by_id.popitem()
+            _settle(pending, error=Exception("OpenAI batch output is missing this request"))
+
+    def _fail(self, batch: List[_Pending], error: Exception) -> None:
+        with self._cond:
+            self._stats["failed_batches"] += 1
+        for pending in batch:
+            _settle(pending, error=error)
+
+
+def _settle(pending: _Pending, result: Optional[str] = None, error: Optional[BaseException] = None) -> None:
+    # A caller may have cancelled the Future (or it was failed already): that is not the loop's problem
+    if pending.future.done():
+        return
+    try:
+        if error is not None:
+            pending.future.set_exception(error)
+        else:
+            pending.future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+# ------------------------------------------------------------
+# Process-wide dispatcher
+# ------------------------------------------------------------
+_dispatcher: Optional[BatchDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def configure_dispatcher(backend: Optional[BatchBackend] = None, **kwargs) -> BatchDispatcher:
+    """Enable batching for this process (OpenAI backend unless one is given)."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is not None:
+            _dispatcher.close(wait=False)
+        _dispatcher = BatchDispatcher(backend or OpenAIBatchBackend(), **kwargs)
+        return _dispatcher
+
+
+def shutdown_dispatcher(wait: bool = True) -> None:
+    global _dispatcher
+    with _dispatcher_lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None:
+        dispatcher.close(wait=wait)
+
+
+def get_dispatcher() -> Optional[BatchDispatcher]:
+    """Return the active dispatcher, creating one if AUTOAGENT_LLM_BATCH=1."""
+    global _dispatcher
+    if _dispatcher is None and os.getenv("AUTOAGENT_LLM_BATCH") == "1":
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = BatchDispatcher(OpenAIBatchBackend())
+    return _dispatcher
@@ -0,0 +1,415 @@
+"""
+client.py
+----------
+Single place where the pipeline talks to the LLM provider (OpenAI).
+
+Responsibilities:
+- Build chat-completion payloads
+- Send one synchronous chat-completion request
+- Route a prompt either straight to the API or through the batch
+  dispatcher, depending on the call site's policy
+- Feed every call into the health tracker (latency and outcome for
+  direct calls, time to first token for streams, outcome only for
+  batched calls) and skip optional call sites while the provider is
+  degraded
+- call_llm_async(): the same for run_pipeline_async() (aiohttp when
+  installed, otherwise the blocking request on the shared thread pool)
+- call_llm_stream() / call_llm_stream_async(): streamed completions that
+  forward tokens to a consumer as they arrive, continue automatically
+  after finish_reason=length, and restart early when a prefix check
+  rejects what the model started writing
+
+Every module keeps its own small `_call_openai` helper, but they all end
+up in call_llm() here.
+"""
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+import requests
+from dotenv import load_dotenv
+
+from src.llm.batch_dispatcher import get_dispatcher, policy_for
+from src.jobs.async_runtime import async_http_available, http_session, run_blocking
+from src.jobs.deadline import budget, check_deadline
+from src.llm.health import LLMSkipped, llm_health, note_skipped
+
+load_dotenv()
+
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+DEFAULT_MODEL = "gpt-4o-mini"   # or any: gpt-4o, gpt-4.1, o1-mini, etc.
+LLM_TIMEOUT = 60                # seconds per request, further capped by the job deadline
+OPTIONAL_DEADLINE_MARGIN = 60.0  # an optional batched call gives up this long before the job deadline
+STREAM_CONTINUATIONS = 2        # extra requests when a streamed answer stops at max_tokens
+STREAM_RESTARTS = 1             # fresh attempts after the prefix check rejects the start
+CONTINUE_PROMPT = ("Your answer was cut off. Continue exactly where it stopped. "
+                   "Output only the rest, without repeating anything and without code block markers.")
+
+
+def build_payload(prompt: str, system_prompt: Optional[str] = None, model: str = DEFAULT_MODEL,
+                  temperature: float = 0, max_tokens: int = 512) -> Dict:
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": prompt})
+
+    return {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+
+
+def _headers() -> Dict:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise Exception("OPENAI_API_KEY is not set in the environment variables.")
+
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+
+def chat_completion(payload: Dict, timeout: Optional[float] = None) -> str:
+    """Send one chat-completion request and return the message content."""
+    headers = _headers()
+
+    # Never wait longer than the job has left
+    response = requests.post(OPENAI_CHAT_URL, headers=headers, json=payload, timeout=budget(timeout or LLM_TIMEOUT))
+
+    if response.status_code != 200:
+        raise Exception(f"OpenAI API error {response.status_code}: {response.text}")
+
+    return response.json()["choices"][0]["message"]["content"]
+
+
+def call_llm(prompt: str, call_site: str, system_prompt: Optional[str] = None,
+             temperature: float = 0, max_tokens: int = 512, timeout: Optional[float] = None) -> str:
+    """
+    Complete `prompt` for the given call site.
+
+    If a batch dispatcher is active and the call site's policy allows
+    batching, the prompt is queued and this call blocks until its batch
+    resolves. Otherwise the request goes out immediately.
+    """
+    policy = _check_policy(call_site)
+    payload = build_payload(prompt, system_prompt=system_prompt, temperature=temperature, max_tokens=max_tokens)
+
+    dispatcher = get_dispatcher()
+    if dispatcher is not None and policy.mode == "batch":
+        future = dispatcher.submit(payload, call_site)
+        try:
+            content = future.result(timeout=_batch_wait(policy))
+        except FutureTimeout:
+            _batch_timed_out(call_site, policy)   # our wait, not a provider failure: not recorded
+            raise
+        except Exception:
+            llm_health.record(None, ok=False)
+            raise
+        llm_health.record(None, ok=True)
+        return content
+
+    start = time.monotonic()
+    try:
+        content = chat_completion(payload, timeout=timeout)
+    except Exception:
+        llm_health.record(time.monotonic() - start, ok=False)
+        raise
+    llm_health.record(time.monotonic() - start, ok=True)
+    return content
+
+
+def _batch_wait(policy) -> Optional[float]:
+    """How long to wait for a batched answer: the policy's limit, within the job deadline."""
+    remaining = budget(None)
+    if remaining is None:
+        return policy.max_result_wait
+    if policy.optional:
+        # Leave the job time to finish without this answer
+        remaining = max(0.0, remaining - OPTIONAL_DEADLINE_MARGIN)
+    return remaining if policy.max_result_wait is None else min(policy.max_result_wait, remaining)
+
+
+def _batch_timed_out(call_site: str, policy) -> None:
+    check_deadline()
+    if policy.optional:
+        # A slow batch degrades the result; it must not fail the job
+        note_skipped(call_site)
+        raise LLMSkipped(f"Skipped optional LLM call '{call_site}' (no batch answer in time)")
+
+
+def _check_policy(call_site: str):
+    policy = policy_for(call_site)
+    if policy.optional and not llm_health.allow_optional():
+        note_skipped(call_site)
+        raise LLMSkipped(f"Skipped optional LLM call '{call_site}' (provider degraded)")
+    return policy
+
+
+# ------------------------------------------------------------
+# Async variants (run_pipeline_async)
+# ------------------------------------------------------------
+async def chat_completion_async(payload: Dict, timeout: Optional[float] = None) -> str:
+    """chat_completion() without blocking a thread while the provider answers."""
+    if not async_http_available():
+        return await run_blocking(chat_completion, payload, timeout)
+
+    import aiohttp
+
+    headers = _headers()
+    client_timeout = aiohttp.ClientTimeout(total=budget(timeout or LLM_TIMEOUT))
+    async with http_session().post(OPENAI_CHAT_URL, headers=headers, json=payload, timeout=client_timeout) as response:
+        if response.status != 200:
+            raise Exception(f"OpenAI API error {response.status}: {await response.text()}")
+        data = await response.json()
+    return data["choices"][0]["message"]["content"]
+
+
+async def call_llm_async(prompt: str, call_site: str, system_prompt: Optional[str] = None,
+                         temperature: float = 0, max_tokens: int = 512, timeout: Optional[float] = None) -> str:
+    """call_llm() for coroutines: same policies, batching and health tracking."""
+    policy = _check_policy(call_site)
+    payload = build_payload(prompt, system_prompt=system_prompt, temperature=temperature, max_tokens=max_tokens)
+
+    dispatcher = get_dispatcher()
+    if dispatcher is not None and policy.mode == "batch":
+        future = dispatcher.submit(payload, call_site)
+        try:
+            # shield: giving up on the result must not cancel the dispatcher's future
+            content = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), _batch_wait(policy))
+        except asyncio.TimeoutError:
+            _batch_timed_out(call_site, policy)
+            raise
+        except Exception:
+            llm_health.record(None, ok=False)
+            raise
+        llm_health.record(None, ok=True)
+        return content
+
+    start = time.monotonic()
+    try:
+        content = await chat_completion_async(payload, timeout=timeout)
+    except Exception:
+        llm_health.record(time.monotonic() - start, ok=False)
+        raise
+    llm_health.record(time.monotonic() - start, ok=True)
+    return content
+
+
+# ------------------------------------------------------------
+# Streaming
+# ------------------------------------------------------------
+# A prefix check gets the text streamed so far and returns True (keep
+# going), False (abort and regenerate) or None (can't tell yet). Tokens
+# are only forwarded to `on_token` once the check has said True, so a
+# consumer never sees an attempt that gets thrown away.
+
+def _sse_events(lines: Iterable[bytes]) -> Iterator[Tuple[str, Optional[str]]]:
+    """(text delta, finish_reason) from the provider's server-sent events."""
+    for raw in lines:
+        line = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+        line = line.strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        choice = (json.loads(data).get("choices") or [{}])[0]
+        yield (choice.get("delta") or {}).get("content") or "", choice.get("finish_reason")
+
+
+def stream_chat_completion(payload: Dict, timeout: Optional[float] = None) -> Iterator[Tuple[str, Optional[str]]]:
+    """chat_completion() as a stream of (text delta, finish_reason)."""
+    # timeout is per read here: a stream that keeps producing tokens is never cut off
+    with requests.post(OPENAI_CHAT_URL, headers=_headers(), json={**payload, "stream": True}, stream=True,
+                       timeout=budget(timeout or LLM_TIMEOUT)) as response:
+        if response.status_code != 200:
+            raise Exception(f"OpenAI API error {response.status_code}: {response.text}")
+        for event in _sse_events(response.iter_lines()):
+            check_deadline()
+            yield event
+
+
+async def stream_chat_completion_async(payload: Dict,
+                                       timeout: Optional[float] = None) -> AsyncIterator[Tuple[str, Optional[str]]]:
+    """stream_chat_completion() on the event loop (requires aiohttp)."""
+    import aiohttp
+
+    read_timeout = budget(timeout or LLM_TIMEOUT)
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=read_timeout, sock_read=read_timeout)
+    async with http_session().post(OPENAI_CHAT_URL, headers=_headers(), json={**payload, "stream": True},
+                                   timeout=client_timeout) as response:
+        if response.status != 200:
+            raise Exception(f"OpenAI API error {response.status}: {await response.text()}")
+        async for line in response.content:
+            for event in _sse_events([line]):
+                check_deadline()
+                yield event
+
+
+class _StreamedAnswer:
+    """One attempt at an answer: its requests (first + continuations), prefix check and forwarded tokens."""
+
+    def __init__(self, payload: Dict, on_token: Optional[Callable[[str], None]],
+                 check_prefix: Optional[Callable[[str], Optional[bool]]]):
+        self.payload = payload
+        self.on_token = on_token
+        self.check_prefix = check_prefix
+        self.text = ""
+        self.accepted = check_prefix is None
+        self.rejected = False
+        self.finish_reason = None
+        self.requests = 0
+        self._held = ""
+
+    def next_payload(self) -> Dict:
+        self.requests += 1
+        self.finish_reason = None
+        if self.requests == 1:
+            return self.payload
+        # Continuation: the model sees its own cut-off answer and picks up from there
+        messages = self.payload["messages"] + [
+            {"role": "assistant", "content": self.text},
+            {"role": "user", "content": CONTINUE_PROMPT},
+        ]
+        return {**self.payload, "messages": messages}
+
+    def feed(self, delta: str, finish_reason: Optional[str]) -> bool:
+        """Add one delta; False means the prefix check rejected the answer (stop reading)."""
+        if finish_reason:
+            self.finish_reason = finish_reason
+        if not delta:
+            return True
+        self.text += delta
+        if self.accepted:
+            self._forward(delta)
+            return True
+
+        self._held += delta
+        verdict = self.check_prefix(self.text)
+        if verdict is False:
+            self.rejected = True
+            return False
+        if verdict:
+            self.accepted = True
+            self._forward(self._held)
+            self._held = ""
+        return True
+
+    def wants_continuation(self, max_continuations: int) -> bool:
+        if self.finish_reason != "length" or self.requests > max_continuations:
+            return False
+        print(f"[LLM] Answer hit max_tokens after {len(self.text)} characters; continuing...")
+        return True
+
+    def result(self) -> str:
+        # The answer ended before the check could decide: nothing to hold back any more
+        self._forward(self._held)
+        self._held = ""
+        return self.text
+
+    def _forward(self, text: str) -> None:
+        if text and self.on_token is not None:
+            self.on_token(text)
+
+
+def _record_stream(start: float, first_event: Optional[float], ok: bool) -> None:
+    # Time to first token: a long answer that streams steadily is not a slow provider
+    llm_health.record((first_event if first_event is not None else time.monotonic()) - start, ok=ok)
+
+
+def call_llm_stream(prompt: str, call_site: str, system_prompt: Optional[str] = None,
+                    temperature: float = 0, max_tokens: int = 512, timeout: Optional[float] = None,
+                    on_token: Optional[Callable[[str], None]] = None,
+                    check_prefix: Optional[Callable[[str], Optional[bool]]] = None,
+                    max_continuations: int = STREAM_CONTINUATIONS, max_restarts: int = STREAM_RESTARTS) -> str:
+    """
+    call_llm() with a streamed answer.
+
+    - every accepted token is passed to `on_token` as it arrives
+    - an answer cut off at `max_tokens` is continued, up to
+      `max_continuations` more requests
+    - when `check_prefix` rejects the start of an answer, the request is
+      dropped and the prompt sent again, up to `max_restarts` times; the
+      last attempt is never checked
+    """
+    policy = _check_policy(call_site)
+    payload = build_payload(prompt, system_prompt=system_prompt, temperature=temperature, max_tokens=max_tokens)
+    if get_dispatcher() is not None and policy.mode == "batch":
+        # Batched answers arrive whole
+        text = call_llm(prompt, call_site, system_prompt, temperature, max_tokens, timeout)
+        if on_token is not None:
+            on_token(text)
+        return text
+
+    for attempt in range(max_restarts + 1):
+        answer = _StreamedAnswer(payload, on_token, check_prefix if attempt < max_restarts else None)
+        while True:
+            start, first_event = time.monotonic(), None
+            events = stream_chat_completion(answer.next_payload(), timeout=timeout)
+            try:
+                for delta, finish_reason in events:
+                    first_event = first_event or time.monotonic()
+                    if not answer.feed(delta, finish_reason):
+                        break
+            except Exception:
+                _record_stream(start, first_event, ok=False)
+                raise
+            finally:
+                events.close()   # closes the HTTP stream of a rejected answer
+            _record_stream(start, first_event, ok=True)
+            if answer.rejected or not answer.wants_continuation(max_continuations):
+                break
+        if not answer.rejected:
+            return answer.result()
+        print(f"[LLM] '{call_site}' started with something unusable ({answer.text[:40]!r}); regenerating...")
+    raise AssertionError("unreachable: the last attempt is never rejected")
+
+
+async def call_llm_stream_async(prompt: str, call_site: str, system_prompt: Optional[str] = None,
+                                temperature: float = 0, max_tokens: int = 512, timeout: Optional[float] = None,
+                                on_token: Optional[Callable[[str], None]] = None,
+                                check_prefix: Optional[Callable[[str], Optional[bool]]] = None,
+                                max_continuations: int = STREAM_CONTINUATIONS,
+                                max_restarts: int = STREAM_RESTARTS) -> str:
+    """call_llm_stream() for coroutines (without aiohttp it runs on the shared pool)."""
+    if not async_http_available():
+        return await run_blocking(call_llm_stream, prompt, call_site, system_prompt, temperature, max_tokens,
+                                  timeout, on_token, check_prefix, max_continuations, max_restarts)
+
+    policy = _check_policy(call_site)
+    payload = build_payload(prompt, system_prompt=system_prompt, temperature=temperature, max_tokens=max_tokens)
+    if get_dispatcher() is not None and policy.mode == "batch":
+        text = await call_llm_async(prompt, call_site, system_prompt, temperature, max_tokens, timeout)
+        if on_token is not None:
+            on_token(text)
+        return text
+
+    for attempt in range(max_restarts + 1):
+        answer = _StreamedAnswer(payload, on_token, check_prefix if attempt < max_restarts else None)
+        while True:
+            start, first_event = time.monotonic(), None
+            events = stream_chat_completion_async(answer.next_payload(), timeout=timeout)
+            try:
+                async for delta, finish_reason in events:
+                    first_event = first_event or time.monotonic()
+                    if not answer.feed(delta, finish_reason):
+                        break
+            except Exception:
+                _record_stream(start, first_event, ok=False)
+                raise
+            finally:
+                await events.aclose()
+            _record_stream(start, first_event, ok=True)
+            if answer.rejected or not answer.wants_continuation(max_continuations):
+                break
+        if not answer.rejected:
+            return answer.result()
+        print(f"[LLM] '{call_site}' started with something unusable ({answer.text[:40]!r}); regenerating...")
+    raise AssertionError("unreachable: the last attempt is never rejected")
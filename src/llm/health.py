@@ -0,0 +1,172 @@
+"""
+health.py
+----------
+Live LLM latency/error tracking and a circuit breaker for OPTIONAL calls.
+
+Responsibilities:
+- Record the latency and outcome of every direct LLM request (time to
+  first token for streams), and the outcome of every batched one
+- Compute p95 latency and error rate over a sliding window
+- Trip (open) when p95 exceeds the SLO or too many calls fail; while
+  open, optional call sites (detector refinements, the judge) are
+  skipped and the pipeline falls back to heuristics
+- After a cool-down, go half-open: let ONE optional call through as a
+  probe; a fast success closes the breaker, anything else re-opens it
+- Collect the skipped call sites per job (degradation_scope), so results
+  can be marked degraded and re-enriched later
+
+Calls the job can't do without (repo selection, demo generation) are
+never skipped; they still feed the latency window.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+LLM_P95_SLO = float(os.getenv("AUTOAGENT_LLM_P95_SLO", "10"))   # seconds
+MAX_ERROR_RATE = 0.5
+WINDOW_SIZE = 50          # most recent calls considered
+WINDOW_SECONDS = 300.0    # ...and only if they are this recent
+MIN_SAMPLES = 5
+OPEN_SECONDS = 30.0       # cool-down before a half-open probe
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_skipped: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar("llm_skipped", default=None)
+
+
+class LLMSkipped(Exception):
+    """An optional LLM call was skipped because the provider is degraded."""
+    pass
+
+
+class LLMHealth:
+
+    def __init__(self, slo: float = LLM_P95_SLO, max_error_rate: float = MAX_ERROR_RATE,
+                 open_seconds: float = OPEN_SECONDS):
+        self.slo = slo
+        self.max_error_rate = max_error_rate
+        self.open_seconds = open_seconds
+        # (when, latency, ok); latency is None for batched calls, which wait for their batch by design
+        self._samples: Deque[Tuple[float, Optional[float], bool]] = deque(maxlen=WINDOW_SIZE)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._counters = {"trips": 0, "skipped": 0, "probes": 0}
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------
+    # Window statistics
+    # ------------------------------------------------------------
+    def _recent(self) -> List[Tuple[float, Optional[float], bool]]:
+        cutoff = time.monotonic() - WINDOW_SECONDS
+        return [s for s in self._samples if s[0] >= cutoff]
+
+    def _p95(self, samples) -> float:
+        if not samples:
+            return 0.0
+        latencies = sorted(latency for _, latency, _ in samples if latency is not None)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def _error_rate(self, samples) -> float:
+        return (sum(1 for _, _, ok in samples if not ok) / len(samples)) if samples else 0.0
+
+    # ------------------------------------------------------------
+    # Breaker
+    # ------------------------------------------------------------
+    def record(self, latency: Optional[float], ok: bool) -> None:
+        """One call's outcome; latency None (batched calls) counts towards the error rate only."""
+        with self._lock:
+            self._samples.append((time.monotonic(), latency, ok))
+
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                if ok and (latency is None or latency <= self.slo):
+                    print("[LLM] Provider recovered; optional LLM calls re-enabled.")
+                    self._state = CLOSED
+                    self._samples.clear()
+                else:
+                    self._open()
+                return
+
+            if self._state == CLOSED:
+                samples = self._recent()
+                timed = [s for s in samples if s[1] is not None]
+                if (len(timed) >= MIN_SAMPLES and self._p95(timed) > self.slo) or (
+                        len(samples) >= MIN_SAMPLES and self._error_rate(samples) > self.max_error_rate):
+                    self._open()
+
+    def _open(self) -> None:
+        if self._state != OPEN:
+            self._counters["trips"] += 1
+            print(f"[LLM] Provider degraded (p95 SLO {self.slo}s); skipping optional LLM calls.")
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+
+    def allow_optional(self) -> bool:
+        """True if an optional call may go out now (possibly as the half-open probe)."""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == CLOSED:
+                return True
+            # A probe that never reported back (cancelled job) doesn't block the next one forever
+            probe_stale = time.monotonic() - self._probe_started >= self.open_seconds
+            if self._state == HALF_OPEN and (not self._probe_in_flight or probe_stale):
+                self._probe_in_flight = True
+                self._probe_started = time.monotonic()
+                self._counters["probes"] += 1
+                return True
+            self._counters["skipped"] += 1
+            return False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def stats(self) -> Dict:
+        with self._lock:
+            samples = self._recent()
+            return {
+                "state": self._state,
+                "p95_latency": round(self._p95(samples), 3),
+                "error_rate": round(self._error_rate(samples), 3),
+                "samples": len(samples),
+                "slo": self.slo,
+                **self._counters,
+            }
+
+
+# One breaker per process (so per server worker): every job talks to the same provider
+llm_health = LLMHealth()
+
+
+# ------------------------------------------------------------
+# Per-job record of skipped calls
+# ------------------------------------------------------------
+@contextmanager
+def degradation_scope():
+    """Collects the call sites skipped inside the block (yields the list)."""
+    skipped: List[str] = []
+    token = _skipped.set(skipped)
+    try:
+        yield skipped
+    finally:
+        _skipped.reset(token)
+
+
+def note_skipped(call_site: str) -> None:
+    skipped = _skipped.get()
+    if skipped is not None and call_site not in skipped:
+        skipped.append(call_site)
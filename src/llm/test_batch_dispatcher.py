@@ -0,0 +1,182 @@
+"""
+Tests for batch_dispatcher.py, driven by LocalStubBackend.
+
+Run with: python -m pytest src/llm/test_batch_dispatcher.py
+"""
+
+import json
+
+import pytest
+
+from src.jobs.deadline import Deadline, DeadlineExceeded, deadline_scope
+from src.llm import client
+from src.llm.batch_dispatcher import (
+    CALL_SITE_POLICIES, BatchDispatcher, CallSitePolicy, LocalStubBackend, configure_dispatcher,
+    shutdown_dispatcher,
+)
+from src.llm.health import LLMSkipped, degradation_scope
+
+WAIT = 5.0  # seconds a Future may take; the stub answers at once
+
+
+def _payload(text: str):
+    return {"model": "stub", "messages": [{"role": "user", "content": text}]}
+
+
+def _echo(body):
+    text = body["messages"][-1]["content"]
+    if text == "boom":
+        raise ValueError("responder failed")
+    return text.upper()
+
+
+class _GarbledBackend(LocalStubBackend):
+    """Writes the stub's output, then damages the lines picked by `garble(result) -> str or None`."""
+
+    def __init__(self, garble):
+        super().__init__(_echo)
+        self.garble = garble
+
+    def poll(self, batch_id, output_path):
+        if not super().poll(batch_id, output_path):
+            return False
+        with open(output_path, "r", encoding="utf-8") as f:
+            results = [json.loads(line) for line in f]
+        with open(output_path, "w", encoding="utf-8") as f:
+            for result in results:
+                replaced = self.garble(result)
+                f.write((replaced if replaced is not None else json.dumps(result)) + "\n")
+        return True
+
+
+class _FailingOnceBackend(LocalStubBackend):
+    """poll() raises for the first batch only."""
+
+    def __init__(self):
+        super().__init__(_echo)
+        self.failed = False
+
+    def poll(self, batch_id, output_path):
+        if not self.failed:
+            self.failed = True
+            raise RuntimeError("provider unavailable")
+        return super().poll(batch_id, output_path)
+
+
+@pytest.fixture
+def make_dispatcher(tmp_path):
+    dispatchers = []
+
+    def make(backend):
+        dispatcher = BatchDispatcher(backend, poll_interval=0.01, work_dir=str(tmp_path))
+        dispatchers.append(dispatcher)
+        return dispatcher
+
+    yield make
+    for dispatcher in dispatchers:
+        dispatcher.close(wait=True)
+
+
+def _submit(dispatcher, *texts):
+    futures = [dispatcher.submit(_payload(text), "evaluator.judge") for text in texts]
+    dispatcher.flush()
+    return futures
+
+
+def test_resolves_every_future(make_dispatcher):
+    dispatcher = make_dispatcher(LocalStubBackend(_echo))
+    futures = _submit(dispatcher, "a", "b", "c")
+    assert [f.result(timeout=WAIT) for f in futures] == ["A", "B", "C"]
+    assert dispatcher.stats()["batches"] == 1
+
+
+def test_request_error_fails_only_that_future(make_dispatcher):
+    dispatcher = make_dispatcher(LocalStubBackend(_echo))
+    ok, bad = _submit(dispatcher, "ok", "boom")
+    assert ok.result(timeout=WAIT) == "OK"
+    with pytest.raises(Exception, match="responder failed"):
+        bad.result(timeout=WAIT)
+
+
+def test_malformed_output_line_fails_its_request_and_loop_survives(make_dispatcher):
+    def garble(result):
+        content = result["response"]["body"]["choices"][0]["message"]["content"]
+        return "{not json" if content == "BAD" else None
+
+    dispatcher = make_dispatcher(_GarbledBackend(garble))
+    good, bad = _submit(dispatcher, "good", "bad")
+    assert good.result(timeout=WAIT) == "GOOD"
+    with pytest.raises(Exception, match="missing this request"):
+        bad.result(timeout=WAIT)
+
+    # The dispatcher thread is still alive and serves the next batch
+    (later,) = _submit(dispatcher, "later")
+    assert later.result(timeout=WAIT) == "LATER"
+
+
+def test_response_without_content_fails_its_request(make_dispatcher):
+    def drop_choices(result):
+        result["response"]["body"] = {"choices": []}
+        return json.dumps(result)
+
+    dispatcher = make_dispatcher(_GarbledBackend(drop_choices))
+    (future,) = _submit(dispatcher, "x")
+    with pytest.raises(Exception, match="no message content"):
+        future.result(timeout=WAIT)
+
+
+def test_poll_error_fails_batch_and_loop_survives(make_dispatcher):
+    dispatcher = make_dispatcher(_FailingOnceBackend())
+    (first,) = _submit(dispatcher, "first")
+    with pytest.raises(RuntimeError, match="provider unavailable"):
+        first.result(timeout=WAIT)
+
+    (second,) = _submit(dispatcher, "second")
+    assert second.result(timeout=WAIT) == "SECOND"
+    assert dispatcher.stats()["failed_batches"] == 1
+
+
+def test_cancelled_future_does_not_stop_the_loop(make_dispatcher):
+    dispatcher = make_dispatcher(LocalStubBackend(_echo, latency=0.2))
+    cancelled, kept = _submit(dispatcher, "a", "b")
+    assert cancelled.cancel()
+    assert kept.result(timeout=WAIT) == "B"
+
+
+def test_scanner_call_sites_are_immediate():
+    scanner_sites = [name for name in CALL_SITE_POLICIES if name.startswith("scanner.")]
+    assert scanner_sites
+    assert all(CALL_SITE_POLICIES[name].mode == "immediate" for name in scanner_sites)
+
+
+# ------------------------------------------------------------
+# Waiting on a batched answer (client.call_llm)
+# ------------------------------------------------------------
+@pytest.fixture
+def slow_batches(tmp_path, monkeypatch):
+    """The active dispatcher answers only after 30 s; the client's deadline margin is shrunk to fit a test."""
+    monkeypatch.setattr(client, "OPTIONAL_DEADLINE_MARGIN", 0.5)
+    configure_dispatcher(LocalStubBackend(_echo, latency=30.0), poll_interval=0.01, work_dir=str(tmp_path))
+    yield
+    shutdown_dispatcher(wait=False)
+
+
+def test_slow_batch_skips_optional_call_before_the_deadline(slow_batches):
+    with deadline_scope(Deadline(1.0)), degradation_scope() as skipped:
+        with pytest.raises(LLMSkipped):
+            client.call_llm("judge this", call_site="evaluator.judge")
+        assert skipped == ["evaluator.judge"]
+
+
+def test_slow_batch_skips_optional_call_after_max_result_wait(slow_batches, monkeypatch):
+    monkeypatch.setitem(CALL_SITE_POLICIES, "evaluator.judge",
+                        CallSitePolicy("batch", optional=True, max_result_wait=0.2))
+    with pytest.raises(LLMSkipped):
+        client.call_llm("judge this", call_site="evaluator.judge")
+
+
+def test_slow_batch_still_fails_required_call_at_the_deadline(slow_batches, monkeypatch):
+    monkeypatch.setitem(CALL_SITE_POLICIES, "needs.answer", CallSitePolicy("batch"))
+    with deadline_scope(Deadline(0.5)):
+        with pytest.raises(DeadlineExceeded):
+            client.call_llm("answer this", call_site="needs.answer")
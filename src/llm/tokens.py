@@ -0,0 +1,29 @@
+"""
+tokens.py
+----------
+Cheap token accounting for prompt budgets.
+
+Responsibilities:
+- Estimate the token count of a string without a tokenizer dependency
+- Trim text to a token budget
+
+The ~4 characters per token rule is close enough for budgeting English
+prose and code with OpenAI models; nothing here needs to be exact.
+"""
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to roughly `max_tokens`, preferring to stop at a line break."""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit)
+    return text[:cut if cut > limit // 2 else limit]
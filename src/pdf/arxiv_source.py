@@ -0,0 +1,368 @@
+"""
+arxiv_source.py
+----------------
+GitHub links, title and abstract from an arXiv paper's LaTeX source.
+
+Responsibilities:
+- arxiv_id_from_url(url) — recognise arXiv abs/pdf/e-print URLs (new and
+  old-style IDs)
+- fetch_arxiv_source(arxiv_id) — stream the e-print archive and read the
+  .tex/.bbl files straight out of it; nothing is extracted to disk
+- read_local_source(path) — the same for an archive or .tex file on disk
+  (fixtures, `main.py extract paper.tar.gz`)
+- paper_from_source(files) — LaTeX → plain text in document order
+  (\\input/\\include resolved), title, abstract and GitHub links
+
+\\url{} and \\href{} targets are plain text in the source, so finding them is
+a regex pass instead of a PDF parse. SourceUnavailable means there is
+nothing to read (the paper was submitted as PDF only, the archive is too
+big, the download failed); callers then fall back to the PDF.
+"""
+
+import gzip
+import hashlib
+import os
+import posixpath
+import re
+import tarfile
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from src.jobs.deadline import budget, check_deadline
+from src.pdf.fetch_policy import host_slot
+from src.pdf.pdf_extractor import DOWNLOAD_TIMEOUT, extract_github_links
+
+ARXIV_SOURCE_URL = os.getenv("AUTOAGENT_ARXIV_SOURCE_URL", "https://export.arxiv.org/e-print/{arxiv_id}")
+ARXIV_HOSTS = ("arxiv.org", "www.arxiv.org", "export.arxiv.org")
+MAX_SOURCE_BYTES = 50 * 1024 * 1024      # compressed archive; larger ones are faster as PDF
+MAX_UNPACKED_BYTES = 250 * 1024 * 1024   # guards against decompression bombs
+MAX_TEX_FILE_BYTES = 5 * 1024 * 1024
+SOURCE_SUFFIXES = (".tex", ".bbl")
+MAX_INPUT_DEPTH = 8
+CHUNK_SIZE = 64 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+
+# 2301.01234v2 or hep-th/9901001 / math.GT/0309136
+_ARXIV_ID = re.compile(r"(\d{4}\.\d{4,5}(?:v\d+)?|[a-z-]+(?:\.[A-Z]{2})?/\d{7}(?:v\d+)?)")
+_ARXIV_PATH = re.compile(r"^/(?:abs|pdf|e-print|src|html)/(?P<id>.+?)(?:\.pdf)?/?$")
+
+
+class SourceUnavailable(Exception):
+    """The paper's LaTeX source can't be used; read the PDF instead."""
+    pass
+
+
+def arxiv_id_from_url(url: str) -> Optional[str]:
+    """
+    https://arxiv.org/abs/2203.14090v2      -> 2203.14090v2
+    https://arxiv.org/pdf/hep-th/9901001    -> hep-th/9901001
+    Anything that isn't an arXiv paper URL  -> None
+    """
+    parts = urlsplit(url.strip())
+    if (parts.hostname or "").lower() not in ARXIV_HOSTS:
+        return None
+    match = _ARXIV_PATH.match(parts.path)
+    if not match or not _ARXIV_ID.fullmatch(match.group("id")):
+        return None
+    return match.group("id")
+
+
+# ------------------------------------------------------------
+# Streaming the archive
+# ------------------------------------------------------------
+class _Stream:
+    """Read-only file object over a byte source, with peek(), a size cap and an optional hash."""
+
+    def __init__(self, raw: BinaryIO, max_bytes: int, hashed: bool = False):
+        self.raw = raw
+        self.max_bytes = max_bytes
+        self.consumed = 0
+        self.sha = hashlib.sha256() if hashed else None
+        self._buffer = b""
+
+    def _pull(self, size: int) -> bytes:
+        check_deadline()
+        chunk = self.raw.read(size)
+        self.consumed += len(chunk)
+        if self.consumed > self.max_bytes:
+            raise SourceUnavailable(f"source archive exceeds {self.max_bytes} bytes")
+        if self.sha is not None:
+            self.sha.update(chunk)
+        return chunk
+
+    def peek(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            chunk = self._pull(max(size - len(self._buffer), CHUNK_SIZE))
+            if not chunk:
+                break
+            self._buffer += chunk
+        return self._buffer[:size]
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            parts = [self._buffer]
+            self._buffer = b""
+            while True:
+                chunk = self._pull(CHUNK_SIZE)
+                if not chunk:
+                    return b"".join(parts)
+                parts.append(chunk)
+        if len(self._buffer) < size:
+            self._buffer += self._pull(size - len(self._buffer))
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def drain(self) -> None:
+        # Read to the end so the hash covers the whole archive
+        while self._pull(CHUNK_SIZE):
+            pass
+
+
+def read_source_archive(fileobj: BinaryIO, max_bytes: int = MAX_SOURCE_BYTES) -> Tuple[Dict[str, str], str]:
+    """
+    Read the .tex/.bbl files out of an arXiv e-print, front to back.
+
+    arXiv serves a gzipped tar, a single gzipped .tex, or (PDF-only
+    submissions) the PDF itself. Returns ({member name: text}, sha256).
+    """
+    outer = _Stream(fileobj, max_bytes, hashed=True)
+    stream = outer
+    if outer.peek(2) == GZIP_MAGIC:
+        stream = _Stream(gzip.GzipFile(fileobj=outer, mode="rb"), MAX_UNPACKED_BYTES)
+
+    try:
+        head = stream.peek(512)
+    except (OSError, EOFError) as e:   # corrupt gzip
+        raise SourceUnavailable(f"unreadable source archive: {e}")
+    if head.startswith(b"%PDF"):
+        raise SourceUnavailable("no LaTeX source (PDF-only submission)")
+
+    files: Dict[str, str] = {}
+    try:
+        if head[257:262] == b"ustar":
+            # Stream mode: members are read in order, nothing is seeked or written
+            with tarfile.open(fileobj=stream, mode="r|") as tar:
+                for member in tar:
+                    if not (member.isfile() and member.name.lower().endswith(SOURCE_SUFFIXES)):
+                        continue
+                    if member.size > MAX_TEX_FILE_BYTES:
+                        print(f"[ARXIV] Skipping {member.name} ({member.size} bytes)")
+                        continue
+                    files[posixpath.normpath(member.name)] = _decode(tar.extractfile(member).read())
+        elif b"\\" in head:
+            files["main.tex"] = _decode(stream.read(MAX_TEX_FILE_BYTES))
+        else:
+            raise SourceUnavailable("source is neither a tar archive nor a .tex file")
+    except (tarfile.TarError, OSError, EOFError) as e:
+        raise SourceUnavailable(f"unreadable source archive: {e}")
+
+    outer.drain()
+    if not files:
+        raise SourceUnavailable("source archive contains no .tex files")
+    return files, outer.sha.hexdigest()
+
+
+def _decode(data: bytes) -> str:
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")   # older sources; never fails
+
+
+def fetch_arxiv_source(arxiv_id: str, session: Optional[requests.Session] = None) -> Dict:
+    """
+    Stream the e-print of `arxiv_id` through read_source_archive().
+
+    Returns paper_from_source() plus {"arxiv_id", "sha256", "size"}.
+    Raises SourceUnavailable (HTTP errors included).
+    """
+    url = ARXIV_SOURCE_URL.format(arxiv_id=arxiv_id)
+    print(f"[ARXIV] Streaming LaTeX source: {url}")
+    try:
+        with host_slot(url), (session or requests).get(url, stream=True, timeout=budget(DOWNLOAD_TIMEOUT)) as response:
+            if response.status_code != 200:
+                raise SourceUnavailable(f"HTTP {response.status_code} for {url}")
+            if response.headers.get("Content-Type", "").startswith("application/pdf"):
+                raise SourceUnavailable("no LaTeX source (PDF-only submission)")
+            declared = response.headers.get("Content-Length")
+            if declared and declared.isdigit() and int(declared) > MAX_SOURCE_BYTES:
+                raise SourceUnavailable(f"source archive is {declared} bytes, limit is {MAX_SOURCE_BYTES}")
+            # Undo any transport encoding; the archive's own gzip is sniffed from the bytes
+            response.raw.decode_content = True
+            files, sha256 = read_source_archive(response.raw)
+            size = int(declared) if declared and declared.isdigit() else None
+    except requests.RequestException as e:
+        raise SourceUnavailable(f"download failed: {e}")
+
+    paper = paper_from_source(files)
+    print(f"[ARXIV] Read {len(files)} source file(s): {len(paper['github_links'])} GitHub link(s)")
+    return {**paper, "arxiv_id": arxiv_id, "sha256": sha256, "size": size}
+
+
+def read_local_source(path: str) -> Dict:
+    """paper_from_source() for an e-print archive or a .tex file on disk."""
+    with open(path, "rb") as f:
+        files, sha256 = read_source_archive(f, max_bytes=os.path.getsize(path))
+    return {**paper_from_source(files), "sha256": sha256, "size": os.path.getsize(path)}
+
+
+# ------------------------------------------------------------
+# LaTeX → text
+# ------------------------------------------------------------
+_COMMENT = re.compile(r"(?<!\\)%.*")
+_INPUT = re.compile(r"\\(?:input|include|subfile)\s*\{([^}]+)\}")
+_ABSTRACT_ENV = re.compile(r"\\begin\{abstract\}(.*?)\\end\{abstract\}", re.S)
+_HREF = re.compile(r"\\href\s*\{([^}]*)\}\s*\{([^}]*)\}")
+_URL = re.compile(r"\\(?:url|nolinkurl)\s*\{([^}]*)\}")
+# Commands whose arguments are keys or layout, not prose
+_DROPPED = re.compile(
+    r"\\(?:label|ref|eqref|autoref|cref|Cref|cite[a-zA-Z]*|includegraphics|bibliography|bibliographystyle"
+    r"|vspace|hspace|footnotemark|email|affiliation)\*?"
+    r"(?:\[[^\]]*\])*(?:\{[^{}]*\})*"
+)
+_ENVIRONMENT = re.compile(r"\\(?:begin|end)\s*\{[^}]*\}")
+_MACRO_DEFINITION = re.compile(r"\\(?:newcommand|renewcommand|providecommand|def)\*?\s*\{?\\([a-zA-Z@]+)\}?\s*\{")
+_COMMAND = re.compile(r"\\[a-zA-Z@]+\*?(?:\[[^\]]*\])?")
+_ESCAPES = [("\\_", "_"), ("\\%", "%"), ("\\&", "&"), ("\\#", "#"), ("\\$", "$"),
+            ("\\{", "("), ("\\}", ")"), ("\\\\", " "), ("~", " ")]
+
+
+def _closing_brace(tex: str, start: int) -> Optional[int]:
+    """Index of the `}` closing the group that starts at tex[start] (just after its `{`)."""
+    depth = 1
+    for i in range(start, len(tex)):
+        if tex[i] == "{" and tex[i - 1] != "\\":
+            depth += 1
+        elif tex[i] == "}" and tex[i - 1] != "\\":
+            depth -= 1
+            if depth == 0:
+                return i
+    return None
+
+
+def _find_command(tex: str, command: str, start: int = 0) -> Optional[Tuple[int, int, str]]:
+    """(start, end, argument) of the next \\command[...]{...}, nested braces included."""
+    match = re.compile(r"\\" + command + r"\s*(?:\[[^\]]*\])?\s*\{").search(tex, start)
+    if not match:
+        return None
+    close = _closing_brace(tex, match.end())
+    if close is None:
+        return None
+    return match.start(), close + 1, tex[match.end():close]
+
+
+def _braced_argument(tex: str, command: str) -> Optional[str]:
+    found = _find_command(tex, command)
+    return found[2] if found else None
+
+
+def _pop_commands(tex: str, command: str) -> Tuple[str, List[str]]:
+    """`tex` without any \\command{...}, and the removed arguments."""
+    arguments, position = [], 0
+    while True:
+        found = _find_command(tex, command, position)
+        if not found:
+            return tex, arguments
+        start, end, argument = found
+        arguments.append(argument)
+        tex, position = tex[:start] + " " + tex[end:], start
+
+
+def _expand_macros(document: str) -> str:
+    """
+    Inline argument-free \\newcommand / \\def macros that mention GitHub, so
+    a repository URL defined once in the preamble (\\newcommand{\\code}{\\url{...}})
+    shows up where the body uses it. Other macros are left alone.
+    """
+    macros = {}
+    for match in _MACRO_DEFINITION.finditer(document):
+        close = _closing_brace(document, match.end())
+        if close is not None and "github" in document[match.end():close].lower():
+            macros[match.group(1)] = document[match.end():close]
+    if not macros:
+        return document
+    usage = re.compile(r"\\(" + "|".join(re.escape(name) for name in macros) + r")(?![a-zA-Z@])")
+    for _ in range(3):   # macros defined in terms of other macros
+        document, count = usage.subn(lambda m: macros[m.group(1)], document)
+        if not count:
+            break
+    return document
+
+
+def latex_to_text(tex: str) -> str:
+    """Rough plain text: prose and URLs survive, markup, keys and layout don't."""
+    text = _HREF.sub(lambda m: f"{m.group(2)} ({m.group(1)})", tex)
+    text = _URL.sub(lambda m: m.group(1), text)
+    text = _DROPPED.sub(" ", text)
+    for escaped, plain in _ESCAPES:
+        text = text.replace(escaped, plain)
+    text = _ENVIRONMENT.sub(" ", text)
+    text = _COMMAND.sub(" ", text)
+    text = text.replace("{", "").replace("}", "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _main_file(files: Dict[str, str]) -> Optional[str]:
+    candidates = [name for name, tex in files.items() if "\\documentclass" in tex and name.endswith(".tex")]
+    # Prefer the one with a body; supplementary files sometimes have their own \documentclass
+    candidates.sort(key=lambda name: ("\\begin{document}" not in files[name], name.count("/"), name))
+    return candidates[0] if candidates else None
+
+
+def _resolve_inputs(name: str, files: Dict[str, str], used: set, depth: int = 0) -> str:
+    used.add(name)
+    folder = posixpath.dirname(name)
+
+    def inline(match) -> str:
+        target = match.group(1).strip()
+        for candidate in (target, target + ".tex", posixpath.join(folder, target),
+                          posixpath.join(folder, target + ".tex")):
+            candidate = posixpath.normpath(candidate)
+            if candidate in files and candidate not in used and depth < MAX_INPUT_DEPTH:
+                return _resolve_inputs(candidate, files, used, depth + 1)
+        return " "
+
+    return _INPUT.sub(inline, files[name])
+
+
+def paper_from_source(files: Dict[str, str]) -> Dict:
+    """
+    Plain text of the paper in document order, with its title, abstract and
+    GitHub links. The text starts with "<title> Abstract <abstract>", like
+    the PDF path, so PaperIndex finds the front matter.
+
+    Returns {"text", "title", "abstract", "github_links", "source_files"}
+    """
+    files = {name: _COMMENT.sub("", tex) for name, tex in files.items()}
+    main = _main_file(files)
+    used: set = set()
+    document = _resolve_inputs(main, files, used) if main else ""
+    # Files that aren't \input (the .bbl, appendices in odd layouts) go after the body
+    rest = [files[name] for name in sorted(files) if name not in used]
+    document = _expand_macros("\n".join([document] + rest))
+
+    # Title footnotes often hold the code link: keep them in the text, not in the title
+    title_tex, notes = _pop_commands(_braced_argument(document, "title") or "", "thanks")
+    abstract_match = _ABSTRACT_ENV.search(document)
+    abstract_tex = abstract_match.group(1) if abstract_match else (_braced_argument(document, "abstract") or "")
+
+    begin = document.find("\\begin{document}")
+    body = document[begin + len("\\begin{document}"):] if begin >= 0 else document
+    body = _ABSTRACT_ENV.sub(" ", body)
+
+    title, abstract = latex_to_text(title_tex), latex_to_text(abstract_tex)
+    parts: List[str] = [title] if title else []
+    if abstract:
+        parts.append(f"Abstract {abstract}")
+    parts.append(latex_to_text(body))
+    parts.extend(latex_to_text(note) for note in notes)
+    text = " ".join(parts)
+    return {
+        "text": text,
+        "title": title,
+        "abstract": abstract,
+        "github_links": extract_github_links(text),
+        "source_files": len(files),
+    }
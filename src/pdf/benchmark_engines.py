@@ -0,0 +1,93 @@
+"""
+benchmark_engines.py
+---------------------
+Micro-benchmark of the PDF extraction engines.
+
+For every PDF in the corpus folder (default: ./test_papers) and every
+available engine it measures:
+- extraction time and throughput (MB/s)
+- GitHub link recall, relative to the union of links all engines found
+
+Usage:
+    python -m src.pdf.benchmark_engines [corpus_dir] [--repeat N]
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Set
+
+from src.pdf.extraction_engines import ENGINES
+from src.pdf.pdf_extractor import extract_github_links
+
+DEFAULT_CORPUS = "test_papers"
+
+
+def _links(text: str) -> Set[str]:
+    # extract_github_links prints progress; keep the benchmark table readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        return set(extract_github_links(re.sub(r"\s+", " ", text)))
+
+
+def run_benchmark(pdf_paths: List[str], repeat: int = 1) -> Dict[str, Dict[str, float]]:
+    engines = [engine for engine in ENGINES.values() if engine.available()]
+    found: Dict[str, Dict[str, Set[str]]] = {engine.name: {} for engine in engines}
+    stats = {engine.name: {"seconds": 0.0, "bytes": 0, "failures": 0} for engine in engines}
+
+    for path in pdf_paths:
+        size = os.path.getsize(path)
+        for engine in engines:
+            try:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    text = engine.extract(path)
+                elapsed = (time.perf_counter() - start) / repeat
+            except Exception as e:
+                print(f"[BENCH] {engine.name} failed on {os.path.basename(path)}: {e}")
+                stats[engine.name]["failures"] += 1
+                found[engine.name][path] = set()
+                continue
+            stats[engine.name]["seconds"] += elapsed
+            stats[engine.name]["bytes"] += size
+            found[engine.name][path] = _links(text)
+
+    # Recall against the union of links found by any engine
+    for engine in engines:
+        hits, total = 0, 0
+        for path in pdf_paths:
+            union = set().union(*(found[name].get(path, set()) for name in found))
+            total += len(union)
+            hits += len(found[engine.name].get(path, set()) & union)
+        s = stats[engine.name]
+        s["mb_per_s"] = (s["bytes"] / 1e6) / s["seconds"] if s["seconds"] else 0.0
+        s["link_recall"] = hits / total if total else 1.0
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF extraction engines")
+    parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS, help="folder with .pdf files")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per file per engine")
+    args = parser.parse_args()
+
+    pdf_paths = sorted(glob.glob(os.path.join(args.corpus, "**", "*.pdf"), recursive=True))
+    if not pdf_paths:
+        print(f"No PDFs found in {args.corpus}")
+        sys.exit(1)
+
+    print(f"[BENCH] {len(pdf_paths)} PDFs, repeat={args.repeat}")
+    stats = run_benchmark(pdf_paths, repeat=args.repeat)
+
+    print(f"\n{'engine':<12}{'seconds':>10}{'MB/s':>10}{'recall':>10}{'failures':>10}")
+    for name, s in sorted(stats.items(), key=lambda item: item[1]["seconds"]):
+        print(f"{name:<12}{s['seconds']:>10.2f}{s['mb_per_s']:>10.2f}{s['link_recall']:>10.2%}{s['failures']:>10}")
+
+
+if __name__ == "__main__":
+    main()
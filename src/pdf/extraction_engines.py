@@ -0,0 +1,202 @@
+"""
+extraction_engines.py
+----------------------
+Pluggable PDF → text backends.
+
+Engines:
+- pdfminer   — layout-accurate, slow on large documents
+- pypdf      — pure Python, much faster, rougher layout
+- pdftotext  — poppler CLI via subprocess (only if installed), fastest
+
+Selection is per task:
+- "links" → any engine is good enough, fastest first
+- "text"  → accurate engines first, fast ones only as fallback
+
+If an engine raises or returns empty text, the next engine is tried.
+Measured throughput is kept per engine so "fastest first" follows what
+this machine actually does, not a guess.
+
+Heavy libraries are imported inside the engines, so importing this
+module stays cheap.
+"""
+
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from src.jobs.deadline import check_deadline, run_subprocess
+
+TASK_LINKS = "links"
+TASK_TEXT = "text"
+
+PDFTOTEXT_TIMEOUT = 60  # seconds
+
+
+class ExtractionEngine:
+    """Base class for a text-extraction backend."""
+
+    name = "base"
+    accurate = False  # True if layout/reading order is reliable
+
+    def available(self) -> bool:
+        return True
+
+    def extract(self, pdf_path: str) -> str:
+        raise NotImplementedError
+
+
+class PdfminerEngine(ExtractionEngine):
+    name = "pdfminer"
+    accurate = True
+
+    def available(self) -> bool:
+        try:
+            import pdfminer  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def extract(self, pdf_path: str) -> str:
+        # Page by page (same text as pdfminer's extract_text) so a job deadline can stop it between pages
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+
+        pages = []
+        for page in extract_pages(pdf_path):
+            check_deadline()
+            pages.append("".join(element.get_text() for element in page if isinstance(element, LTTextContainer)))
+        return "\f".join(pages)
+
+
+class PypdfEngine(ExtractionEngine):
+    name = "pypdf"
+
+    def available(self) -> bool:
+        try:
+            import pypdf  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def extract(self, pdf_path: str) -> str:
+        from pypdf import PdfReader
+        reader = PdfReader(pdf_path)
+        pages = []
+        for page in reader.pages:
+            check_deadline()
+            pages.append(page.extract_text() or "")
+        # Form feed between pages, like pdftotext and pdfminer
+        return "\f".join(pages)
+
+
+class PdftotextEngine(ExtractionEngine):
+    name = "pdftotext"
+
+    def available(self) -> bool:
+        return shutil.which("pdftotext") is not None
+
+    def extract(self, pdf_path: str) -> str:
+        # "-" writes to stdout; -q silences poppler warnings on damaged files
+        result = run_subprocess(
+            ["pdftotext", "-q", "-enc", "UTF-8", pdf_path, "-"],
+            timeout=PDFTOTEXT_TIMEOUT,
+            text=False,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"pdftotext exited with code {result.returncode}")
+        return result.stdout.decode("utf-8", errors="ignore")
+
+
+ENGINES: Dict[str, ExtractionEngine] = {
+    engine.name: engine for engine in (PdftotextEngine(), PypdfEngine(), PdfminerEngine())
+}
+
+# ------------------------------------------------------------
+# Throughput tracking (bytes of PDF processed per second)
+# ------------------------------------------------------------
+_throughput: Dict[str, float] = {}
+_throughput_lock = threading.Lock()
+_EWMA_ALPHA = 0.3
+
+
+def _record_throughput(name: str, num_bytes: int, seconds: float) -> None:
+    if seconds <= 0:
+        return
+    rate = num_bytes / seconds
+    with _throughput_lock:
+        previous = _throughput.get(name)
+        _throughput[name] = rate if previous is None else (1 - _EWMA_ALPHA) * previous + _EWMA_ALPHA * rate
+
+
+def throughput_stats() -> Dict[str, float]:
+    """Measured throughput per engine in bytes/second."""
+    with _throughput_lock:
+        return dict(_throughput)
+
+
+def engine_order(task: str = TASK_TEXT) -> List[ExtractionEngine]:
+    """
+    Return available engines in the order they should be tried for `task`.
+
+    Task fitness decides first: fast engines lead for "links", accurate
+    ones for "text". Within one group, measured throughput decides once
+    every engine of the group has been measured; until then the default
+    order (pdftotext, pypdf, pdfminer) holds.
+    """
+    if task not in (TASK_LINKS, TASK_TEXT):
+        raise ValueError(f"Unknown extraction task '{task}'")
+
+    default_rank = {name: i for i, name in enumerate(ENGINES)}
+    measured = throughput_stats()
+    candidates = [engine for engine in ENGINES.values() if engine.available()]
+
+    def rank_group(group: List[ExtractionEngine]) -> List[ExtractionEngine]:
+        if group and all(engine.name in measured for engine in group):
+            return sorted(group, key=lambda engine: (-measured[engine.name], default_rank[engine.name]))
+        return sorted(group, key=lambda engine: default_rank[engine.name])
+
+    accurate = rank_group([e for e in candidates if e.accurate])
+    fast = rank_group([e for e in candidates if not e.accurate])
+    # The other group stays as fallbacks
+    return accurate + fast if task == TASK_TEXT else fast + accurate
+
+
+def extract_with_fallback(pdf_path: str, task: str = TASK_TEXT,
+                          engines: Optional[List[str]] = None) -> Tuple[str, str]:
+    """
+    Extract text with the best engine for `task`, falling back on errors.
+
+    Returns:
+        (raw_text, engine_name)
+    Raises:
+        ValueError if `engines` names an unknown engine.
+        RuntimeError if every engine failed.
+    """
+    order = engine_order(task)
+    if engines is not None:
+        unknown = [name for name in engines if name not in ENGINES]
+        if unknown:
+            raise ValueError(f"Unknown extraction engine(s) {', '.join(unknown)}; "
+                             f"choose from {', '.join(ENGINES)}")
+        order = [ENGINES[name] for name in engines if ENGINES[name].available()]
+
+    size = os.path.getsize(pdf_path)
+    errors = []
+    for engine in order:
+        start = time.perf_counter()
+        try:
+            text = engine.extract(pdf_path)
+        except Exception as e:
+            errors.append(f"{engine.name}: {e}")
+            print(f"[PDF] Engine '{engine.name}' failed ({e}); trying next engine.")
+            continue
+        _record_throughput(engine.name, size, time.perf_counter() - start)
+
+        if text and text.strip():
+            return text, engine.name
+        errors.append(f"{engine.name}: empty text")
+        print(f"[PDF] Engine '{engine.name}' returned no text; trying next engine.")
+
+    raise RuntimeError("All extraction engines failed: " + "; ".join(errors or ["no engine available"]))
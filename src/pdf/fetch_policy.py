@@ -0,0 +1,179 @@
+"""
+fetch_policy.py
+----------------
+Where paper downloads go, and how hard one host may be hit.
+
+Responsibilities:
+- normalize_paper_url(): landing pages → direct PDF URLs (arXiv abs/ →
+  pdf/, OpenReview forum → pdf), so every spelling of a paper downloads
+  the same file and a batch queues it once
+- host_slot() / host_slot_async(): per-host politeness for every
+  download in this process, on threads and on event loops alike: at
+  most `concurrency` transfers to one host at a time, and at least
+  `min_interval` seconds between their starts
+- interleave_by_host(): order a batch round-robin across hosts, so a run
+  of arXiv URLs doesn't park every worker on arXiv's limit
+
+fetch_pdf() / fetch_pdf_async() and the arXiv source download apply
+these; batch submission (Coordinator.submit_many) normalizes and
+interleaves before queueing. Limits are per process: each worker node
+is polite on its own.
+"""
+
+import asyncio
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Iterable, List
+from urllib.parse import parse_qs, urlsplit
+
+from src.jobs.deadline import budget, check_deadline
+
+# Per-host politeness: parallel downloads and minimum seconds between request starts
+DEFAULT_HOST_LIMIT = {"concurrency": 4, "min_interval": 0.0}
+HOST_LIMITS: Dict[str, Dict[str, float]] = {
+    "arxiv.org": {"concurrency": 2, "min_interval": 1.0},
+    "export.arxiv.org": {"concurrency": 2, "min_interval": 1.0},
+    "pdfs.semanticscholar.org": {"concurrency": 2, "min_interval": 0.5},
+    "www.semanticscholar.org": {"concurrency": 2, "min_interval": 0.5},
+    "openreview.net": {"concurrency": 2, "min_interval": 0.5},
+}
+
+_ARXIV_HOSTS = ("arxiv.org", "www.arxiv.org", "export.arxiv.org")
+_ARXIV_PAGE = re.compile(r"^/(?:abs|pdf)/(?P<id>.+?)(?:\.pdf)?/?$")
+
+
+def normalize_paper_url(url: str) -> str:
+    """
+    https://arxiv.org/abs/2203.14090v2        -> https://arxiv.org/pdf/2203.14090v2
+    https://openreview.net/forum?id=XYZ       -> https://openreview.net/pdf?id=XYZ
+    Anything else is returned unchanged (apart from surrounding whitespace).
+    """
+    url = url.strip()
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+
+    if host in _ARXIV_HOSTS:
+        match = _ARXIV_PAGE.match(parts.path)
+        if match:
+            return f"https://arxiv.org/pdf/{match.group('id')}"
+
+    if host == "openreview.net" and parts.path == "/forum":
+        paper_id = parse_qs(parts.query).get("id", [""])[0]
+        if paper_id:
+            return f"https://openreview.net/pdf?id={paper_id}"
+
+    return url
+
+
+def host_of(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower()
+
+
+def _limit_for(host: str) -> Dict[str, float]:
+    return HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT)
+
+
+class _Spacing:
+    """Hands out start times at least `min_interval` apart."""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def wait_for_turn(self) -> float:
+        """Seconds the caller must wait before starting."""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.min_interval
+        return max(0.0, wait)
+
+
+# Spacing is shared by threads and loops; concurrency needs one primitive per kind
+_spacings: Dict[str, _Spacing] = {}
+_thread_slots: Dict[str, threading.BoundedSemaphore] = {}
+_loop_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = \
+    weakref.WeakKeyDictionary()
+_registry_lock = threading.Lock()
+
+
+def _spacing(host: str) -> _Spacing:
+    with _registry_lock:
+        if host not in _spacings:
+            _spacings[host] = _Spacing(_limit_for(host)["min_interval"])
+        return _spacings[host]
+
+
+def _thread_slot(host: str) -> threading.BoundedSemaphore:
+    with _registry_lock:
+        if host not in _thread_slots:
+            _thread_slots[host] = threading.BoundedSemaphore(max(1, int(_limit_for(host)["concurrency"])))
+        return _thread_slots[host]
+
+
+def _loop_slot(host: str) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    with _registry_lock:
+        slots = _loop_slots.setdefault(loop, {})
+        if host not in slots:
+            slots[host] = asyncio.Semaphore(max(1, int(_limit_for(host)["concurrency"])))
+        return slots[host]
+
+
+@contextmanager
+def host_slot(url: str):
+    """Hold one of the host's download slots (blocking), within the job's deadline."""
+    host = host_of(url)
+    slot = _thread_slot(host)
+    timeout = budget(None)
+    if not slot.acquire(timeout=timeout):
+        check_deadline()
+        raise TimeoutError(f"No download slot for {host}")
+    try:
+        wait = _spacing(host).wait_for_turn()
+        if wait:
+            time.sleep(budget(wait))
+            check_deadline()
+        yield
+    finally:
+        slot.release()
+
+
+@asynccontextmanager
+async def host_slot_async(url: str):
+    """host_slot() for coroutines: waits on the loop instead of blocking a thread."""
+    host = host_of(url)
+    slot = _loop_slot(host)
+    try:
+        await asyncio.wait_for(slot.acquire(), budget(None))
+    except asyncio.TimeoutError:
+        check_deadline()
+        raise
+    try:
+        wait = _spacing(host).wait_for_turn()
+        if wait:
+            await asyncio.sleep(budget(wait))
+            check_deadline()
+        yield
+    finally:
+        slot.release()
+
+
+def interleave_by_host(urls: Iterable[str]) -> List[str]:
+    """Round-robin `urls` across their hosts, keeping each host's own order."""
+    by_host: "OrderedDict[str, List[str]]" = OrderedDict()
+    for url in urls:
+        by_host.setdefault(host_of(url), []).append(url)
+
+    interleaved = []
+    while by_host:
+        for host in list(by_host):
+            interleaved.append(by_host[host].pop(0))
+            if not by_host[host]:
+                del by_host[host]
+    return interleaved
@@ -0,0 +1,139 @@
+"""
+paper_index.py
+---------------
+Sentence-level index over a paper's extracted text.
+
+Responsibilities:
+- Split the cleaned text into sentences with their character spans
+- Map any character offset to its page and sentence (binary search)
+- Guess the title and pull out the abstract
+- Locate every GitHub link (offset + page) and build a compact context
+  window of whole sentences around it, within a token budget
+
+Used by the repository-selection prompt, so the model sees where each
+link is mentioned instead of a fixed prefix of the paper.
+"""
+
+import re
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from src.llm.tokens import estimate_tokens, truncate_to_tokens
+from src.pdf.pdf_extractor import find_github_link_offsets
+
+TITLE_TOKENS = 40
+ABSTRACT_TOKENS = 250
+LINK_WINDOW_TOKENS = 120
+
+# End of a sentence: . ! ? followed by whitespace and something that can start a sentence
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\[(\"'])")
+_ABSTRACT_START = re.compile(r"\bAbstract\b[\s.:—-]*", re.I)
+_ABSTRACT_END = re.compile(
+    r"\b(?:1\.?\s+Introduction|I\.\s+Introduction|Introduction\b|Keywords\b|Index Terms\b|CCS Concepts\b)",
+    re.I,
+)
+
+
+class PaperIndex:
+
+    def __init__(self, text: str, page_starts: Optional[List[int]] = None):
+        self.text = text
+        self.page_starts = page_starts or [0]
+        self.sentences: List[Tuple[int, int]] = []
+        start = 0
+        for match in _SENTENCE_END.finditer(text):
+            self.sentences.append((start, match.start()))
+            start = match.end()
+        if start < len(text):
+            self.sentences.append((start, len(text)))
+        self._sentence_starts = [s for s, _ in self.sentences]
+        self._link_offsets: Optional[Dict[str, List[int]]] = None
+
+    @property
+    def link_offsets(self) -> Dict[str, List[int]]:
+        if self._link_offsets is None:
+            self._link_offsets = find_github_link_offsets(self.text)
+        return self._link_offsets
+
+    # ------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------
+    def page_of(self, offset: int) -> int:
+        """1-based page number of a character offset."""
+        return max(1, bisect_right(self.page_starts, offset))
+
+    def sentence_index(self, offset: int) -> int:
+        return max(0, bisect_right(self._sentence_starts, offset) - 1)
+
+    def sentence(self, i: int) -> str:
+        start, end = self.sentences[i]
+        return self.text[start:end]
+
+    # ------------------------------------------------------------
+    # Front matter
+    # ------------------------------------------------------------
+    def abstract(self, max_tokens: int = ABSTRACT_TOKENS) -> str:
+        match = _ABSTRACT_START.search(self.text, 0, 20000)
+        if not match:
+            return ""
+        end = _ABSTRACT_END.search(self.text, match.end(), match.end() + 6000)
+        abstract = self.text[match.end():end.start() if end else match.end() + 3000].strip()
+        return truncate_to_tokens(abstract, max_tokens)
+
+    def title(self, max_tokens: int = TITLE_TOKENS) -> str:
+        """
+        Best guess: the text before the abstract, or the first sentence.
+        Author lists usually follow the title, so this is only a hint.
+        """
+        match = _ABSTRACT_START.search(self.text, 0, 20000)
+        head = self.text[:match.start()] if match and match.start() > 0 else (
+            self.sentence(0) if self.sentences else "")
+        return truncate_to_tokens(head.strip(), max_tokens)
+
+    # ------------------------------------------------------------
+    # Links
+    # ------------------------------------------------------------
+    def window(self, offset: int, max_tokens: int = LINK_WINDOW_TOKENS) -> str:
+        """Whole sentences around `offset`, grown alternately backwards and forwards."""
+        center = self.sentence_index(offset)
+        low = high = center
+        used = estimate_tokens(self.sentence(center))
+        if used > max_tokens:
+            # A very long "sentence" (tables, reference lists): cut around the link
+            start = max(self.sentences[center][0], offset - max_tokens * 2)
+            return self.text[start:start + max_tokens * 4].strip()
+
+        grew = True
+        while grew:
+            grew = False
+            for candidate in (low - 1, high + 1):
+                if 0 <= candidate < len(self.sentences):
+                    cost = estimate_tokens(self.sentence(candidate))
+                    if used + cost <= max_tokens:
+                        used += cost
+                        low, high = min(low, candidate), max(high, candidate)
+                        grew = True
+        return self.text[self.sentences[low][0]:self.sentences[high][1]].strip()
+
+    def link_locations(self) -> List[Dict]:
+        """[{"url", "offsets", "pages"}] for every GitHub link, in order of first mention."""
+        return [
+            {"url": url, "offsets": offsets, "pages": sorted({self.page_of(o) for o in offsets})}
+            for url, offsets in self.link_offsets.items()
+        ]
+
+    def link_context(self, url: str, max_tokens: int = LINK_WINDOW_TOKENS) -> Dict:
+        """Context around the first mention of `url` (found by its owner/repo part if needed)."""
+        offsets = self.link_offsets.get(url)
+        if not offsets:
+            path = url.split("github.com/", 1)[-1]
+            position = self.text.find(path)
+            offsets = [position] if position >= 0 else []
+        if not offsets:
+            return {"url": url, "mentions": 0, "page": None, "window": ""}
+        return {
+            "url": url,
+            "mentions": len(offsets),
+            "page": self.page_of(offsets[0]),
+            "window": self.window(offsets[0], max_tokens),
+        }
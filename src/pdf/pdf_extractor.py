@@ -1,9 +1,17 @@
+import asyncio
 import os
 import tempfile
+import hashlib
+import contextvars
+from contextlib import contextmanager
 import requests
-from pdfminer.high_level import extract_text
 import re
-from typing import List
+from typing import Dict, List, Optional
+
+from src.pdf.extraction_engines import TASK_LINKS, TASK_TEXT, extract_with_fallback
+from src.jobs.async_runtime import async_http_available, http_session, run_blocking
+from src.jobs.deadline import budget, check_deadline
+from src.pdf.fetch_policy import host_slot, host_slot_async, normalize_paper_url
 
 """
 pdf_extractor.py
@@ -11,9 +19,16 @@ pdf_extractor.py
 Responsible ONLY for handling PDF document operations.
 
 Functions:
-- download_pdf(url) — saves to /tmp and returns file path
-- extract_text(pdf_path) — returns raw text from the PDF
+- fetch_pdf(url) — streams the PDF to /tmp, returns path + sha256 + size
+  (landing-page URLs normalized and per-host limits applied, see fetch_policy.py)
+- fetch_pdf_async(url) — same for run_pipeline_async() (aiohttp)
+- download_pdf(url) — same, but returns only the file path
+- temp_file_scope() — deletes every downloaded temp file when the job ends
+- extract_text_local(pdf_path, task) — returns raw text from the PDF
+  (engine chosen per task, see extraction_engines.py)
+- extract_text_with_pages(pdf_path, task) — same text + where each page starts
 - extract_github_links(pdf_text) — regex scan for GitHub URLs
+- find_github_link_offsets(pdf_text) — every mention of each link, with offsets
 
 This module does NOT:
 - Call any LLMs
@@ -23,51 +38,311 @@ This module does NOT:
 Its role is strictly PDF → text → GitHub links.
 """
 
-def download_pdf(url: str) -> str:
-    """Download the PDF from the URL and return the local path."""
+DOWNLOAD_TIMEOUT = 20                  # seconds (connect / between bytes)
+MAX_PDF_BYTES = 100 * 1024 * 1024      # refuse anything bigger than 100 MB
+CHUNK_SIZE = 64 * 1024
+MAX_RESUME_ATTEMPTS = 3
+PDF_MAGIC = b"%PDF-"
+# Some servers put a BOM / whitespace before the header; the spec allows 1 KB
+PDF_MAGIC_WINDOW = 1024
+ALLOWED_CONTENT_TYPES = ("application/pdf", "application/x-pdf", "application/octet-stream",
+                         "binary/octet-stream", "application/download")
+
+# Temp files created inside the current temp_file_scope(), and where to create them
+_temp_files: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar("pdf_temp_files", default=None)
+_temp_dir: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("pdf_temp_dir", default=None)
+
+
+class PDFDownloadError(Exception):
+    """Raised when a URL does not yield a usable PDF."""
+    pass
+
+
+@contextmanager
+def temp_file_scope(directory: Optional[str] = None):
     """
-    Download a PDF from the given URL and save it into a temporary file.
-    Returns the local file path.
+    Track every PDF downloaded inside the `with` block and delete them on exit.
+    With `directory`, downloads go there instead of the system temp folder
+    (e.g. the job's scratch space from the workspace manager).
+
+    Usage:
+        with temp_file_scope():
+            path = download_pdf(url)
+            ...
+        # path is gone here
+    """
+    paths: List[str] = []
+    token = _temp_files.set(paths)
+    dir_token = _temp_dir.set(directory or _temp_dir.get())
+    try:
+        yield paths
+    finally:
+        _temp_dir.reset(dir_token)
+        _temp_files.reset(token)
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[PDF] Could not remove temp file {path}: {e}")
+
+
+def fetch_pdf(url: str, max_bytes: int = MAX_PDF_BYTES, session: Optional[requests.Session] = None) -> Dict:
+    """
+    Stream a PDF from the URL straight to a temporary file.
+
+    - chunks are written to disk as they arrive (the file never sits in memory)
+    - sha256 is computed incrementally
+    - downloads larger than max_bytes are aborted
+    - the first bytes must look like a PDF (magic-byte sniffing)
+    - interrupted transfers are resumed with an HTTP Range request
+    - arXiv abs/ and OpenReview forum URLs are fetched as their PDFs, and
+      the host's politeness limits apply (fetch_policy.py)
+
+    Pass a shared requests.Session to reuse keep-alive connections.
+
+    Returns:
+        {"path", "sha256", "size", "content_type"}
+    Raises:
+        PDFDownloadError (or requests exceptions for HTTP errors)
     """
 
+    url = normalize_paper_url(url)
     print(f"[PDF] Downloading: {url}")
 
-    # 1. Download raw HTTP content
-    response = requests.get(url, timeout=20)
-    response.raise_for_status()# catchers errors
+    # 1. Create a temporary file path (registered for cleanup if inside a scope)
+    tmp_path = _new_temp_file()
+    try:
+        with host_slot(url):
+            info = _stream_to_file(url, tmp_path, max_bytes, session or requests)
+    except BaseException:   # includes DeadlineExceeded
+        _discard_temp_file(tmp_path)
+        raise
 
-    # 2. Create a temporary file path
-    fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
-    os.close(fd)   # Close file descriptor, we will write manually
+    print(f"[PDF] Saved to {tmp_path} ({info['size']} bytes, sha256 {info['sha256'][:12]}…)")
+    return {"path": tmp_path, **info}
 
-    # 3. Write binary PDF bytes
-    with open(tmp_path, "wb") as f:
-        f.write(response.content)
 
-    print(f"[PDF] Saved to {tmp_path}")
+async def fetch_pdf_async(url: str, max_bytes: int = MAX_PDF_BYTES) -> Dict:
+    """
+    fetch_pdf() for coroutines: same checks, resume and result, but the
+    transfer runs on the event loop (aiohttp) instead of blocking a thread.
+    Without aiohttp the blocking fetch_pdf() runs on the shared pool.
+    """
+    if not async_http_available():
+        return await run_blocking(fetch_pdf, url, max_bytes)
+
+    url = normalize_paper_url(url)
+    print(f"[PDF] Downloading: {url}")
+    tmp_path = _new_temp_file()
+    try:
+        async with host_slot_async(url):
+            info = await _stream_to_file_async(url, tmp_path, max_bytes)
+    except BaseException:   # includes DeadlineExceeded and task cancellation
+        _discard_temp_file(tmp_path)
+        raise
+
+    print(f"[PDF] Saved to {tmp_path} ({info['size']} bytes, sha256 {info['sha256'][:12]}…)")
+    return {"path": tmp_path, **info}
+
+
+def _new_temp_file() -> str:
+    fd, tmp_path = tempfile.mkstemp(suffix=".pdf", dir=_temp_dir.get())
+    os.close(fd)   # Close file descriptor, we will write manually
+    scope = _temp_files.get()
+    if scope is not None:
+        scope.append(tmp_path)
     return tmp_path
 
-def extract_text_local(pdf_path: str) -> str:
+
+def _discard_temp_file(path: str) -> None:
+    # Never leave half-downloaded files behind (a scope deletes its own files on exit)
+    if _temp_files.get() is None and os.path.exists(path):
+        os.remove(path)
+
+
+def download_pdf(url: str) -> str:
+    """Download the PDF from the URL and return the local path."""
+    """
+    Download a PDF from the given URL and save it into a temporary file.
+    Returns the local file path.
+    """
+    return fetch_pdf(url)["path"]
+
+
+class _PDFSink:
+    """Validates, hashes and writes streamed bytes (shared by the sync and async downloaders)."""
+
+    def __init__(self, f, max_bytes: int):
+        self.f = f
+        self.max_bytes = max_bytes
+        self.content_type = ""
+        self.attempts = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self.f.seek(0)
+        self.f.truncate()
+        self.sha = hashlib.sha256()
+        self.written = 0
+        self.head = b""
+
+    def range_headers(self) -> Dict:
+        return {"Range": f"bytes={self.written}-"} if self.written else {}
+
+    def start(self, status_code: int, headers) -> None:
+        if self.written and status_code != 206:
+            # Server ignored the Range header: start over
+            self._reset()
+
+        if not self.written:
+            self.content_type = headers.get("Content-Type", "").split(";")[0].strip().lower()
+            _check_content_type(self.content_type)
+            declared = headers.get("Content-Length")
+            if declared and declared.isdigit() and int(declared) > self.max_bytes:
+                raise PDFDownloadError(f"PDF is {declared} bytes, limit is {self.max_bytes}")
+
+    def add(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        check_deadline()
+        self.written += len(chunk)
+        if self.written > self.max_bytes:
+            raise PDFDownloadError(f"PDF exceeds the {self.max_bytes} byte limit")
+
+        if len(self.head) < PDF_MAGIC_WINDOW:
+            self.head += chunk[:PDF_MAGIC_WINDOW - len(self.head)]
+            if len(self.head) >= PDF_MAGIC_WINDOW and PDF_MAGIC not in self.head:
+                raise PDFDownloadError("Downloaded content is not a PDF (missing %PDF- header)")
+
+        self.sha.update(chunk)
+        self.f.write(chunk)
+
+    def interrupted(self, error: BaseException) -> None:
+        self.attempts += 1
+        if self.attempts > MAX_RESUME_ATTEMPTS:
+            raise PDFDownloadError(f"Download interrupted {self.attempts} times: {error}")
+        print(f"[PDF] Transfer interrupted at {self.written} bytes ({error}); resuming...")
+
+    def finish(self) -> Dict:
+        if PDF_MAGIC not in self.head:
+            raise PDFDownloadError("Downloaded content is not a PDF (missing %PDF- header)")
+        return {"sha256": self.sha.hexdigest(), "size": self.written, "content_type": self.content_type}
+
+
+def _stream_to_file(url: str, path: str, max_bytes: int, http) -> Dict:
+    with open(path, "wb") as f:
+        sink = _PDFSink(f, max_bytes)
+        while True:
+            try:
+                with http.get(url, headers=sink.range_headers(), stream=True,
+                              timeout=budget(DOWNLOAD_TIMEOUT)) as response:
+                    response.raise_for_status()# catchers errors
+                    sink.start(response.status_code, response.headers)
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        sink.add(chunk)
+                break
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as e:
+                sink.interrupted(e)
+
+        return sink.finish()
+
+
+async def _stream_to_file_async(url: str, path: str, max_bytes: int) -> Dict:
+    import aiohttp
+
+    with open(path, "wb") as f:
+        sink = _PDFSink(f, max_bytes)
+        while True:
+            # Like requests' timeout: per connect and per read, not for the whole transfer
+            timeout = budget(DOWNLOAD_TIMEOUT)
+            client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+            try:
+                async with http_session().get(url, headers=sink.range_headers(), timeout=client_timeout) as response:
+                    response.raise_for_status()
+                    sink.start(response.status, response.headers)
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        sink.add(chunk)
+                break
+
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                sink.interrupted(e)
+
+        return sink.finish()
+
+
+def _check_content_type(content_type: str) -> None:
+    # Missing / generic types are allowed; the magic bytes have the final word
+    if not content_type or content_type in ALLOWED_CONTENT_TYPES:
+        return
+    if content_type.startswith("text/html"):
+        raise PDFDownloadError("URL returned an HTML page, not a PDF (paywall or landing page?)")
+    print(f"[PDF] Unexpected Content-Type '{content_type}', checking magic bytes.")
+
+def extract_text_local(pdf_path: str, task: str = TASK_TEXT) -> str:
     """Return all readable text from the PDF."""
     """
-    Extract raw text from a PDF file using pdfminer.
+    Extract raw text from a PDF file.
+    task="text"  → layout-accurate engine (pdfminer) first
+    task="links" → fastest available engine first (pdftotext / pypdf)
     Returns the extracted text as a clean string.
     """
+    return extract_text_with_pages(pdf_path, task)["text"]
+
+
+def extract_text_with_pages(pdf_path: str, task: str = TASK_TEXT) -> Dict:
+    """
+    Like extract_text_local(), but also returns the character offset at
+    which each page starts in the cleaned text:
+        {"text": str, "page_starts": [0, 3127, ...], "engine": str}
+    """
 
     print(f"[PDF] Extracting text from: {pdf_path}")
 
     try:
-        # 1. Let pdfminer do the extraction
-        raw_text = extract_text(pdf_path)
+        # 1. Let the best engine for this task do the extraction
+        raw_text, engine = extract_with_fallback(pdf_path, task)
 
     except Exception as e:
         raise RuntimeError(f"Failed to extract text from PDF: {e}")
 
-    # 2. Clean whitespace (optional but improves analysis)
-    cleaned = re.sub(r"\s+", " ", raw_text).strip()
+    # 2. Clean whitespace page by page (engines separate pages with a form feed)
+    pages, page_starts, offset = [], [], 0
+    for page in raw_text.split("\f"):
+        page_starts.append(offset)
+        page = re.sub(r"\s+", " ", page).strip()
+        if page:
+            pages.append(page)
+            offset += len(page) + 1
+    cleaned = " ".join(pages)
+
+    # Trailing form feed (pdftotext ends with one) leaves an empty last page
+    while len(page_starts) > 1 and page_starts[-1] >= len(cleaned):
+        page_starts.pop()
+
+    print(f"[PDF] Extracted {len(cleaned)} characters ({len(page_starts)} pages) with {engine}")
+    return {"text": cleaned, "page_starts": page_starts, "engine": engine}
+
+GITHUB_LINK_PATTERN = re.compile(
+    r"(https?://github\.com/[A-Za-z0-9_.-]+/[A-Za-z0-9_.-]+|github\.com/[A-Za-z0-9_.-]+/[A-Za-z0-9_.-]+)"
+)
+
+
+def _iter_github_matches(text: str):
+    """(normalized url, start, end) for every GitHub link in the text."""
+    for match in GITHUB_LINK_PATTERN.finditer(text):
+        m = match.group(0)
+        # add https:// if missing
+        if m.startswith("github.com"):
+            m = "https://" + m
+
+        # remove trailing punctuation
+        m = m.rstrip(".,);")
+        yield m, match.start(), match.end()
 
-    print(f"[PDF] Extracted {len(cleaned)} characters")
-    return cleaned
 
 def extract_github_links(text: str) -> list[str]:
     """Return all GitHub links found inside the PDF text."""
@@ -82,27 +357,12 @@ def extract_github_links(text: str) -> list[str]:
     #    - https://github.com/user/repo
     #    - http://github.com/user/repo
     #    - github.com/user/repo
+    cleaned = [url for url, _, _ in _iter_github_matches(text)]
 
-    
-    pattern = r"(https?://github\.com/[A-Za-z0-9_.-]+/[A-Za-z0-9_.-]+|github\.com/[A-Za-z0-9_.-]+/[A-Za-z0-9_.-]+)"
-    #crazy regular expression given by chatgpt lol
-    matches = re.findall(pattern, text)
-
-    if not matches:
+    if not cleaned:
         print("[GITHUB] No GitHub links detected.")
         return []
 
-    cleaned = []
-    for m in matches:
-        # add https:// if missing
-        if m.startswith("github.com"):
-            m = "https://" + m
-
-        # remove trailing punctuation
-        m = m.rstrip(".,);")
-
-        cleaned.append(m)
-
     # Remove duplicates while preserving order
     seen = set()
     unique = []
@@ -114,6 +374,14 @@ def extract_github_links(text: str) -> list[str]:
     print(f"[GITHUB] Found {len(unique)} repositories.")
     return unique
 
+
+def find_github_link_offsets(text: str) -> Dict[str, List[int]]:
+    """Character offsets of every mention of each GitHub link, in order of first mention."""
+    offsets: Dict[str, List[int]] = {}
+    for url, start, _ in _iter_github_matches(text):
+        offsets.setdefault(url, []).append(start)
+    return offsets
+
 #everything basically
 def get_github_links_from_pdf(paper_url: str) -> list[str]:
     """High-level function: download, extract text, extract links."""
@@ -127,17 +395,18 @@ def get_github_links_from_pdf(paper_url: str) -> list[str]:
     print("[PIPELINE] Starting GitHub link extraction from PDF...")
     print(f"[PIPELINE] Paper URL: {paper_url}")
 
-    # Step 1 — Download the PDF
-    pdf_path = download_pdf(paper_url)
-    if pdf_path is None:
-        print("[ERROR] Could not download PDF.")
-        return []
-
-    # Step 2 — Extract text
-    text = extract_text_local(pdf_path)
-    if not text.strip():
-        print("[ERROR] PDF text extraction returned empty content.")
-        return []
+    # Step 1 — Download the PDF (deleted again once the text is extracted)
+    with temp_file_scope():
+        pdf_path = download_pdf(paper_url)
+        if pdf_path is None:
+            print("[ERROR] Could not download PDF.")
+            return []
+
+        # Step 2 — Extract text (link discovery doesn't need accurate layout)
+        text = extract_text_local(pdf_path, task=TASK_LINKS)
+        if not text.strip():
+            print("[ERROR] PDF text extraction returned empty content.")
+            return []
 
     # Step 3 — Extract GitHub links
     github_links = extract_github_links(text)
@@ -9,9 +9,13 @@ document.addEventListener('DOMContentLoaded', () => {
     // Output elements
     const repoLink = document.getElementById('repoLink');
     const pipelineStatus = document.getElementById('pipelineStatus');
-    const scanSummary = document.getElementById('scanSummary');
     const demoCode = document.getElementById('demoCode');
     const copyBtn = document.getElementById('copyBtn');
+    const artifactSections = document.querySelectorAll('details.artifact');
+
+    // Artifact URLs of the current job (the API only returns a summary)
+    let artifacts = {};
+    const loaded = {};
 
     runBtn.addEventListener('click', async () => {
         const url = pdfUrlInput.value.trim();
@@ -57,6 +61,56 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Fetch an artifact once, the first time it is needed
+    async function loadArtifact(name) {
+        if (!(name in loaded)) {
+            const artifact = artifacts[name];
+            if (!artifact) {
+                loaded[name] = Promise.resolve(null);
+            } else {
+                loaded[name] = fetch(artifact.url).then(response => {
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    return response.text();
+                });
+            }
+        }
+        return loaded[name];
+    }
+
+    function formatSize(bytes) {
+        if (bytes >= 1024 * 1024) return `${(bytes / 1024 / 1024).toFixed(1)} MB`;
+        if (bytes >= 1024) return `${(bytes / 1024).toFixed(1)} KB`;
+        return `${bytes} B`;
+    }
+
+    const emptyText = {
+        scan_report: 'No scan data available.',
+        demo_code: '# No demo code generated.',
+        stdout: '(no output)',
+        stderr: '(no errors)',
+    };
+
+    artifactSections.forEach(section => {
+        section.addEventListener('toggle', async () => {
+            if (!section.open) return;
+            const name = section.dataset.artifact;
+            const target = document.getElementById(section.dataset.target);
+            if (target.dataset.filled) return;
+            target.textContent = 'Loading...';
+            try {
+                let text = await loadArtifact(name);
+                if (text && name === 'scan_report') {
+                    text = JSON.stringify(JSON.parse(text), null, 2);
+                }
+                target.textContent = text || emptyText[name];
+                target.dataset.filled = '1';
+            } catch (err) {
+                delete loaded[name];
+                target.textContent = `Could not load ${name}: ${err.message}`;
+            }
+        });
+    });
+
     function displayResults(data) {
         // 1. Repo Link
         repoLink.href = data.best_repo_url || '#';
@@ -67,8 +121,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
         // 3. Evaluation Score
         const evalScore = document.getElementById('evaluationScore');
-        if (data.evaluation && data.evaluation.evaluation_results) {
-            const score = data.evaluation.evaluation_results.total_score;
+        if (data.evaluation && data.evaluation.total_score != null) {
+            const score = data.evaluation.total_score;
             evalScore.textContent = `${score} / 10`;
             
             // Color coding
@@ -80,19 +134,24 @@ document.addEventListener('DOMContentLoaded', () => {
             evalScore.style.color = '#6b7280';
         }
 
-        // 3. Scan Summary (Pretty Print JSON)
-        if (data.scan_report) {
-            scanSummary.textContent = JSON.stringify(data.scan_report, null, 2);
-        } else {
-            scanSummary.textContent = "No scan data available.";
-        }
-
-        // 4. Demo Code
-        if (data.demo_code) {
-            demoCode.textContent = data.demo_code;
-        } else {
-            demoCode.textContent = "# No demo code generated.";
-        }
+        // 4. Scan report, demo code and logs: fetched when their section is opened
+        artifacts = data.artifacts || {};
+        Object.keys(loaded).forEach(name => delete loaded[name]);
+        artifactSections.forEach(section => {
+            const name = section.dataset.artifact;
+            const heading = section.querySelector('h3');
+            heading.querySelectorAll('.artifact-size').forEach(el => el.remove());
+            if (artifacts[name]) {
+                const size = document.createElement('span');
+                size.className = 'artifact-size';
+                size.textContent = formatSize(artifacts[name].bytes);
+                heading.appendChild(size);
+            }
+            const target = document.getElementById(section.dataset.target);
+            target.textContent = artifacts[name] ? '' : emptyText[name];
+            delete target.dataset.filled;
+            section.open = false;
+        });
 
         // Show container
         resultsContainer.classList.remove('hidden');
@@ -102,8 +161,11 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     // Copy functionality
-    copyBtn.addEventListener('click', () => {
-        navigator.clipboard.writeText(demoCode.textContent).then(() => {
+    copyBtn.addEventListener('click', async (event) => {
+        // The button sits in the section header: don't toggle the section
+        event.preventDefault();
+        const code = await loadArtifact('demo_code').catch(() => null);
+        navigator.clipboard.writeText(code || demoCode.textContent).then(() => {
             const originalText = copyBtn.textContent;
             copyBtn.textContent = 'Copied!';
             setTimeout(() => {